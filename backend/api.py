@@ -1,10 +1,17 @@
-import requests
 import json
 import time
 import os
 
+from http_client import get_session, open_download
+
+# DashScope 接口地址，可指向本地的替身服务 (dashscope_stub.py) 离线调试
+DASHSCOPE_BASE_URL = os.environ.get("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/api/v1").rstrip("/")
+
+# 任务的终止状态，其余 (PENDING / RUNNING) 需要继续查询
+DASHSCOPE_FINAL_STATUSES = ("SUCCEEDED", "FAILED", "CANCELED", "UNKNOWN")
+
 def generate_image(prompt, api_key, model="wanx2.1-t2i-turbo", size="1024*1024", n=1):
-    url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text2image/image-synthesis"
+    url = f"{DASHSCOPE_BASE_URL}/services/aigc/text2image/image-synthesis"
     
     headers = {
         "X-DashScope-Async": "enable",
@@ -23,7 +30,7 @@ def generate_image(prompt, api_key, model="wanx2.1-t2i-turbo", size="1024*1024",
         }
     }
     
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = get_session().post(url, headers=headers, data=json.dumps(payload))
     
     if response.status_code == 200:
         return response.json()
@@ -31,13 +38,13 @@ def generate_image(prompt, api_key, model="wanx2.1-t2i-turbo", size="1024*1024",
         raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
 
 def check_task_status(task_id, api_key):
-    url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
+    url = f"{DASHSCOPE_BASE_URL}/tasks/{task_id}"
     
     headers = {
         "Authorization": f"Bearer {api_key}"
     }
     
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers)
     
     if response.status_code == 200:
         return response.json()
@@ -45,13 +52,11 @@ def check_task_status(task_id, api_key):
         raise Exception(f"Task status check failed with status code {response.status_code}: {response.text}")
 
 def save_image_from_url(image_url, save_path):
-    response = requests.get(image_url)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-        print(f"图片已保存到: {save_path}")
-    else:
-        raise Exception(f"图片下载失败: {response.status_code}")
+    response, chunks = open_download(image_url)
+    with response, open(save_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    print(f"图片已保存到: {save_path}")
 
 # 独立运行时的主函数
 def main():
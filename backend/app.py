@@ -1,24 +1,49 @@
 import os
 from flask_cors import CORS
-from flask import Flask, request, jsonify, session
+from flask import Flask, Request, request, jsonify, session, g, Response, stream_with_context
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
 import oss2
 from PIL import Image as PILImage
 import io
-from img2img import convert_image_to_ascii_art, DEFAULT_ASCII_OPTIONS
-from video2video import main as video2video_main
-from video2video_color import main as video2video_color_main
+from img2img import convert_image_to_ascii_art, convert_image_to_ascii_art_tiled, convert_image_to_ascii_text, convert_images_to_ascii_art, estimate_output_size, output_file_type, DEFAULT_ASCII_OPTIONS, TILED_OUTPUT_PIXELS, ImageTooLargeError
+from ascii_formats import TEXT_OUTPUT_FORMATS
+from utils import warm_registry
+from timing import stage, start_request_timing, finish_request_timing, server_timing_header, histogram_snapshot
+from result_cache import ResultCache, content_hash, result_cache_key, original_cache_key
+from video_engine import convert_video, VIDEO_OUTPUT_FORMATS
+from ffmpeg_writer import remux_hls_to_mp4
+from hls_publisher import HlsPublisher, empty_playlist, HLS_PLAYLIST_FILENAME, HLS_PLAYLIST_CONTENT_TYPE
+from video_jobs import video_job_id, open_video_job, remove_video_job, collect_video_jobs
+from job_queue import JobWorkerPool, JobHeartbeat
 from api import generate_image, check_task_status
-import requests
-import time
+from http_client import open_download
+from dashscope_tracker import DashScopeTaskTracker
 import tempfile
-import argparse
+import mimetypes
+import zipfile
+import json
+import shutil
+import socket
+from concurrent.futures import ThreadPoolExecutor
+import time
+import threading
+
+# 解析 multipart 上传时，文件超过这么多字节就写入 UPLOAD_SPOOL_DIR 下的临时文件
+# Werkzeug 默认已经把超过 500KB 的上传写入系统临时目录；这里的子类只是为了让目录和阈值可以配置
+# (例如把大视频放到容量更大的磁盘)。它只影响请求解析阶段，图片接口随后仍会把文件整体读入内存
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.environ.get('UPLOAD_SPOOL_MEMORY_BYTES', 512 * 1024))
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+
+class _SpoolingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MEMORY_BYTES, mode='rb+', dir=UPLOAD_SPOOL_DIR)
 
 app = Flask(__name__)
+app.request_class = _SpoolingRequest
 
 # 配置 CORS，允许 localhost:5173 访问，支持凭据
 
@@ -29,6 +54,9 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-very-secure-and-lo
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'
+# 单个请求体的大小上限 (MB)，未设置时不限制
+if os.environ.get('MAX_UPLOAD_MB'):
+    app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ['MAX_UPLOAD_MB']) * 1024 * 1024)
 CORS(app, supports_credentials=True, resources={
     r"/*": {
         "origins": ["http://localhost:5173"],
@@ -54,6 +82,63 @@ else:
     bucket = None
     app.logger.warning("OSS 配置不完整，图片和视频上传功能可能受限。")
 
+# 大文件分片上传: 超过阈值的文件按 OSS_PART_SIZE 分片，由 OSS_UPLOAD_THREADS 个线程并发上传 (分片大小不小于 100KB)
+OSS_MULTIPART_THRESHOLD = int(float(os.environ.get('OSS_MULTIPART_THRESHOLD_MB', 20)) * 1024 * 1024)
+OSS_PART_SIZE = max(100 * 1024, int(float(os.environ.get('OSS_PART_SIZE_MB', 8)) * 1024 * 1024))
+OSS_UPLOAD_THREADS = int(os.environ.get('OSS_UPLOAD_THREADS', 4))
+OSS_UPLOAD_RETRIES = int(os.environ.get('OSS_UPLOAD_RETRIES', 3))
+# 分片上传的进度记录目录，需在进程重启后保留
+OSS_RESUMABLE_DIR = os.environ.get('OSS_RESUMABLE_DIR', os.path.join(tempfile.gettempdir(), 'artiscope_oss_uploads'))
+
+# 视频处理任务队列: 任务保存在 video_process_jobs 表中，由后台工作线程领取执行
+# ASCII_VIDEO_JOB_WORKERS 为每个 Web 进程的工作线程数，设为 0 时只入队，由 video_worker.py 单独执行
+VIDEO_JOB_WORKERS = int(os.environ.get('ASCII_VIDEO_JOB_WORKERS', 1))
+# 执行中的任务每隔这么多秒写入一次进度和心跳
+VIDEO_JOB_HEARTBEAT_SECONDS = float(os.environ.get('ASCII_VIDEO_JOB_HEARTBEAT_SECONDS', 5))
+# 超过这么多秒没有心跳的任务视为执行它的进程已经退出，重新入队；中断次数达到上限后标记为失败
+VIDEO_JOB_STALE_SECONDS = float(os.environ.get('ASCII_VIDEO_JOB_STALE_SECONDS', 120))
+VIDEO_JOB_MAX_ATTEMPTS = int(os.environ.get('ASCII_VIDEO_JOB_MAX_ATTEMPTS', 3))
+# 入队的输入视频保存目录，任务结束后删除 (多实例部署时需为共享存储)
+VIDEO_SPOOL_DIR = os.environ.get('ASCII_VIDEO_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'artiscope_video_inputs'))
+VIDEO_JOB_WORKER_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+# 文生图任务的 SSE 事件流在没有状态变化时每隔这么多秒发送一次保活并重新读取状态
+TEXT_TO_IMAGE_SSE_REFRESH_SECONDS = float(os.environ.get('TEXT_TO_IMAGE_SSE_REFRESH_SECONDS', 15))
+TEXT_TO_IMAGE_FINAL_STATUSES = ('succeeded', 'failed')
+# 保存结果 (下载图片、上传 OSS) 超过这么多秒仍未结束的任务视为领取它的进程已经退出，重新查询状态后再次保存
+TEXT_TO_IMAGE_SAVE_TIMEOUT_SECONDS = float(os.environ.get('TEXT_TO_IMAGE_SAVE_TIMEOUT_SECONDS', 300))
+
+# 预热常用的字符集/字体组合，避免首个请求承担字体解析和字符排序的开销
+WARM_CHARSETS = [
+    (DEFAULT_ASCII_OPTIONS["language"], DEFAULT_ASCII_OPTIONS["mode"]),
+    ("english", "standard"),
+]
+warmed_charsets = warm_registry(WARM_CHARSETS)
+app.logger.info(f"已预热字符集: {warmed_charsets}")
+
+# 在 Server-Timing 响应头中返回各阶段耗时 (需同时开启 ASCII_TIMING)
+SERVER_TIMING_HEADER = os.environ.get('ASCII_SERVER_TIMING', '0') == '1'
+
+# 请求级的阶段计时: 未开启 ASCII_TIMING 时两个钩子都不做任何事
+@app.before_request
+def _start_request_timing():
+    g.timing_token = start_request_timing()
+
+@app.after_request
+def _finish_request_timing(response):
+    timings = finish_request_timing(g.pop('timing_token', None))
+    if timings:
+        app.logger.info(json.dumps({
+            "event": "request_timing",
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "stages": [{"name": name, "ms": round(elapsed_ms, 2)} for name, elapsed_ms in timings]
+        }, ensure_ascii=False))
+        if SERVER_TIMING_HEADER:
+            response.headers['Server-Timing'] = server_timing_header(timings)
+    return response
+
 # 登录验证装饰器
 def login_required(f):
     @wraps(f)
@@ -105,6 +190,23 @@ class UserImageProcess(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# 图片转换结果缓存 (共享缓存层)，键为输入内容哈希 + 规范化的转换选项
+class ImageResultCacheEntry(db.Model):
+    __tablename__ = 'image_result_cache'
+    cache_key = db.Column(db.String(128), primary_key=True)
+    original_oss_url = db.Column(db.String(1024), nullable=False)
+    output_oss_url = db.Column(db.String(1024), nullable=True)
+    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f'<ImageResultCacheEntry {self.cache_key}>'
+
+    def to_dict(self):
+        return {
+            'original_oss_url': self.original_oss_url,
+            'output_oss_url': self.output_oss_url
+        }
+
 class UserVideoProcess(db.Model):
     __tablename__ = 'user_video_processes'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -131,6 +233,56 @@ class UserVideoProcess(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class VideoProcessJob(db.Model):
+    __tablename__ = 'video_process_jobs'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    username = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Float, nullable=False, default=0)
+    output_format = db.Column(db.String(16), nullable=False)
+    options = db.Column(db.Text, nullable=False)
+    original_filename = db.Column(db.String(255), nullable=False)
+    original_content_type = db.Column(db.String(100), nullable=True)
+    input_path = db.Column(db.String(1024), nullable=False)
+    input_token = db.Column(db.String(512), nullable=True)
+    input_oss_url = db.Column(db.String(1024), nullable=True)
+    output_oss_key = db.Column(db.String(1024), nullable=False)
+    output_oss_url = db.Column(db.String(1024), nullable=True)
+    playlist_url = db.Column(db.String(1024), nullable=True)
+    process_log_id = db.Column(db.Integer, nullable=True)
+    conversion_stats = db.Column(db.Text, nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f'<VideoProcessJob {self.id} ({self.status}) for user {self.username}>'
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': round(self.progress or 0, 1),
+            'output_format': self.output_format,
+            'original_filename': self.original_filename,
+            'input_oss_url': self.input_oss_url,
+            'processed_video_url': self.output_oss_url,
+            'playlist_url': self.playlist_url,
+            'process_log_id': self.process_log_id,
+            'conversion_stats': json.loads(self.conversion_stats) if self.conversion_stats else None,
+            'error_message': self.error_message,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class TextToImageGeneration(db.Model):
     __tablename__ = 'text_to_image_generations'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -153,6 +305,36 @@ class TextToImageGeneration(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class TextToImageTask(db.Model):
+    __tablename__ = 'text_to_image_tasks'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    dashscope_task_id = db.Column(db.String(100), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='pending', index=True)
+    generation_id = db.Column(db.Integer, nullable=True)
+    generated_image_oss_url = db.Column(db.String(1024), nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    updated_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f'<TextToImageTask {self.id} ({self.status}) for user {self.user_id}>'
+
+    def to_dict(self):
+        return {
+            'task_id': self.id,
+            'status': self.status,
+            'prompt': self.prompt,
+            'generation_id': self.generation_id,
+            'generated_image_oss_url': self.generated_image_oss_url,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 # OSS 操作辅助函数
 def _generate_oss_key(user_id, original_filename, type_prefix="", is_video=False):
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
@@ -160,11 +342,46 @@ def _generate_oss_key(user_id, original_filename, type_prefix="", is_video=False
     folder = "videos" if is_video else "images"
     return f"{folder}/user_{user_id}/{timestamp}_{type_prefix}{safe_filename}"
 
-def _upload_to_oss_and_get_url(oss_bucket, object_key, data_stream, content_type):
-    data_stream.seek(0)
-    result = oss_bucket.put_object(object_key, data_stream, headers={'Content-Type': content_type})
+def _oss_url(object_key):
+    return f"https://{str(OSS_BUCKET_NAME)}.{str(OSS_ENDPOINT)}/{object_key}"
+
+# 磁盘上的文件 (有路径的文件对象) 超过阈值时以分片方式并发上传；其余的用一次 put_object 上传
+def _multipart_upload_path(data_stream):
+    path = getattr(data_stream, 'name', None)
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return None
+    return path if os.path.getsize(path) >= OSS_MULTIPART_THRESHOLD else None
+
+# 断点续传的分片上传: 已上传的分片记录在 OSS_RESUMABLE_DIR 中，网络错误或服务端错误时重试只上传剩余的分片，
+# 进程退出后重新执行的任务 (如视频任务重试) 上传同一文件时也会从记录处继续
+def _resumable_upload(oss_bucket, object_key, path, headers):
+    store = oss2.ResumableStore(root=OSS_RESUMABLE_DIR)
+    for attempt in range(OSS_UPLOAD_RETRIES + 1):
+        try:
+            return oss2.resumable_upload(oss_bucket, object_key, path, store=store, headers=headers,
+                                         multipart_threshold=OSS_MULTIPART_THRESHOLD, part_size=OSS_PART_SIZE,
+                                         num_threads=OSS_UPLOAD_THREADS)
+        except oss2.exceptions.OssError as e:
+            retryable = isinstance(e, oss2.exceptions.RequestError) or e.status >= 500
+            if attempt >= OSS_UPLOAD_RETRIES or not retryable:
+                raise
+            app.logger.warning(f"分片上传 {object_key} 失败 (第 {attempt + 1} 次)，继续上传剩余分片: {e}")
+            time.sleep(min(2 ** attempt, 10))
+
+# data_stream 可以是文件对象 (从头上传) 或按块产生数据的迭代器 (以分块编码流式上传)
+def _upload_to_oss_and_get_url(oss_bucket, object_key, data_stream, content_type, cache_control=None):
+    headers = {'Content-Type': content_type}
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    multipart_path = _multipart_upload_path(data_stream)
+    if multipart_path:
+        result = _resumable_upload(oss_bucket, object_key, multipart_path, headers)
+    else:
+        if hasattr(data_stream, 'seek'):
+            data_stream.seek(0)
+        result = oss_bucket.put_object(object_key, data_stream, headers=headers)
     if result.status == 200:
-        return f"https://{str(OSS_BUCKET_NAME)}.{str(OSS_ENDPOINT)}/{object_key}"
+        return _oss_url(object_key)
     else:
         error_msg = f"OSS upload failed for {object_key}. Status: {result.status}"
         try:
@@ -175,6 +392,77 @@ def _upload_to_oss_and_get_url(oss_bucket, object_key, data_stream, content_type
         app.logger.error(error_msg)
         raise Exception(f"OSS upload failed for {object_key}")
 
+# 原图/原视频上传的 I/O 线程池: 上传与转换同时进行，请求耗时约为两者中较长的一个而不是两者之和
+OSS_IO_WORKERS = int(os.environ.get('OSS_IO_WORKERS', 4))
+oss_io_pool = ThreadPoolExecutor(max_workers=OSS_IO_WORKERS, thread_name_prefix="oss-io")
+
+def _upload_file_to_oss_and_get_url(oss_bucket, object_key, path, content_type):
+    with open(path, 'rb') as data_stream:
+        return _upload_to_oss_and_get_url(oss_bucket, object_key, data_stream, content_type)
+
+# 在 I/O 线程池中上传，返回 Future (结果为对象 URL)；data 为字节串或文件路径
+def _start_background_upload(object_key, data, content_type, is_path=False):
+    if is_path:
+        return oss_io_pool.submit(_upload_file_to_oss_and_get_url, bucket, object_key, data, content_type)
+    return oss_io_pool.submit(_upload_to_oss_and_get_url, bucket, object_key, io.BytesIO(data), content_type)
+
+def _delete_oss_object(object_key):
+    try:
+        bucket.delete_object(object_key)
+    except oss2.exceptions.OssError as e:
+        app.logger.warning(f"删除未使用的 OSS 对象 {object_key} 失败: {e}")
+
+# 放弃后台上传 (另一分支失败时调用): 还没开始的直接取消，已经开始的等它结束后删除已上传的对象
+def _discard_background_upload(future, object_key):
+    if future.cancel():
+        return
+    try:
+        future.result()
+    except Exception:
+        return
+    _delete_oss_object(object_key)
+
+# 以数据库表作为共享缓存层，多个工作进程/实例之间共享同一份转换结果
+class _DatabaseResultCacheTier:
+    def get(self, key):
+        entry = db.session.get(ImageResultCacheEntry, key)
+        return entry.to_dict() if entry else None
+
+    def set(self, key, value):
+        try:
+            db.session.merge(ImageResultCacheEntry(cache_key=key, **value))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+# 图片转换结果缓存: 进程内 LRU，ASCII_RESULT_CACHE_SHARED=1 时再启用数据库共享层
+result_cache = ResultCache(
+    shared=_DatabaseResultCacheTier() if os.environ.get('ASCII_RESULT_CACHE_SHARED', '0') == '1' else None
+)
+
+# 从表单中解析图片 ASCII 转换选项
+def _parse_ascii_options_from_form(form):
+    ascii_options_from_form = {}
+    if form.get('ascii_num_cols'):
+        try:
+            num_cols_val = int(form.get('ascii_num_cols'))
+            if 0 < num_cols_val < 1000:
+                ascii_options_from_form['num_cols'] = num_cols_val
+            else:
+                app.logger.warning("提供的 ascii_num_cols 值无效或超出范围，使用默认值。")
+        except ValueError:
+            app.logger.warning("提供的 ascii_num_cols 不是有效整数，使用默认值。")
+    if form.get('ascii_background') in ['black', 'white']:
+        ascii_options_from_form['background'] = form.get('ascii_background')
+    if form.get('ascii_output_format'):
+        output_format = form.get('ascii_output_format').lower()
+        if output_format == 'png' or output_format in TEXT_OUTPUT_FORMATS:
+            ascii_options_from_form['output_format'] = output_format
+        else:
+            app.logger.warning("提供的 ascii_output_format 无效，使用默认的 PNG 输出。")
+    return ascii_options_from_form
+
 # 用户注册
 @app.route('/register', methods=['POST'])
 def register():
@@ -234,6 +522,30 @@ def profile():
     }), 200
 
 # 图片处理路由
+# 写入图片处理记录并生成响应，cached 表示结果来自缓存
+def _log_image_process_result(user_id, username, token, original_oss_url, processed_oss_url, cached=False):
+    new_process_log = UserImageProcess(
+        user_id=user_id,
+        username=username,
+        input_oss_url=original_oss_url,
+        input_token=token,
+        output_oss_url=processed_oss_url
+    )
+    db.session.add(new_process_log)
+    with stage("db_commit"):
+        db.session.commit()
+
+    app.logger.info(f"图片成功转换为ASCII艺术画并记录。日志ID: {new_process_log.id}")
+    return jsonify({
+        "message": "图片处理、上传并记录成功",
+        "log_entry_id": new_process_log.id,
+        "original_image_url": original_oss_url,
+        "processed_image_url": processed_oss_url,
+        "token": token,
+        "cached": cached,
+        "details": new_process_log.to_dict()
+    }), 201
+
 @app.route('/log_image_process', methods=['POST'])
 @login_required
 def log_image_process():
@@ -251,18 +563,7 @@ def log_image_process():
         return jsonify({"message": "未选择任何图片文件"}), 400
 
     token_from_form = request.form.get('token')
-    ascii_options_from_form = {}
-    if request.form.get('ascii_num_cols'):
-        try:
-            num_cols_val = int(request.form.get('ascii_num_cols'))
-            if 0 < num_cols_val < 1000:
-                ascii_options_from_form['num_cols'] = num_cols_val
-            else:
-                app.logger.warning("提供的 ascii_num_cols 值无效或超出范围，使用默认值。")
-        except ValueError:
-            app.logger.warning("提供的 ascii_num_cols 不是有效整数，使用默认值。")
-    if request.form.get('ascii_background') in ['black', 'white']:
-        ascii_options_from_form['background'] = request.form.get('ascii_background')
+    ascii_options_from_form = _parse_ascii_options_from_form(request.form)
 
     user_id = session['user_id']
     username_in_session = session.get('username')
@@ -276,62 +577,273 @@ def log_image_process():
     original_filename = file_storage.filename
 
     try:
-        original_image_bytes_io = io.BytesIO(file_storage.read())
+        with stage("read"):
+            original_image_bytes_io = io.BytesIO(file_storage.read())
         original_content_type = file_storage.content_type
         if not original_content_type or not original_content_type.startswith("image/"):
             app.logger.warning(f"上传文件的 Content-Type 无效: {original_content_type}")
             return jsonify({"message": "上传的文件似乎不是有效的图片格式"}), 400
 
-        original_oss_key = _generate_oss_key(user_id, original_filename, type_prefix="original_")
-        original_image_bytes_io.seek(0)
-        original_oss_url = _upload_to_oss_and_get_url(bucket, original_oss_key, original_image_bytes_io, original_content_type)
-        if not original_oss_url:
-            app.logger.error("上传原始图片到OSS失败。")
-            return jsonify({"message": "上传原始图片到OSS失败"}), 500
-
-        original_image_bytes_io.seek(0)
         current_ascii_options = DEFAULT_ASCII_OPTIONS.copy()
         current_ascii_options.update(ascii_options_from_form)
-        app.logger.info(f"开始ASCII转换，选项: {current_ascii_options}")
-        pil_ascii_art_image = convert_image_to_ascii_art(original_image_bytes_io, options=current_ascii_options)
-
-        if pil_ascii_art_image is None:
-            app.logger.error("图片转换为ASCII艺术画失败 (convert_image_to_ascii_art 返回 None)。")
-            return jsonify({"message": "图片转换为ASCII艺术画失败，请检查图片或服务器日志"}), 500
-
-        processed_ascii_image_bytes_io = io.BytesIO()
-        output_format_for_ascii = 'PNG'
-        pil_ascii_art_image.save(processed_ascii_image_bytes_io, format=output_format_for_ascii)
-        processed_ascii_content_type = f'image/{output_format_for_ascii.lower()}'
-        processed_ascii_image_bytes_io.seek(0)
-
-        base, ext = os.path.splitext(original_filename)
-        ascii_art_filename = f"{base}_ascii.{output_format_for_ascii.lower()}"
-        processed_ascii_oss_key = _generate_oss_key(user_id, ascii_art_filename, type_prefix="processed_ascii_")
-        
-        processed_ascii_oss_url = _upload_to_oss_and_get_url(bucket, processed_ascii_oss_key, processed_ascii_image_bytes_io, processed_ascii_content_type)
-        if not processed_ascii_oss_url:
-            app.logger.error("上传处理后的ASCII图片到OSS失败。")
-            return jsonify({"message": "上传处理后的ASCII图片到OSS失败"}), 500
 
-        new_process_log = UserImageProcess(
-            user_id=user_id,
-            username=username_in_session,
-            input_oss_url=original_oss_url,
-            input_token=token_from_form,
-            output_oss_url=processed_ascii_oss_url
-        )
-        db.session.add(new_process_log)
-        db.session.commit()
+        # 相同内容 + 相同选项的图片直接复用已上传的原图和转换结果
+        image_digest = content_hash(original_image_bytes_io.getvalue())
+        cache_key = result_cache_key(user_id, image_digest, current_ascii_options)
+        cached_result = result_cache.get(cache_key)
+        if cached_result:
+            app.logger.info(f"命中图片转换缓存: {cache_key}")
+            return _log_image_process_result(user_id, username_in_session, token_from_form,
+                                             cached_result['original_oss_url'], cached_result['output_oss_url'], cached=True)
+
+        # 只读取文件头: 决定是否使用分块模式，解码后超过像素上限的图片在上传原图之前拒绝
+        output_size = estimate_output_size(original_image_bytes_io.getvalue(), current_ascii_options)
+
+        # 原图在后台上传，同时进行转换；任一分支失败时放弃另一个: 转换失败时取消原图上传 (已上传的删除)，
+        # 原图上传失败时不再上传转换结果
+        cached_original = result_cache.get(original_cache_key(user_id, image_digest), record=False)
+        original_upload = None
+        if cached_original:
+            original_oss_url = cached_original['original_oss_url']
+        else:
+            original_oss_key = _generate_oss_key(user_id, original_filename, type_prefix="original_")
+            original_upload = _start_background_upload(original_oss_key, original_image_bytes_io.getvalue(), original_content_type)
+
+        completed = False
+        try:
+            app.logger.info(f"开始ASCII转换，选项: {current_ascii_options}")
+            output_extension, processed_ascii_content_type = output_file_type(current_ascii_options['output_format'])
+            if current_ascii_options['output_format'] in TEXT_OUTPUT_FORMATS:
+                # 文本 / ANSI / HTML 直接由字符网格生成，不经过位图渲染
+                ascii_text = convert_image_to_ascii_text(original_image_bytes_io, options=current_ascii_options, output_format=current_ascii_options['output_format'])
+                if ascii_text is None:
+                    app.logger.error("图片转换为ASCII文本失败 (convert_image_to_ascii_text 返回 None)。")
+                    return jsonify({"message": "图片转换为ASCII艺术画失败，请检查图片或服务器日志"}), 500
+                processed_ascii_image_bytes_io = io.BytesIO(ascii_text.encode('utf-8'))
+            elif output_size and output_size[0] * output_size[1] >= TILED_OUTPUT_PIXELS:
+                # 超大输出 (海报、全景图等) 使用分块模式，PNG 逐行写入磁盘临时文件，不在内存中构建整幅画布
+                app.logger.info(f"输出尺寸 {output_size} 较大，使用分块转换模式。")
+                processed_ascii_image_bytes_io = tempfile.TemporaryFile()
+                tiled_result = convert_image_to_ascii_art_tiled(original_image_bytes_io, processed_ascii_image_bytes_io, options=current_ascii_options)
+                if tiled_result is None:
+                    processed_ascii_image_bytes_io.close()
+                    app.logger.error("图片转换为ASCII艺术画失败 (convert_image_to_ascii_art_tiled 返回 None)。")
+                    return jsonify({"message": "图片转换为ASCII艺术画失败，请检查图片或服务器日志"}), 500
+            else:
+                pil_ascii_art_image = convert_image_to_ascii_art(original_image_bytes_io, options=current_ascii_options)
+
+                if pil_ascii_art_image is None:
+                    app.logger.error("图片转换为ASCII艺术画失败 (convert_image_to_ascii_art 返回 None)。")
+                    return jsonify({"message": "图片转换为ASCII艺术画失败，请检查图片或服务器日志"}), 500
+
+                processed_ascii_image_bytes_io = io.BytesIO()
+                with stage("encode"):
+                    pil_ascii_art_image.save(processed_ascii_image_bytes_io, format='PNG')
+            processed_ascii_image_bytes_io.seek(0)
+
+
+            if original_upload is not None:
+                with stage("upload_original"):
+                    try:
+                        original_oss_url = original_upload.result()
+                    except Exception:
+                        processed_ascii_image_bytes_io.close()
+                        raise
+                result_cache.set(original_cache_key(user_id, image_digest), {'original_oss_url': original_oss_url, 'output_oss_url': None})
+                # 原图已经保存，之后的失败不再删除它 (缓存中已引用)
+                original_upload = None
+
+            base, ext = os.path.splitext(original_filename)
+            ascii_art_filename = f"{base}_ascii.{output_extension}"
+            processed_ascii_oss_key = _generate_oss_key(user_id, ascii_art_filename, type_prefix="processed_ascii_")
+            
+            try:
+                with stage("upload_output"):
+                    processed_ascii_oss_url = _upload_to_oss_and_get_url(bucket, processed_ascii_oss_key, processed_ascii_image_bytes_io, processed_ascii_content_type)
+            finally:
+                processed_ascii_image_bytes_io.close()
+            if not processed_ascii_oss_url:
+                app.logger.error("上传处理后的ASCII图片到OSS失败。")
+                return jsonify({"message": "上传处理后的ASCII图片到OSS失败"}), 500
+
+            response = _log_image_process_result(user_id, username_in_session, token_from_form,
+                                                 original_oss_url, processed_ascii_oss_url)
+            result_cache.set(cache_key, {'original_oss_url': original_oss_url, 'output_oss_url': processed_ascii_oss_url})
+            completed = True
+            return response
+        finally:
+            if original_upload is not None and not completed:
+                _discard_background_upload(original_upload, original_oss_key)
+
+    except oss2.exceptions.OssError as oe:
+        db.session.rollback()
+        app.logger.error(f"OSS 操作失败: {oe}", exc_info=True)
+        return jsonify({"message": f"OSS 操作失败: {str(oe)}"}), 500
+    except ImageTooLargeError as e:
+        db.session.rollback()
+        app.logger.warning(f"图片过大，拒绝处理: {e}")
+        return jsonify({"message": str(e)}), 413
+    except FileNotFoundError as fnfe:
+        db.session.rollback()
+        app.logger.error(f"处理所需文件未找到: {fnfe}", exc_info=True)
+        return jsonify({"message": f"服务配置错误，缺少处理所需文件: {str(fnfe)}"}), 503
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"图片处理和记录过程中发生未知错误: {e}", exc_info=True)
+        return jsonify({"message": f"处理图片过程中发生未知错误: {str(e)}"}), 500
+
+# 批量图片处理的数量与压缩包大小上限
+MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', 100))
+MAX_BATCH_ARCHIVE_BYTES = int(os.environ.get('MAX_BATCH_ARCHIVE_BYTES', 512 * 1024 * 1024))
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+# 收集批量上传的图片，zip 压缩包会被展开，返回 [(文件名, 字节串, Content-Type)]
+def _collect_batch_images(file_storages):
+    images = []
+    for file_storage in file_storages:
+        if file_storage.filename == '':
+            continue
+        if file_storage.filename.lower().endswith('.zip') or file_storage.content_type in ZIP_CONTENT_TYPES:
+            # 压缩包直接从上传的临时文件中读取，只解压其中的图片
+            try:
+                archive = zipfile.ZipFile(file_storage.stream)
+            except zipfile.BadZipFile:
+                raise ValueError(f"无法解析压缩包: {file_storage.filename}")
+            with archive:
+                total_size = 0
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    content_type = mimetypes.guess_type(name)[0]
+                    if info.is_dir() or not name or name.startswith('.') or not content_type or not content_type.startswith("image/"):
+                        continue
+                    total_size += info.file_size
+                    if total_size > MAX_BATCH_ARCHIVE_BYTES:
+                        raise ValueError("压缩包解压后体积超出限制")
+                    if len(images) >= MAX_BATCH_IMAGES:
+                        raise ValueError(f"单次最多处理 {MAX_BATCH_IMAGES} 张图片")
+                    images.append((name, archive.read(info), content_type))
+        else:
+            if not file_storage.content_type or not file_storage.content_type.startswith("image/"):
+                raise ValueError(f"上传的文件似乎不是有效的图片格式: {file_storage.filename}")
+            images.append((file_storage.filename, file_storage.read(), file_storage.content_type))
+        if len(images) > MAX_BATCH_IMAGES:
+            raise ValueError(f"单次最多处理 {MAX_BATCH_IMAGES} 张图片")
+    return images
 
-        app.logger.info(f"图片成功转换为ASCII艺术画并记录。日志ID: {new_process_log.id}")
+# 批量图片处理路由: 多文件上传 (字段名 'files') 或 zip 压缩包，转换在进程池中并行进行
+@app.route('/batch_image_process', methods=['POST'])
+@login_required
+def batch_image_process():
+    if not bucket:
+        app.logger.error("OSS 服务未配置或配置错误，无法处理图片。")
+        return jsonify({"message": "OSS 服务未配置或配置错误"}), 503
+
+    file_storages = request.files.getlist('files')
+    if not file_storages:
+        app.logger.warning("请求中未包含图片文件 (字段名应为 'files')")
+        return jsonify({"message": "请求中未包含图片文件 (字段名应为 'files')"}), 400
+
+    token_from_form = request.form.get('token')
+    current_ascii_options = DEFAULT_ASCII_OPTIONS.copy()
+    current_ascii_options.update(_parse_ascii_options_from_form(request.form))
+
+    user_id = session['user_id']
+    username_in_session = session.get('username')
+    if not username_in_session:
+        user = User.query.get(user_id)
+        if not user:
+            app.logger.error(f"用户 ID {user_id} 在会话或数据库中未找到。")
+            return jsonify({"message": "当前会话用户异常"}), 500
+        username_in_session = user.username
+
+    try:
+        images = _collect_batch_images(file_storages)
+    except ValueError as ve:
+        app.logger.warning(f"批量上传的文件无效: {ve}")
+        return jsonify({"message": str(ve)}), 400
+    if not images:
+        return jsonify({"message": "未找到任何可处理的图片文件"}), 400
+
+    try:
+        app.logger.info(f"开始批量ASCII转换，共 {len(images)} 张，选项: {current_ascii_options}")
+        # 只转换未命中缓存的图片，同一批次内重复的图片也只转换一次
+        digests = [content_hash(data) for _, data, _ in images]
+        cache_keys = [result_cache_key(user_id, digest, current_ascii_options) for digest in digests]
+        cached_results = [result_cache.get(key) for key in cache_keys]
+        pending = {}
+        for index, key in enumerate(cache_keys):
+            if cached_results[index] is None and key not in pending:
+                pending[key] = index
+        with stage("convert"):
+            converted = convert_images_to_ascii_art([images[index][1] for index in pending.values()], options=current_ascii_options)
+        converted_by_key = dict(zip(pending, converted))
+
+        results = []
+        new_logs = []
+        output_extension, output_content_type = output_file_type(current_ascii_options['output_format'])
+        # 本批次新上传的原图和结果，数据库记录提交之后再写入缓存
+        new_originals = {}
+        new_results = {}
+        for (filename, data, content_type), digest, key, cached_result in zip(images, digests, cache_keys, cached_results):
+            if cached_result is None:
+                cached_result = new_results.get(key)
+            if cached_result:
+                original_oss_url = cached_result['original_oss_url']
+                processed_oss_url = cached_result['output_oss_url']
+            else:
+                output_bytes = converted_by_key.get(key)
+                if output_bytes is None:
+                    results.append({"filename": filename, "message": "图片转换为ASCII艺术画失败"})
+                    continue
+                original_oss_url = new_originals.get(digest)
+                if not original_oss_url:
+                    cached_original = result_cache.get(original_cache_key(user_id, digest), record=False)
+                    original_oss_url = cached_original['original_oss_url'] if cached_original else None
+                if not original_oss_url:
+                    original_oss_key = _generate_oss_key(user_id, filename, type_prefix="original_")
+                    original_oss_url = _upload_to_oss_and_get_url(bucket, original_oss_key, io.BytesIO(data), content_type)
+                    new_originals[digest] = original_oss_url
+                base, ext = os.path.splitext(filename)
+                processed_oss_key = _generate_oss_key(user_id, f"{base}_ascii.{output_extension}", type_prefix="processed_ascii_")
+                processed_oss_url = _upload_to_oss_and_get_url(bucket, processed_oss_key, io.BytesIO(output_bytes), output_content_type)
+                new_results[key] = {'original_oss_url': original_oss_url, 'output_oss_url': processed_oss_url}
+            new_process_log = UserImageProcess(
+                user_id=user_id,
+                username=username_in_session,
+                input_oss_url=original_oss_url,
+                input_token=token_from_form,
+                output_oss_url=processed_oss_url
+            )
+            db.session.add(new_process_log)
+            new_logs.append(new_process_log)
+            results.append({
+                "filename": filename,
+                "original_image_url": original_oss_url,
+                "processed_image_url": processed_oss_url,
+                "cached": key not in converted_by_key,
+                "log": new_process_log
+            })
+        with stage("db_commit"):
+            db.session.commit()
+        for digest, original_oss_url in new_originals.items():
+            result_cache.set(original_cache_key(user_id, digest), {'original_oss_url': original_oss_url, 'output_oss_url': None})
+        for key, value in new_results.items():
+            result_cache.set(key, value)
+
+        for result in results:
+            if "log" in result:
+                new_process_log = result.pop("log")
+                result["log_entry_id"] = new_process_log.id
+                result["details"] = new_process_log.to_dict()
+        succeeded = len(new_logs)
+        app.logger.info(f"批量转换完成: 成功 {succeeded} 张，失败 {len(images) - succeeded} 张。")
         return jsonify({
-            "message": "图片处理、上传并记录成功",
-            "log_entry_id": new_process_log.id,
-            "original_image_url": original_oss_url,
-            "processed_image_url": processed_ascii_oss_url,
+            "message": "批量图片处理完成",
+            "total": len(images),
+            "succeeded": succeeded,
+            "failed": len(images) - succeeded,
             "token": token_from_form,
-            "details": new_process_log.to_dict()
+            "results": results
         }), 201
 
     except oss2.exceptions.OssError as oe:
@@ -344,8 +856,24 @@ def log_image_process():
         return jsonify({"message": f"服务配置错误，缺少处理所需文件: {str(fnfe)}"}), 503
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"图片处理和记录过程中发生未知错误: {e}", exc_info=True)
-        return jsonify({"message": f"处理图片过程中发生未知错误: {str(e)}"}), 500
+        app.logger.error(f"批量图片处理过程中发生未知错误: {e}", exc_info=True)
+        return jsonify({"message": f"批量处理图片过程中发生未知错误: {str(e)}"}), 500
+
+# 图片转换结果缓存的命中率统计: 统计数据是全局的 (所有用户共用)，只在运维开启 ASCII_CACHE_STATS 时提供
+CACHE_STATS_ENDPOINT = os.environ.get('ASCII_CACHE_STATS', '0') == '1'
+
+@app.route('/image_cache_stats', methods=['GET'])
+@login_required
+def get_image_cache_stats():
+    if not CACHE_STATS_ENDPOINT:
+        return jsonify({"message": "缓存统计未开启"}), 404
+    return jsonify(result_cache.stats()), 200
+
+# 各阶段耗时的聚合直方图 (需开启 ASCII_TIMING)
+@app.route('/timing_stats', methods=['GET'])
+@login_required
+def get_timing_stats():
+    return jsonify(histogram_snapshot()), 200
 
 # 获取图片处理记录
 @app.route('/image_process_logs', methods=['GET'])
@@ -401,6 +929,10 @@ def log_video_process():
         video_options_from_form['background'] = request.form.get('background')
     if request.form.get('mode') in ['simple', 'complex']:
         video_options_from_form['mode'] = request.form.get('mode')
+    if request.form.get('color') in ['true', 'false']:
+        video_options_from_form['color'] = request.form.get('color') == 'true'
+    if request.form.get('output_format') in VIDEO_OUTPUT_FORMATS:
+        video_options_from_form['output_format'] = request.form.get('output_format')
     if request.form.get('scale'):
         try:
             scale_val = int(request.form.get('scale'))
@@ -445,94 +977,306 @@ def log_video_process():
         username_in_session = user.username
     
     original_filename = file_storage.filename
+    original_content_type = file_storage.content_type
+    if not original_content_type or not original_content_type.startswith("video/"):
+        app.logger.warning(f"上传文件的 Content-Type 无效: {original_content_type}")
+        return jsonify({"message": "上传的文件似乎不是有效的视频格式"}), 400
 
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(original_filename)[1]) as temp_input:
-            file_storage.save(temp_input)
-            temp_input_path = temp_input.name
-
-        original_content_type = file_storage.content_type
-        if not original_content_type or not original_content_type.startswith("video/"):
-            os.unlink(temp_input_path)
-            app.logger.warning(f"上传文件的 Content-Type 无效: {original_content_type}")
-            return jsonify({"message": "上传的文件似乎不是有效的视频格式"}), 400
-
-        original_oss_key = _generate_oss_key(user_id, original_filename, type_prefix="original_", is_video=True)
-        with open(temp_input_path, 'rb') as video_file:
-            original_oss_url = _upload_to_oss_and_get_url(bucket, original_oss_key, video_file, original_content_type)
-        if not original_oss_url:
-            os.unlink(temp_input_path)
-            app.logger.error("上传原始视频到OSS失败。")
-            return jsonify({"message": "上传原始视频到OSS失败"}), 500
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_output:
-            temp_output_path = temp_output.name
-
-        video_options = {
-            'input': temp_input_path,
-            'output': temp_output_path,
-            'mode': video_options_from_form.get('mode', 'simple'),
-            'background': video_options_from_form.get('background', 'black'),
-            'num_cols': video_options_from_form.get('num_cols', 100),
-            'scale': video_options_from_form.get('scale', 1),
-            'fps': video_options_from_form.get('fps', 0),
-            'overlay_ratio': video_options_from_form.get('overlay_ratio', 0.2),
-            'codec': 'mp4v'
-        }
-        args = argparse.Namespace(**video_options)
-
-        app.logger.info(f"开始视频处理，选项: {video_options}")
-        if video_options['mode'] == 'complex':
-            video2video_color_main(args)
-        else:
-            video2video_main(args)
+    output_format = video_options_from_form.get('output_format', 'mp4')
+    output_ext, _ = VIDEO_OUTPUT_FORMATS[output_format]
+    # 未指定 color 时沿用原先的行为: complex 模式输出彩色，simple 模式输出灰度
+    video_mode = video_options_from_form.get('mode', 'simple')
+    video_options = {
+        'mode': video_mode,
+        'color': video_options_from_form.get('color', video_mode == 'complex'),
+        'background': video_options_from_form.get('background', 'black'),
+        'num_cols': video_options_from_form.get('num_cols', 100),
+        'scale': video_options_from_form.get('scale', 1),
+        'fps': video_options_from_form.get('fps', 0),
+        'overlay_ratio': video_options_from_form.get('overlay_ratio', 0.2),
+        'codec': 'libx264',
+        'output_format': output_format
+    }
 
-        base, ext = os.path.splitext(original_filename)
-        ascii_video_filename = f"{base}_ascii.mp4"
-        processed_oss_key = _generate_oss_key(user_id, ascii_video_filename, type_prefix="processed_ascii_", is_video=True)
-        with open(temp_output_path, 'rb') as processed_file:
-            processed_oss_url = _upload_to_oss_and_get_url(bucket, processed_oss_key, processed_file, 'video/mp4')
-        
-        os.unlink(temp_input_path)
-        os.unlink(temp_output_path)
+    spool_path = None
+    try:
+        # 输入视频保存到任务输入目录，由后台工作线程处理完成后删除
+        os.makedirs(VIDEO_SPOOL_DIR, exist_ok=True)
+        with stage("read"), tempfile.NamedTemporaryFile(delete=False, dir=VIDEO_SPOOL_DIR,
+                                                        suffix=os.path.splitext(original_filename)[1]) as spool_file:
+            spool_path = spool_file.name
+            file_storage.save(spool_file)
 
-        if not processed_oss_url:
-            app.logger.error("上传处理后的ASCII视频到OSS失败。")
-            return jsonify({"message": "上传处理后的ASCII视频到OSS失败"}), 500
+        # 结果地址在入队时确定: 边转边播时立即可以播放，完成后的 MP4 也在这个地址
+        base, _ = os.path.splitext(original_filename)
+        output_oss_key = _generate_oss_key(user_id, f"{base}_ascii.{'mp4' if output_format == 'hls' else output_ext}",
+                                           type_prefix="processed_ascii_", is_video=True)
+        playlist_url = None
+        if output_format == 'hls':
+            with stage("upload_playlist"):
+                playlist_url = _upload_to_oss_and_get_url(
+                    bucket, _hls_prefix(output_oss_key) + HLS_PLAYLIST_FILENAME,
+                    io.BytesIO(empty_playlist().encode('utf-8')), HLS_PLAYLIST_CONTENT_TYPE, 'no-cache')
 
-        new_process_log = UserVideoProcess(
+        job = VideoProcessJob(
             user_id=user_id,
             username=username_in_session,
-            input_oss_url=original_oss_url,
+            status='queued',
+            progress=0,
+            output_format=output_format,
+            options=json.dumps(video_options),
+            original_filename=original_filename,
+            original_content_type=original_content_type,
+            input_path=spool_path,
             input_token=token_from_form,
-            output_oss_url=processed_oss_url
+            output_oss_key=output_oss_key,
+            playlist_url=playlist_url
         )
-        db.session.add(new_process_log)
-        db.session.commit()
+        db.session.add(job)
+        with stage("db_commit"):
+            db.session.commit()
+        video_job_pool.notify()
 
-        app.logger.info(f"视频成功转换为ASCII艺术并记录。日志ID: {new_process_log.id}")
+        app.logger.info(f"视频处理任务 {job.id} 已入队，选项: {video_options}")
         return jsonify({
-            "message": "视频处理、上传并记录成功",
-            "log_entry_id": new_process_log.id,
-            "original_video_url": original_oss_url,
-            "processed_video_url": processed_oss_url,
-            "token": token_from_form,
-            "details": new_process_log.to_dict()
-        }), 201
+            "message": "视频已加入处理队列",
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/video_jobs/{job.id}",
+            "output_format": output_format,
+            "playlist_url": playlist_url,
+            "processed_video_url": _oss_url(output_oss_key),
+            "token": token_from_form
+        }), 202
 
     except oss2.exceptions.OssError as oe:
         db.session.rollback()
+        _remove_file(spool_path)
         app.logger.error(f"OSS 操作失败: {oe}", exc_info=True)
         return jsonify({"message": f"OSS 操作失败: {str(oe)}"}), 500
-    except FileNotFoundError as fnfe:
-        db.session.rollback()
-        app.logger.error(f"处理所需文件未找到: {fnfe}", exc_info=True)
-        return jsonify({"message": f"服务配置错误，缺少处理所需文件: {str(fnfe)}"}), 503
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"视频处理和记录过程中发生未知错误: {e}", exc_info=True)
+        _remove_file(spool_path)
+        app.logger.error(f"视频任务入队过程中发生未知错误: {e}", exc_info=True)
         return jsonify({"message": f"处理视频过程中发生未知错误: {str(e)}"}), 500
-    
+
+# 查询视频处理任务的状态: queued / running (progress 为完成百分比) / done / failed
+@app.route('/video_jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_video_job(job_id):
+    job = db.session.get(VideoProcessJob, job_id)
+    if job is None or job.user_id != session['user_id']:
+        return jsonify({"message": "任务不存在"}), 404
+    return jsonify(job.to_dict()), 200
+
+def _remove_file(path):
+    if not path:
+        return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+# HLS 分段和播放列表所在的 OSS 目录，由最终 MP4 的对象键确定
+def _hls_prefix(output_oss_key):
+    return os.path.splitext(output_oss_key)[0] + "_hls/"
+
+# 清理被放弃的视频任务目录 (按最后更新时间和总大小)，清理失败不影响当前任务
+def _collect_video_jobs():
+    try:
+        removed = collect_video_jobs()
+        if removed:
+            app.logger.info(f"已清理 {removed} 个被放弃的视频任务目录")
+    except OSError as e:
+        app.logger.warning(f"清理视频任务目录失败: {e}")
+
+def _update_video_job(job_id, **fields):
+    with app.app_context():
+        VideoProcessJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+        db.session.commit()
+
+# 领取最早入队的任务: 以 "status 仍为 queued" 为条件更新，多个线程/进程同时领取时只有一个成功
+def _claim_video_job():
+    with app.app_context():
+        for _ in range(3):
+            job = VideoProcessJob.query.filter_by(status='queued').order_by(VideoProcessJob.id).first()
+            if job is None:
+                return None
+            now = datetime.now()
+            claimed = VideoProcessJob.query.filter_by(id=job.id, status='queued').update({
+                'status': 'running',
+                'worker': VIDEO_JOB_WORKER_NAME,
+                'attempts': VideoProcessJob.attempts + 1,
+                'started_at': now,
+                'heartbeat_at': now
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job.id
+        return None
+
+# 执行中的任务超过 VIDEO_JOB_STALE_SECONDS 没有心跳，说明执行它的进程已经退出: 放回队列重新执行
+# (MP4 输出会从检查点继续)，中断次数达到上限的任务标记为失败
+def _requeue_stale_video_jobs():
+    with app.app_context():
+        now = datetime.now()
+        stale = VideoProcessJob.query.filter(VideoProcessJob.status == 'running',
+                                             VideoProcessJob.heartbeat_at < now - timedelta(seconds=VIDEO_JOB_STALE_SECONDS))
+        abandoned = stale.filter(VideoProcessJob.attempts >= VIDEO_JOB_MAX_ATTEMPTS)
+        abandoned_inputs = [job.input_path for job in abandoned]
+        failed = abandoned.update({
+            'status': 'failed',
+            'error_message': '任务多次中断，已放弃',
+            'finished_at': now
+        }, synchronize_session=False)
+        requeued = stale.update({'status': 'queued'}, synchronize_session=False)
+        db.session.commit()
+        for input_path in abandoned_inputs:
+            _remove_file(input_path)
+        if failed or requeued:
+            app.logger.warning(f"心跳超时的视频任务: {requeued} 个重新入队，{failed} 个标记为失败")
+
+# 在工作线程中执行一个任务，进度由心跳线程定期写入数据库
+def _run_video_job(job_id):
+    with app.app_context():
+        job = db.session.get(VideoProcessJob, job_id)
+        if job is None:
+            return
+        progress = {'value': job.progress or 0}
+        heartbeat = JobHeartbeat(VIDEO_JOB_HEARTBEAT_SECONDS, lambda: _update_video_job(
+            job_id, progress=round(progress['value'], 1), heartbeat_at=datetime.now())).start()
+        try:
+            result = _process_video_job(job, lambda fraction: progress.update(value=fraction * 100))
+            result.update(status='done', progress=100)
+            app.logger.info(f"视频处理任务 {job_id} 完成。日志ID: {result['process_log_id']}")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"视频处理任务 {job_id} 失败: {e}", exc_info=True)
+            result = {'status': 'failed', 'error_message': str(e)[:1000]}
+        finally:
+            heartbeat.stop()
+        input_path = job.input_path
+    result['finished_at'] = datetime.now()
+    _update_video_job(job_id, **result)
+    _remove_file(input_path)
+
+# 原视频上传与转换同时进行 -> 上传结果 -> 记录日志，返回需要写回任务的字段
+# 原视频上传失败时在下一次进度回调中中止转换；转换失败时取消原视频上传 (已上传的删除)
+def _process_video_job(job, on_progress):
+    video_options = json.loads(job.options)
+    if not os.path.exists(job.input_path):
+        raise FileNotFoundError(f"任务输入文件不存在 (可能在其他实例上入队): {job.input_path}")
+
+    original_oss_url = job.input_oss_url
+    original_upload = None
+    if not original_oss_url:
+        original_oss_key = _generate_oss_key(job.user_id, job.original_filename, type_prefix="original_", is_video=True)
+        original_upload = _start_background_upload(original_oss_key, job.input_path, job.original_content_type,
+                                                   is_path=True)
+
+    def progress(fraction):
+        if original_upload is not None and original_upload.done() and original_upload.exception() is not None:
+            raise original_upload.exception()
+        on_progress(fraction)
+
+    output_format = video_options['output_format']
+    app.logger.info(f"开始视频处理任务 {job.id} (第 {job.attempts} 次)，选项: {video_options}")
+    try:
+        if output_format == 'hls':
+            processed_oss_url, conversion_stats = _convert_video_hls(job, video_options, progress)
+        elif output_format == 'mp4':
+            processed_oss_url, conversion_stats = _convert_video_checkpointed(job, video_options, progress)
+        else:
+            _, output_content_type = VIDEO_OUTPUT_FORMATS[output_format]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(job.output_oss_key)[1]) as temp_output:
+                temp_output_path = temp_output.name
+            try:
+                conversion_stats = convert_video(job.input_path, temp_output_path, progress=progress, **video_options)
+                with open(temp_output_path, 'rb') as processed_file:
+                    processed_oss_url = _upload_to_oss_and_get_url(bucket, job.output_oss_key, processed_file,
+                                                                   output_content_type)
+            finally:
+                _remove_file(temp_output_path)
+    except BaseException:
+        if original_upload is not None:
+            _discard_background_upload(original_upload, original_oss_key)
+        raise
+
+    if original_upload is not None:
+        try:
+            original_oss_url = original_upload.result()
+        except Exception:
+            # 结果已上传但原视频没有保存，不留下无人引用的结果
+            _delete_oss_object(job.output_oss_key)
+            raise
+        _update_video_job(job.id, input_oss_url=original_oss_url)
+
+    new_process_log = UserVideoProcess(
+        user_id=job.user_id,
+        username=job.username,
+        input_oss_url=original_oss_url,
+        input_token=job.input_token,
+        output_oss_url=processed_oss_url
+    )
+    db.session.add(new_process_log)
+    db.session.commit()
+    stats = {key: conversion_stats[key] for key in ("frames", "duplicate_frames", "mean_change_ratio")}
+    return {'output_oss_url': processed_oss_url, 'process_log_id': new_process_log.id,
+            'conversion_stats': json.dumps(stats)}
+
+# MP4 输出: 任务目录由输入内容和选项确定，任务重新执行时从已完成的分段继续转换
+def _convert_video_checkpointed(job, video_options, on_progress):
+    _collect_video_jobs()
+    job_dir, job_lock = open_video_job(video_job_id(job.input_path, video_options))
+    try:
+        output_path = os.path.join(job_dir, "output.mp4")
+        conversion_stats = convert_video(job.input_path, output_path, checkpoint_dir=job_dir, progress=on_progress,
+                                         **video_options)
+        with open(output_path, 'rb') as processed_file:
+            processed_oss_url = _upload_to_oss_and_get_url(bucket, job.output_oss_key, processed_file, 'video/mp4')
+        # 结果已保存，不再需要检查点；失败时保留，长期无人使用的由 _collect_video_jobs 清理
+        remove_video_job(job_dir)
+    finally:
+        job_lock.release()
+    return processed_oss_url, conversion_stats
+
+# 边转边播: HLS 分段每完成一个就上传到 OSS 的同一目录，播放列表随之增长；
+# 全部完成后把分段无损封装为 faststart 的 MP4 上传到任务的结果地址
+def _convert_video_hls(job, video_options, on_progress):
+    hls_prefix = _hls_prefix(job.output_oss_key)
+    work_dir = tempfile.mkdtemp(prefix="ascii_hls_")
+
+    def upload(name, data_stream, content_type, cache_control):
+        return _upload_to_oss_and_get_url(bucket, hls_prefix + name, data_stream, content_type, cache_control)
+
+    publisher = HlsPublisher(os.path.join(work_dir, HLS_PLAYLIST_FILENAME), upload)
+    try:
+        publisher.start()
+        try:
+            conversion_stats = convert_video(job.input_path, publisher.playlist_path, progress=on_progress,
+                                             **video_options)
+            publisher.finish()
+        except Exception:
+            publisher.abort()
+            raise
+        processed_path = os.path.join(work_dir, "processed.mp4")
+        remux_hls_to_mp4(publisher.playlist_path, processed_path)
+        with open(processed_path, 'rb') as processed_file:
+            processed_oss_url = _upload_to_oss_and_get_url(bucket, job.output_oss_key, processed_file, 'video/mp4')
+        app.logger.info(f"视频处理任务 {job.id} 共发布 {publisher.published_segments} 个 HLS 分段")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return processed_oss_url, conversion_stats
+
+video_job_pool = JobWorkerPool(_claim_video_job, _run_video_job, maintain=_requeue_stale_video_jobs,
+                               workers=VIDEO_JOB_WORKERS, maintain_interval=VIDEO_JOB_HEARTBEAT_SECONDS,
+                               name="video-job")
+
+# 工作线程在第一个请求到来时启动 (此时数据库表已经就绪)，之后重复调用不做任何事
+@app.before_request
+def _start_video_job_workers():
+    video_job_pool.start()
+
 
 @app.route('/video_process_logs', methods=['GET'])
 @login_required
@@ -561,7 +1305,8 @@ def get_video_process_logs():
     }
     return jsonify(response), 200
 
-# 文生图路由
+# 文生图路由: 创建 DashScope 任务后立即返回，任务由 text_to_image_tracker 在后台跟踪，
+# 完成后下载结果上传到 OSS；客户端通过状态接口轮询或订阅 SSE 事件流获取结果
 @app.route('/generate_image_from_text', methods=['POST'])
 @login_required
 def generate_image_from_text():
@@ -586,50 +1331,187 @@ def generate_image_from_text():
             return jsonify({"message": "DashScope API密钥未配置"}), 500
         
         creation_result = generate_image(prompt, api_key)
-        task_id = creation_result["output"]["task_id"]
-        
-        while True:
-            status_result = check_task_status(task_id, api_key)
-            task_status = status_result["output"]["task_status"]
-            
-            if task_status == "SUCCEEDED":
-                break
-            elif task_status in ["FAILED", "CANCELED"]:
-                raise Exception(f"任务失败，状态: {task_status}")
-            
-            time.sleep(5)
-        
-        image_url = status_result["output"]["results"][0]["url"]
-        response = requests.get(image_url)
-        if response.status_code != 200:
-            raise Exception(f"图片下载失败: {response.status_code}")
-        
-        image_data = io.BytesIO(response.content)
-        image_data.seek(0)
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
-        oss_key = f"generated_images/user_{user_id}/{timestamp}_generated.jpg"
-        
-        oss_url = _upload_to_oss_and_get_url(bucket, oss_key, image_data, 'image/jpeg')
-        
-        new_generation = TextToImageGeneration(
+        dashscope_task_id = creation_result["output"]["task_id"]
+
+        task = TextToImageTask(
             user_id=user_id,
             prompt=prompt,
-            generated_image_oss_url=oss_url
+            dashscope_task_id=dashscope_task_id,
+            status='pending'
         )
-        
-        db.session.add(new_generation)
+        db.session.add(task)
         db.session.commit()
-        
+        text_to_image_tracker.track(dashscope_task_id, task.id)
+
         return jsonify({
-            "message": "图片生成并保存成功",
-            "generation": new_generation.to_dict()
-        }), 201
+            "message": "图片生成任务已创建",
+            "task": task.to_dict(),
+            "status_url": f"/text_to_image_tasks/{task.id}",
+            "events_url": f"/text_to_image_tasks/{task.id}/events"
+        }), 202
         
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"图片生成过程中发生错误: {str(e)}", exc_info=True)
         return jsonify({"message": f"图片生成失败: {str(e)}"}), 500
 
+def _get_own_text_to_image_task(task_id):
+    task = db.session.get(TextToImageTask, task_id)
+    if task is None or task.user_id != session['user_id']:
+        return None
+    return task
+
+# 查询文生图任务状态: pending / running / saving / succeeded / failed
+@app.route('/text_to_image_tasks/<int:task_id>', methods=['GET'])
+@login_required
+def get_text_to_image_task(task_id):
+    task = _get_own_text_to_image_task(task_id)
+    if task is None:
+        return jsonify({"message": "任务不存在"}), 404
+    return jsonify(task.to_dict()), 200
+
+# 文生图任务的 SSE 事件流: 每次状态变化推送一条 data 事件 (内容同状态接口)，任务结束后关闭
+@app.route('/text_to_image_tasks/<int:task_id>/events', methods=['GET'])
+@login_required
+def stream_text_to_image_task(task_id):
+    if _get_own_text_to_image_task(task_id) is None:
+        return jsonify({"message": "任务不存在"}), 404
+
+    # 每次读取后立即结束事务并归还连接: MySQL 默认的 REPEATABLE READ 下，同一事务内重复读取只能看到第一次读取时的快照，
+    # 而且长时间打开的事务会一直占用连接池中的连接
+    db.session.rollback()
+
+    def read_task():
+        try:
+            task = db.session.get(TextToImageTask, task_id)
+            return task.to_dict() if task else None
+        finally:
+            db.session.rollback()
+
+    def events():
+        last_event = None
+        version = text_to_image_tracker.version
+        while True:
+            # 状态可能由其他进程写入，每次都在新的事务中从数据库读取
+            task = read_task()
+            if task is None:
+                return
+            event = json.dumps(task, ensure_ascii=False)
+            if event != last_event:
+                yield f"data: {event}\n\n"
+                last_event = event
+            if task['status'] in TEXT_TO_IMAGE_FINAL_STATUSES:
+                return
+            new_version = text_to_image_tracker.wait_for_change(version, TEXT_TO_IMAGE_SSE_REFRESH_SECONDS)
+            if new_version == version:
+                # 保持连接 (代理会关闭长时间没有数据的连接)，同时兜底其他进程写入的状态
+                yield ": keep-alive\n\n"
+            version = new_version
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 以领取时间为条件更新保存中的任务 (不提交)，返回更新的行数；保存超时后任务被重新领取时返回 0，不覆盖新的结果
+def _update_claimed_text_to_image_task(task_id, claimed_at, **fields):
+    return TextToImageTask.query.filter_by(id=task_id, status='saving', claimed_at=claimed_at)\
+        .update(fields, synchronize_session=False)
+
+def _check_text_to_image_status(dashscope_task_id):
+    result = check_task_status(dashscope_task_id, os.environ.get('DASHSCOPE_API_KEY'))
+    status = result["output"]["task_status"]
+    if status == "RUNNING":
+        with app.app_context():
+            TextToImageTask.query.filter_by(dashscope_task_id=dashscope_task_id, status='pending')\
+                .update({'status': 'running'}, synchronize_session=False)
+            db.session.commit()
+    return result
+
+# DashScope 任务结束后在跟踪器的线程池中执行: 下载生成的图片，上传到 OSS 并记录生成记录
+def _finish_text_to_image_task(dashscope_task_id, task_id, result, error):
+    with app.app_context():
+        # 以 "尚未结束" 为条件领取，多个进程同时跟踪同一任务时只保存一次；领取时间用于发现保存中断的任务
+        claimed_at = datetime.now().replace(microsecond=0)
+        claimed = TextToImageTask.query.filter(TextToImageTask.id == task_id,
+                                               TextToImageTask.status.in_(('pending', 'running')))\
+            .update({'status': 'saving', 'claimed_at': claimed_at}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+        task = db.session.get(TextToImageTask, task_id)
+        try:
+            if error is not None:
+                raise Exception(f"任务状态查询失败: {error}")
+            output = result["output"]
+            if output["task_status"] != "SUCCEEDED":
+                raise Exception(f"任务失败，状态: {output['task_status']} {output.get('message', '')}".strip())
+
+            # 生成的图片边下载边上传到 OSS，不在内存中缓存整张图片
+            image_url = output["results"][0]["url"]
+            timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+            oss_key = f"generated_images/user_{task.user_id}/{timestamp}_generated.jpg"
+            response, chunks = open_download(image_url)
+            with response:
+                oss_url = _upload_to_oss_and_get_url(bucket, oss_key, chunks, 'image/jpeg')
+
+            new_generation = TextToImageGeneration(
+                user_id=task.user_id,
+                prompt=task.prompt,
+                generated_image_oss_url=oss_url
+            )
+            db.session.add(new_generation)
+            db.session.flush()
+            # 生成记录和任务的最终状态在同一个事务中提交
+            if not _update_claimed_text_to_image_task(task_id, claimed_at, status='succeeded',
+                                                      generation_id=new_generation.id,
+                                                      generated_image_oss_url=oss_url, finished_at=datetime.now()):
+                db.session.rollback()
+                app.logger.warning(f"文生图任务 {task_id} 保存超时后已被重新领取，放弃本次结果")
+                return
+            db.session.commit()
+            app.logger.info(f"文生图任务 {task_id} 完成: {oss_url}")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"文生图任务 {task_id} 失败: {str(e)}", exc_info=True)
+            _update_claimed_text_to_image_task(task_id, claimed_at, status='failed', error_message=str(e)[:1000],
+                                               finished_at=datetime.now())
+            db.session.commit()
+
+# 保存结果超时的任务 (领取它的进程在下载或上传期间退出) 放回 running 并重新跟踪，
+# 任务结束后由跟踪器再次领取和保存；启动时和跟踪线程中定期执行
+def _recover_stale_text_to_image_tasks():
+    with app.app_context():
+        stale = TextToImageTask.query.filter(
+            TextToImageTask.status == 'saving',
+            TextToImageTask.claimed_at < datetime.now() - timedelta(seconds=TEXT_TO_IMAGE_SAVE_TIMEOUT_SECONDS))
+        tasks = [(task.id, task.dashscope_task_id) for task in stale]
+        if not tasks:
+            db.session.rollback()
+            return
+        stale.update({'status': 'running', 'claimed_at': None}, synchronize_session=False)
+        db.session.commit()
+        for task_id, dashscope_task_id in tasks:
+            text_to_image_tracker.track(dashscope_task_id, task_id)
+        app.logger.warning(f"保存超时的文生图任务: {len(tasks)} 个重新跟踪")
+
+text_to_image_tracker = DashScopeTaskTracker(_check_text_to_image_status, _finish_text_to_image_task,
+                                             maintain=_recover_stale_text_to_image_tasks,
+                                             maintain_interval=TEXT_TO_IMAGE_SAVE_TIMEOUT_SECONDS / 5)
+_text_to_image_tracker_started = threading.Event()
+
+# 第一个请求到来时启动跟踪线程，并接管重启前尚未结束的任务
+@app.before_request
+def _start_text_to_image_tracker():
+    if _text_to_image_tracker_started.is_set():
+        return
+    _text_to_image_tracker_started.set()
+    text_to_image_tracker.start()
+    try:
+        _recover_stale_text_to_image_tasks()
+        for task in TextToImageTask.query.filter(TextToImageTask.status.in_(('pending', 'running'))):
+            text_to_image_tracker.track(task.dashscope_task_id, task.id)
+    except Exception as e:
+        app.logger.warning(f"恢复未完成的文生图任务失败: {e}")
+
 # 获取文生图记录
 @app.route('/text_to_image_logs', methods=['GET'])
 @login_required
@@ -17,6 +17,18 @@
 SET NAMES utf8mb4;
 SET FOREIGN_KEY_CHECKS = 0;
 
+-- ----------------------------
+-- Table structure for image_result_cache
+-- ----------------------------
+DROP TABLE IF EXISTS `image_result_cache`;
+CREATE TABLE `image_result_cache`  (
+  `cache_key` varchar(128) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '用户ID + 输入内容哈希 + 转换选项哈希',
+  `original_oss_url` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '原图的OSS链接',
+  `output_oss_url` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '转换结果的OSS链接',
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  PRIMARY KEY (`cache_key`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci COMMENT = '图片转换结果缓存表' ROW_FORMAT = Dynamic;
+
 -- ----------------------------
 -- Table structure for text_to_image_generations
 -- ----------------------------
@@ -38,6 +50,30 @@ CREATE TABLE `text_to_image_generations`  (
 -- ----------------------------
 INSERT INTO `text_to_image_generations` VALUES (1, 1, '测试图片', 'https://artiscope.oss-cn-beijing.aliyuncs.com/generated_images/user_1/20250523114216987972_generated.jpg', '2025-05-23 11:42:17', '2025-05-23 11:42:17');
 
+-- ----------------------------
+-- Table structure for text_to_image_tasks
+-- ----------------------------
+DROP TABLE IF EXISTS `text_to_image_tasks`;
+CREATE TABLE `text_to_image_tasks`  (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `user_id` int NOT NULL COMMENT '用户ID',
+  `prompt` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '生成图片所需的文字描述',
+  `dashscope_task_id` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'DashScope 异步任务ID',
+  `status` varchar(16) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL DEFAULT 'pending' COMMENT 'pending / running / saving / succeeded / failed',
+  `generation_id` int NULL DEFAULT NULL COMMENT '成功后对应的生成记录ID',
+  `generated_image_oss_url` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '生成图片的OSS链接',
+  `error_message` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL COMMENT '失败原因',
+  `claimed_at` datetime NULL DEFAULT NULL COMMENT '开始保存结果的时间，超时未结束的任务重新跟踪',
+  `finished_at` datetime NULL DEFAULT NULL COMMENT '结束时间',
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_text_to_image_tasks_dashscope_task_id`(`dashscope_task_id` ASC) USING BTREE,
+  INDEX `ix_text_to_image_tasks_status`(`status` ASC) USING BTREE,
+  CONSTRAINT `text_to_image_tasks_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 1 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci COMMENT = '文字生成图片任务表' ROW_FORMAT = Dynamic;
+
 -- ----------------------------
 -- Table structure for user_image_processes
 -- ----------------------------
@@ -100,5 +136,41 @@ CREATE TABLE `user_video_processes`  (
   CONSTRAINT `user_video_processes_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
 ) ENGINE = InnoDB AUTO_INCREMENT = 1 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci COMMENT = '视频处理记录表' ROW_FORMAT = Dynamic;
 
+-- ----------------------------
+-- Table structure for video_process_jobs
+-- ----------------------------
+DROP TABLE IF EXISTS `video_process_jobs`;
+CREATE TABLE `video_process_jobs`  (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `user_id` int NOT NULL,
+  `username` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `status` varchar(16) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL DEFAULT 'queued' COMMENT 'queued / running / done / failed',
+  `progress` float NOT NULL DEFAULT 0 COMMENT '完成百分比',
+  `output_format` varchar(16) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `options` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '转换选项 (JSON)',
+  `original_filename` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `original_content_type` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `input_path` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT '入队时保存的输入视频路径',
+  `input_token` varchar(512) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `input_oss_url` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `output_oss_key` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `output_oss_url` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `playlist_url` varchar(1024) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL COMMENT '边转边播的 HLS 播放列表',
+  `process_log_id` int NULL DEFAULT NULL,
+  `conversion_stats` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL,
+  `error_message` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL,
+  `attempts` int NOT NULL DEFAULT 0,
+  `worker` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `heartbeat_at` datetime NULL DEFAULT NULL,
+  `started_at` datetime NULL DEFAULT NULL,
+  `finished_at` datetime NULL DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `user_id`(`user_id` ASC) USING BTREE,
+  INDEX `ix_video_process_jobs_status`(`status` ASC) USING BTREE,
+  CONSTRAINT `video_process_jobs_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 1 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci COMMENT = '视频处理任务队列' ROW_FORMAT = Dynamic;
+
 
 SET FOREIGN_KEY_CHECKS = 1;
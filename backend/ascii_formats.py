@@ -0,0 +1,65 @@
+import html
+
+import numpy as np
+
+# 彩色文本输出时颜色量化的步长，相邻且量化后颜色相同的字符会合并为同一段，减少转义序列/标签数量
+COLOR_MERGE_STEP = 8
+
+# 输出格式 -> (文件扩展名, Content-Type)
+TEXT_OUTPUT_FORMATS = {
+    "text": ("txt", "text/plain; charset=utf-8"),
+    "ansi": ("ans", "text/plain; charset=utf-8"),
+    "html": ("html", "text/html; charset=utf-8"),
+}
+
+
+def _char_rows(char_list, char_indices):
+    chars = np.array(list(char_list))[char_indices]
+    return ["".join(row) for row in chars]
+
+
+def _quantize_colors(colors):
+    colors = np.clip(np.asarray(colors), 0, 255).astype(np.int32)
+    if COLOR_MERGE_STEP > 1:
+        colors = np.minimum(colors // COLOR_MERGE_STEP * COLOR_MERGE_STEP + COLOR_MERGE_STEP // 2, 255)
+    return colors
+
+
+# 将一行拆分为颜色相同的连续片段，返回 [(起始列, 结束列, (r, g, b))]
+def _color_runs(row_colors):
+    changes = np.flatnonzero(np.any(row_colors[1:] != row_colors[:-1], axis=1)) + 1
+    starts = np.concatenate(([0], changes))
+    stops = np.concatenate((changes, [len(row_colors)]))
+    return [(start, stop, tuple(row_colors[start].tolist())) for start, stop in zip(starts, stops)]
+
+
+# 纯文本: 每行一次 join
+def grid_to_text(char_list, char_indices):
+    return "\n".join(_char_rows(char_list, char_indices)) + "\n"
+
+
+# 24 位真彩色 ANSI 文本，colors 为 (rows, cols, 3) 的 RGB 平均颜色
+def grid_to_ansi(char_list, char_indices, colors, background="black"):
+    colors = _quantize_colors(colors)
+    bg = "\x1b[48;2;255;255;255m" if background == "white" else "\x1b[48;2;0;0;0m"
+    lines = []
+    for row_text, row_colors in zip(_char_rows(char_list, char_indices), colors):
+        parts = [bg]
+        for start, stop, (r, g, b) in _color_runs(row_colors):
+            parts.append(f"\x1b[38;2;{r};{g};{b}m{row_text[start:stop]}")
+        parts.append("\x1b[0m")
+        lines.append("".join(parts))
+    return "\n".join(lines) + "\n"
+
+
+# 紧凑的 HTML，相邻同色字符合并为一个 span
+def grid_to_html(char_list, char_indices, colors, background="black"):
+    colors = _quantize_colors(colors)
+    bg = "#fff" if background == "white" else "#000"
+    lines = []
+    for row_text, row_colors in zip(_char_rows(char_list, char_indices), colors):
+        lines.append("".join(f'<span style="color:#{r:02x}{g:02x}{b:02x}">{html.escape(row_text[start:stop])}</span>'
+                             for start, stop, (r, g, b) in _color_runs(row_colors)))
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body style="margin:0;background:{bg}">'
+            f'<pre style="margin:0;font-family:monospace;line-height:1;background:{bg}">'
+            + "\n".join(lines) + "</pre></body></html>\n")
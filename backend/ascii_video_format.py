@@ -0,0 +1,169 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# 字符视频流 (.asciiv): 只保存每帧的字符下标网格和颜色网格，而不是渲染后的画面
+#
+# 所有整数均为小端序
+# 文件头: magic "ASCV" | 版本 u8 | 标志 u8 (bit0 彩色, bit1 白底) | 列数 u16 | 行数 u16 | 帧率 f64
+#         | 帧数 u32 | 索引偏移 u64 | 字符表长度 u16 | 字符表 (UTF-8)
+# 帧记录: 类型 u8 | 数据长度 u32 | deflate (zlib) 压缩的数据
+#   关键帧 (0): 字符下标 (rows * cols 字节) + 彩色时的 RGB 颜色 (rows * cols * 3 字节)
+#   增量帧 (1): 与上一帧同样布局的数据逐字节相减 (模 256)，未变化的格子为 0，压缩后几乎不占空间
+#   重复帧 (2): 与上一帧完全相同，没有数据
+# 索引: magic "INDX" | 关键帧数 u32 | 每个关键帧的 (帧号 u32, 帧记录偏移 u64)，定位时从不晚于目标帧的最近关键帧开始解码
+ASCII_VIDEO_MAGIC = b"ASCV"
+ASCII_VIDEO_VERSION = 1
+ASCII_VIDEO_INDEX_MAGIC = b"INDX"
+
+FRAME_KEY = 0
+FRAME_DELTA = 1
+FRAME_REPEAT = 2
+
+FLAG_COLOR = 1
+FLAG_WHITE_BACKGROUND = 2
+
+_HEADER = struct.Struct("<4sBBHHdIQH")
+_FRAME = struct.Struct("<BI")
+_INDEX_ENTRY = struct.Struct("<IQ")
+
+# 关键帧间隔 (秒)，决定定位时最多需要从前面解码多少帧
+ASCII_VIDEO_KEYFRAME_SECONDS = 2
+ASCII_VIDEO_COMPRESS_LEVEL = 6
+
+# 颜色量化步长 (取每档的中间值)，过滤相邻帧之间细微的颜色抖动，使增量帧更稀疏；为 1 时无损保存
+ASCII_VIDEO_COLOR_STEP = int(os.environ.get("ASCII_VIDEO_COLOR_STEP", 4))
+
+
+# 写入字符视频流，接口与 FfmpegVideoWriter 相同 (write / release / abort / isOpened)
+# write 接收 (rows, cols) 的字符下标与 (rows, cols, 3) 的 BGR 颜色 (灰度时为 None)
+class AsciiVideoWriter:
+    def __init__(self, output_path, num_cols, num_rows, fps, char_list, color=False, background="black",
+                 keyframe_interval=None, color_step=ASCII_VIDEO_COLOR_STEP):
+        if len(char_list) > 256:
+            raise ValueError("Character list must not exceed 256 characters")
+        self.output_path = output_path
+        self.num_cols = int(num_cols)
+        self.num_rows = int(num_rows)
+        self.fps = float(fps)
+        self.color = bool(color)
+        self.color_step = max(1, int(color_step))
+        self.keyframe_interval = keyframe_interval or max(1, round(self.fps * ASCII_VIDEO_KEYFRAME_SECONDS))
+        self.frame_count = 0
+        self.keyframes = []
+        self._previous = None
+        self._charset = char_list.encode("utf-8")
+        self._flags = (FLAG_COLOR if self.color else 0) | (FLAG_WHITE_BACKGROUND if background == "white" else 0)
+        self._file = open(output_path, "wb")
+        self._write_header(index_offset=0)
+
+    def isOpened(self):
+        return self._file is not None
+
+    def _write_header(self, index_offset):
+        self._file.write(_HEADER.pack(ASCII_VIDEO_MAGIC, ASCII_VIDEO_VERSION, self._flags, self.num_cols, self.num_rows,
+                                      self.fps, self.frame_count, index_offset, len(self._charset)))
+        self._file.write(self._charset)
+
+    def _frame_data(self, char_indices, colors):
+        data = np.asarray(char_indices, dtype=np.uint8).tobytes()
+        if self.color:
+            # 引擎中的颜色为 OpenCV 的 BGR 顺序，文件中保存为 RGB
+            colors = np.asarray(colors, dtype=np.uint8)[:, :, ::-1]
+            if self.color_step > 1:
+                step = self.color_step
+                colors = np.minimum(colors // step * step + step // 2, 255).astype(np.uint8)
+            data += np.ascontiguousarray(colors).tobytes()
+        return np.frombuffer(data, dtype=np.uint8)
+
+    def write(self, char_indices, colors=None):
+        if char_indices.shape != (self.num_rows, self.num_cols):
+            raise ValueError(f"Grid shape {char_indices.shape} does not match writer size {(self.num_rows, self.num_cols)}")
+        data = self._frame_data(char_indices, colors)
+        offset = self._file.tell()
+        if self._previous is None or self.frame_count % self.keyframe_interval == 0:
+            frame_type, payload = FRAME_KEY, data
+            self.keyframes.append((self.frame_count, offset))
+        else:
+            delta = np.subtract(data, self._previous)
+            frame_type, payload = (FRAME_DELTA, delta) if delta.any() else (FRAME_REPEAT, None)
+        compressed = zlib.compress(payload.tobytes(), ASCII_VIDEO_COMPRESS_LEVEL) if payload is not None else b""
+        self._file.write(_FRAME.pack(frame_type, len(compressed)))
+        self._file.write(compressed)
+        self._previous = data
+        self.frame_count += 1
+
+    # 写入关键帧索引并回填文件头中的帧数和索引偏移
+    def release(self):
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        self._file.write(ASCII_VIDEO_INDEX_MAGIC + struct.pack("<I", len(self.keyframes)))
+        for frame_number, offset in self.keyframes:
+            self._file.write(_INDEX_ENTRY.pack(frame_number, offset))
+        self._file.seek(0)
+        self._write_header(index_offset)
+        self._file.close()
+        self._file = None
+
+    def abort(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+
+
+# 参考解码器 (前端 src/utils/ascii-video.ts 与之逐字段对应)
+# read_frame(n) 从不晚于 n 的最近关键帧开始解码，返回 (字符下标, RGB 颜色或 None)
+class AsciiVideoReader:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._data = f.read()
+        (magic, version, flags, self.num_cols, self.num_rows, self.fps, self.frame_count, index_offset,
+         charset_length) = _HEADER.unpack_from(self._data, 0)
+        if magic != ASCII_VIDEO_MAGIC:
+            raise ValueError("Not an ASCII video stream")
+        if version != ASCII_VIDEO_VERSION:
+            raise ValueError(f"Unsupported ASCII video version: {version}")
+        self.color = bool(flags & FLAG_COLOR)
+        self.background = "white" if flags & FLAG_WHITE_BACKGROUND else "black"
+        self.char_list = self._data[_HEADER.size:_HEADER.size + charset_length].decode("utf-8")
+        self._first_frame_offset = _HEADER.size + charset_length
+
+        if self._data[index_offset:index_offset + 4] != ASCII_VIDEO_INDEX_MAGIC:
+            raise ValueError("ASCII video index is missing (file was not finalized)")
+        (count,) = struct.unpack_from("<I", self._data, index_offset + 4)
+        self.keyframes = [_INDEX_ENTRY.unpack_from(self._data, index_offset + 8 + i * _INDEX_ENTRY.size)
+                          for i in range(count)]
+        self._index_offset = index_offset
+
+    def _frames_from(self, offset, frame_number):
+        cells = self.num_rows * self.num_cols
+        current = None
+        while frame_number < self.frame_count and offset < self._index_offset:
+            frame_type, length = _FRAME.unpack_from(self._data, offset)
+            offset += _FRAME.size
+            if frame_type != FRAME_REPEAT:
+                payload = np.frombuffer(zlib.decompress(self._data[offset:offset + length]), dtype=np.uint8)
+                current = payload.copy() if frame_type == FRAME_KEY else np.add(current, payload)
+            offset += length
+            indices = current[:cells].reshape(self.num_rows, self.num_cols)
+            colors = current[cells:].reshape(self.num_rows, self.num_cols, 3) if self.color else None
+            yield frame_number, indices, colors
+            frame_number += 1
+
+    def __iter__(self):
+        for _, indices, colors in self._frames_from(self._first_frame_offset, 0):
+            yield indices, colors
+
+    def read_frame(self, frame_number):
+        if not 0 <= frame_number < self.frame_count:
+            raise IndexError(f"Frame {frame_number} out of range")
+        start, offset = max((entry for entry in self.keyframes if entry[0] <= frame_number),
+                            default=(0, self._first_frame_offset))
+        for number, indices, colors in self._frames_from(offset, start):
+            if number == frame_number:
+                return indices.copy(), None if colors is None else colors.copy()
+        raise ValueError(f"Frame {frame_number} could not be decoded")
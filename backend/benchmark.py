@@ -0,0 +1,357 @@
+"""
+离线基准测试: 在本地生成确定性的合成图片和短视频 (多种分辨率、渐变/噪声、灰度/彩色)，
+按 num_cols、语言、模式、背景的组合运行各个转换器，记录耗时、帧率和峰值内存，结果写入 JSON。
+峰值内存为每个用例单独在 tracemalloc 下运行时 Python 分配 (含 numpy 数组) 的峰值，不含 OpenCV 等在 C 层直接分配的内存。
+可与保存的基线比较，变慢 (或内存增长) 超过阈值的用例视为回归，此时退出码为 1。
+不需要 OSS 和数据库。
+
+仓库中的 benchmark_baseline.json 是以 --quick 记录的基线；耗时与机器有关，在执行比较的机器上先用
+--save_baseline 重新生成后再比较。
+
+用法: python benchmark.py [--quick] [--output benchmark_results.json]
+      python benchmark.py --quick --save_baseline benchmark_baseline.json
+      python benchmark.py --quick --baseline benchmark_baseline.json [--threshold 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import Namespace
+
+import cv2
+import numpy as np
+from PIL import ImageFont
+
+import alphabets
+import img2img
+import img2img_color
+import img2txt
+from ffmpeg_writer import FfmpegVideoWriter
+from utils import sort_chars, LANGUAGE_CONFIG, FONT_DIR
+from video_engine import convert_video
+
+IMAGE_CONVERTERS = ["image_png", "image_text", "image_color", "img2txt"]
+VIDEO_CONVERTERS = ["video_mp4", "video_ascii"]
+ALL_CONVERTERS = IMAGE_CONVERTERS + VIDEO_CONVERTERS + ["sort_chars"]
+
+# 耗时差值低于该值 (秒) 的用例不判定为回归，避免极短用例的计时抖动
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def get_args():
+    parser = argparse.ArgumentParser("ASCII converter benchmarks")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="Path to write results to")
+    parser.add_argument("--baseline", type=str, default=None, help="Results file to compare against")
+    parser.add_argument("--save_baseline", type=str, default=None, help="Also write the results to this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown (wall time) counted as a regression")
+    parser.add_argument("--memory_threshold", type=float, default=0.20,
+                        help="relative growth of traced peak memory counted as a regression")
+    parser.add_argument("--converters", type=str, nargs="*", default=ALL_CONVERTERS, choices=ALL_CONVERTERS)
+    parser.add_argument("--image_sizes", type=str, nargs="*", default=["640x480", "1920x1080"])
+    parser.add_argument("--video_size", type=str, default="640x360")
+    parser.add_argument("--video_seconds", type=float, default=2)
+    parser.add_argument("--video_fps", type=int, default=30)
+    parser.add_argument("--patterns", type=str, nargs="*", default=["gradient", "noise"], choices=["gradient", "noise"])
+    parser.add_argument("--num_cols", type=int, nargs="*", default=[80, 150, 300])
+    parser.add_argument("--languages", type=str, nargs="*", default=["english", "general", "chinese"])
+    parser.add_argument("--modes", type=str, nargs="*", default=None, help="Limit modes (default: all of each language)")
+    parser.add_argument("--backgrounds", type=str, nargs="*", default=["black", "white"], choices=["black", "white"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (the median is reported)")
+    parser.add_argument("--quick", action="store_true", help="small matrix for a fast smoke run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.quick:
+        args.image_sizes = args.image_sizes[:1]
+        args.patterns = args.patterns[:1]
+        args.num_cols = args.num_cols[:1]
+        args.backgrounds = args.backgrounds[:1]
+        args.video_seconds = min(args.video_seconds, 1)
+        args.repeat = 1
+    return args
+
+
+def _parse_size(size):
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+
+# 合成图片 (BGR 或单通道): gradient 为各通道方向不同的平滑渐变加若干圆环，noise 为均匀随机噪声
+# phase 用于生成视频中逐帧变化的画面
+def synthetic_image(width, height, pattern, color=True, seed=0, phase=0.0):
+    if pattern == "noise":
+        rng = np.random.default_rng(seed)
+        image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    else:
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        x /= max(1, width - 1)
+        y /= max(1, height - 1)
+        radius = np.hypot(x - 0.5 - 0.2 * np.sin(phase), y - 0.5)
+        rings = 0.5 + 0.5 * np.cos(radius * 40 - phase * 4)
+        image = np.stack([(x + phase) % 1, (y + phase * 0.5) % 1, rings], axis=2)
+        image = (image * 255).astype(np.uint8)
+    if not color:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def encode_image(image, ext=".jpg"):
+    ok, encoded = cv2.imencode(ext, image, [cv2.IMWRITE_JPEG_QUALITY, 90] if ext == ".jpg" else [])
+    if not ok:
+        raise ValueError("Could not encode synthetic image")
+    return encoded.tobytes()
+
+
+# 合成视频 (不含音轨): 渐变逐帧平移，噪声每帧重新生成 (增量渲染的最坏情况)
+def write_synthetic_video(path, width, height, num_frames, fps, pattern, seed=0):
+    out = FfmpegVideoWriter(path, width, height, fps)
+    try:
+        for i in range(num_frames):
+            out.write(synthetic_image(width, height, pattern, seed=seed + i, phase=i / fps))
+        out.release()
+    except Exception:
+        out.abort()
+        raise
+
+
+# 先预热一次 (字符集、字形图集等缓存)，再计时 repeat 次取中位数，最后在 tracemalloc 下单独运行一次统计峰值内存
+# (tracemalloc 会明显拖慢运行，不与计时混在一起)；func 返回处理的帧数 (图片为 1)
+def measure(func, repeat):
+    frames = func()
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        frames = func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    wall = statistics.median(times)
+    return {
+        "wall_s": round(wall, 5),
+        "wall_min_s": round(min(times), 5),
+        "frames": frames,
+        "fps": round(frames / wall, 3) if wall > 0 else None,
+        "peak_traced_mb": round(peak / (1024 * 1024), 3),
+    }
+
+
+# 可用的 (语言, 模式) 组合: 字体文件不存在的语言跳过
+def charset_combinations(opt):
+    combinations, skipped = [], []
+    for language in opt.languages:
+        if language not in LANGUAGE_CONFIG:
+            skipped.append((language, "unknown language"))
+            continue
+        alphabet_name, font_file = LANGUAGE_CONFIG[language][:2]
+        if not os.path.exists(os.path.join(FONT_DIR, font_file)):
+            skipped.append((language, f"font {font_file} not found"))
+            continue
+        for mode in getattr(alphabets, alphabet_name):
+            if opt.modes is None or mode in opt.modes:
+                combinations.append((language, mode))
+    return combinations, skipped
+
+
+def _image_case(image_bytes, options):
+    def run():
+        if img2img.convert_image_to_output_bytes(image_bytes, options) is None:
+            raise RuntimeError("conversion returned None")
+        return 1
+    return run
+
+
+def _cli_case(module, namespace):
+    def run():
+        module.main(namespace)
+        return 1
+    return run
+
+
+def _video_case(input_path, output_path, options):
+    def run():
+        return convert_video(input_path, output_path, workers=1, **options)["frames"]
+    return run
+
+
+def _sort_chars_case(language, mode):
+    alphabet_name, font_file, font_size = LANGUAGE_CONFIG[language][:3]
+    char_list = getattr(alphabets, alphabet_name)[mode]
+    font = ImageFont.truetype(os.path.join(FONT_DIR, font_file), size=font_size)
+
+    def run():
+        sort_chars(char_list, font, language)
+        return 1
+    return run
+
+
+# 生成 (用例名, 转换器, 参数, 函数) 列表
+def build_cases(opt, work_dir):
+    converters = set(opt.converters)
+    combinations, skipped = charset_combinations(opt)
+    cases = [(f"skipped/{language}", "charset", {"language": language}, reason) for language, reason in skipped]
+
+    for size in opt.image_sizes:
+        width, height = _parse_size(size)
+        for pattern in opt.patterns:
+            for color in (False, True):
+                image = synthetic_image(width, height, pattern, color, seed=opt.seed)
+                image_bytes = encode_image(image)
+                image_path = os.path.join(work_dir, f"image_{size}_{pattern}_{int(color)}.jpg")
+                with open(image_path, "wb") as f:
+                    f.write(image_bytes)
+                source = f"{size}/{pattern}/{'color' if color else 'gray'}"
+                for num_cols in opt.num_cols:
+                    for language, mode in combinations:
+                        for background in opt.backgrounds:
+                            params = {"size": size, "pattern": pattern, "color": color, "num_cols": num_cols,
+                                      "language": language, "mode": mode, "background": background}
+                            suffix = f"{source}/{language}-{mode}/{background}/{num_cols}"
+                            options = {"language": language, "mode": mode, "background": background,
+                                       "num_cols": num_cols}
+                            if "image_png" in converters:
+                                cases.append((f"image_png/{suffix}", "image_png", params,
+                                              _image_case(image_bytes, dict(options, output_format="png"))))
+                            if "image_text" in converters and background == opt.backgrounds[0]:
+                                # 文本输出与背景无关
+                                cases.append((f"image_text/{suffix}", "image_text", params,
+                                              _image_case(image_bytes, dict(options, output_format="text"))))
+                            if "image_color" in converters and color:
+                                namespace = Namespace(input=image_path, output=os.path.join(work_dir, "color_out.png"),
+                                                      scale=1, **options)
+                                cases.append((f"image_color/{suffix}", "image_color", params,
+                                              _cli_case(img2img_color, namespace)))
+                    if "img2txt" in converters:
+                        for mode in ("simple", "complex"):
+                            if opt.modes is not None and mode not in opt.modes:
+                                continue
+                            namespace = Namespace(input=image_path, output=os.path.join(work_dir, "out.txt"),
+                                                  mode=mode, num_cols=num_cols)
+                            cases.append((f"img2txt/{source}/{mode}/{num_cols}", "img2txt",
+                                          {"size": size, "pattern": pattern, "color": color, "mode": mode,
+                                           "num_cols": num_cols},
+                                          _cli_case(img2txt, namespace)))
+
+    video_converters = [name for name in VIDEO_CONVERTERS if name in converters]
+    if video_converters:
+        width, height = _parse_size(opt.video_size)
+        num_frames = max(1, int(opt.video_seconds * opt.video_fps))
+        for pattern in opt.patterns:
+            video_path = os.path.join(work_dir, f"video_{pattern}.mp4")
+            write_synthetic_video(video_path, width, height, num_frames, opt.video_fps, pattern, seed=opt.seed)
+            for converter in video_converters:
+                output_format = "mp4" if converter == "video_mp4" else "ascii"
+                output_path = os.path.join(work_dir, f"video_out.{'mp4' if output_format == 'mp4' else 'asciiv'}")
+                for num_cols in opt.num_cols:
+                    for mode in ("simple", "complex"):
+                        if opt.modes is not None and mode not in opt.modes:
+                            continue
+                        for color in (False, True):
+                            for background in opt.backgrounds:
+                                params = {"size": opt.video_size, "pattern": pattern, "frames": num_frames,
+                                          "num_cols": num_cols, "mode": mode, "color": color,
+                                          "background": background}
+                                options = {"mode": mode, "color": color, "background": background,
+                                           "num_cols": num_cols, "output_format": output_format}
+                                name = (f"{converter}/{opt.video_size}/{pattern}/{mode}/"
+                                        f"{'color' if color else 'gray'}/{background}/{num_cols}")
+                                cases.append((name, converter, params, _video_case(video_path, output_path, options)))
+
+    if "sort_chars" in converters:
+        for language, mode in combinations:
+            # general 字符表已手工排序，sort_chars 不支持
+            if language != "general":
+                cases.append((f"sort_chars/{language}-{mode}", "sort_chars", {"language": language, "mode": mode},
+                              _sort_chars_case(language, mode)))
+    return cases
+
+
+def run_benchmarks(opt):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ascii_benchmark_") as work_dir:
+        cases = build_cases(opt, work_dir)
+        for i, (name, converter, params, func) in enumerate(cases, 1):
+            entry = {"name": name, "converter": converter, "params": params}
+            if isinstance(func, str):
+                entry.update(status="skipped", reason=func)
+            else:
+                try:
+                    entry.update(status="ok", **measure(func, opt.repeat))
+                except Exception as e:
+                    entry.update(status="error", reason=f"{type(e).__name__}: {e}")
+            results.append(entry)
+            summary = (f"{entry['wall_s'] * 1000:9.1f} ms  {entry['fps']:8.2f} fps  {entry['peak_traced_mb']:8.2f} MB"
+                       if entry["status"] == "ok" else f"{entry['status']}: {entry['reason']}")
+            print(f"[{i}/{len(cases)}] {name}  {summary}")
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+        },
+        "settings": {key: value for key, value in vars(opt).items()
+                     if key not in ("output", "baseline", "save_baseline")},
+        "cases": results,
+    }
+
+
+# 与基线逐个比较同名用例，返回回归列表 [(用例名, 指标, 基线值, 当前值, 相对变化)]
+def compare_results(results, baseline, threshold, memory_threshold):
+    baseline_cases = {case["name"]: case for case in baseline.get("cases", []) if case.get("status") == "ok"}
+    regressions = []
+    for case in results["cases"]:
+        base = baseline_cases.get(case["name"])
+        if case["status"] != "ok" or base is None:
+            continue
+        if (base["wall_s"] > 0 and case["wall_s"] > base["wall_s"] * (1 + threshold)
+                and case["wall_s"] - base["wall_s"] > MIN_REGRESSION_SECONDS):
+            regressions.append((case["name"], "wall_s", base["wall_s"], case["wall_s"],
+                                case["wall_s"] / base["wall_s"] - 1))
+        if base["peak_traced_mb"] > 0 and case["peak_traced_mb"] > base["peak_traced_mb"] * (1 + memory_threshold):
+            regressions.append((case["name"], "peak_traced_mb", base["peak_traced_mb"], case["peak_traced_mb"],
+                                case["peak_traced_mb"] / base["peak_traced_mb"] - 1))
+    return regressions
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def main(opt):
+    results = run_benchmarks(opt)
+    _write_json(opt.output, results)
+    print(f"Results written to {opt.output}")
+    if opt.save_baseline:
+        _write_json(opt.save_baseline, results)
+        print(f"Baseline saved to {opt.save_baseline}")
+
+    if not opt.baseline:
+        return 0
+    with open(opt.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare_results(results, baseline, opt.threshold, opt.memory_threshold)
+    compared = sum(1 for case in results["cases"] if case["status"] == "ok")
+    if not regressions:
+        print(f"No regressions against {opt.baseline} ({compared} cases)")
+        return 0
+    print(f"{len(regressions)} regressions against {opt.baseline}:")
+    for name, metric, base, current, change in regressions:
+        print(f"  {name}  {metric}: {base} -> {current} (+{change * 100:.1f}%)")
+    return 1
+
+
+if __name__ == '__main__':
+    opt = get_args()
+    sys.exit(main(opt))
@@ -0,0 +1,92 @@
+"""
+本地的 DashScope 文生图接口替身，用于离线调试 /generate_image_from_text 的完整流程 (创建任务 -> 轮询 -> 下载图片)。
+任务创建后经过 --pending 秒 PENDING、--running 秒 RUNNING 后成功，结果图片由本服务提供；
+提示词中含有 "fail" 的任务以 FAILED 结束；--flaky N 时每 N 次状态查询有一次返回 503，用于检查客户端的重试。
+
+用法: python dashscope_stub.py [--port 8090] [--pending 1] [--running 3]
+      DASHSCOPE_BASE_URL=http://127.0.0.1:8090/api/v1 DASHSCOPE_API_KEY=test python app.py
+"""
+import argparse
+import io
+import time
+import uuid
+
+from flask import Flask, jsonify, request, send_file
+from PIL import Image, ImageDraw
+
+
+def get_args():
+    parser = argparse.ArgumentParser("DashScope stand-in server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--pending", type=float, default=1, help="Seconds a new task stays PENDING")
+    parser.add_argument("--running", type=float, default=3, help="Seconds a task stays RUNNING")
+    parser.add_argument("--flaky", type=int, default=0, help="Answer every Nth status query with 503 (0: never)")
+    args = parser.parse_args()
+    return args
+
+
+def create_app(pending=1.0, running=3.0, flaky=0):
+    app = Flask(__name__)
+    tasks = {}
+    status_queries = [0]
+
+    def task_status(task):
+        elapsed = time.time() - task["created"]
+        if elapsed < pending:
+            return "PENDING"
+        if elapsed < pending + running:
+            return "RUNNING"
+        return "FAILED" if "fail" in task["prompt"] else "SUCCEEDED"
+
+    @app.route("/api/v1/services/aigc/text2image/image-synthesis", methods=["POST"])
+    def create_task():
+        if request.headers.get("X-DashScope-Async") != "enable":
+            return jsonify({"code": "InvalidParameter", "message": "async header required"}), 400
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return jsonify({"code": "InvalidApiKey", "message": "missing api key"}), 401
+        payload = request.get_json(force=True)
+        task_id = str(uuid.uuid4())
+        tasks[task_id] = {"prompt": payload["input"]["prompt"], "created": time.time()}
+        return jsonify({"request_id": str(uuid.uuid4()),
+                        "output": {"task_id": task_id, "task_status": "PENDING"}})
+
+    @app.route("/api/v1/tasks/<task_id>", methods=["GET"])
+    def get_task(task_id):
+        status_queries[0] += 1
+        if flaky and status_queries[0] % flaky == 0:
+            return jsonify({"code": "ServiceUnavailable", "message": "try again later"}), 503
+        task = tasks.get(task_id)
+        if task is None:
+            return jsonify({"request_id": str(uuid.uuid4()),
+                            "output": {"task_id": task_id, "task_status": "UNKNOWN"}})
+        status = task_status(task)
+        output = {"task_id": task_id, "task_status": status}
+        if status == "SUCCEEDED":
+            output["results"] = [{"url": request.host_url + f"images/{task_id}.jpg", "orig_prompt": task["prompt"]}]
+        elif status == "FAILED":
+            output.update(code="DataInspectionFailed", message="Output data may contain inappropriate content.")
+        return jsonify({"request_id": str(uuid.uuid4()), "output": output})
+
+    @app.route("/images/<task_id>.jpg", methods=["GET"])
+    def get_image(task_id):
+        if task_id not in tasks:
+            return "not found", 404
+        image = Image.new("RGB", (256, 256), "white")
+        ImageDraw.Draw(image).text((10, 120), tasks[task_id]["prompt"][:40], fill="black")
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG")
+        buffer.seek(0)
+        return send_file(buffer, mimetype="image/jpeg")
+
+    return app
+
+
+def main(opt):
+    app = create_app(opt.pending, opt.running, opt.flaky)
+    app.run(host=opt.host, port=opt.port, threaded=True)
+
+
+if __name__ == '__main__':
+    opt = get_args()
+    main(opt)
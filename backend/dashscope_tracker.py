@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api import DASHSCOPE_FINAL_STATUSES
+
+# 任务状态查询间隔: 新任务从最短间隔开始，每次仍未完成时乘以 DASHSCOPE_POLL_BACKOFF，直到最长间隔
+DASHSCOPE_POLL_MIN_SECONDS = float(os.environ.get("DASHSCOPE_POLL_MIN_SECONDS", 1))
+DASHSCOPE_POLL_MAX_SECONDS = float(os.environ.get("DASHSCOPE_POLL_MAX_SECONDS", 10))
+DASHSCOPE_POLL_BACKOFF = float(os.environ.get("DASHSCOPE_POLL_BACKOFF", 1.5))
+# 连续查询失败 (网络错误、接口报错) 这么多次后放弃该任务
+DASHSCOPE_POLL_MAX_ERRORS = int(os.environ.get("DASHSCOPE_POLL_MAX_ERRORS", 5))
+# 处理已结束任务 (下载结果、上传 OSS) 的线程数，避免下载阻塞其他任务的查询
+DASHSCOPE_FINISH_WORKERS = int(os.environ.get("DASHSCOPE_FINISH_WORKERS", 2))
+
+
+class _TrackedTask:
+    def __init__(self, task_id, context, interval):
+        self.task_id = task_id
+        self.context = context
+        self.interval = interval
+        self.next_poll = time.monotonic()
+        self.errors = 0
+        self.status = None
+
+
+# 跟踪所有进行中的 DashScope 异步任务: 一个后台线程按各任务的下次查询时间轮流调用 check_status(task_id)，
+# 任务仍在进行时逐步拉长查询间隔；任务结束 (或连续查询失败) 后在线程池中调用
+# on_finish(task_id, context, result, error)，result 为最后一次查询的返回值，error 为放弃查询的原因
+# 任务状态变化时唤醒 wait_for_change() 的调用方 (用于 SSE 推送)
+# maintain() 每隔 maintain_interval 秒在查询线程中调用一次，用于重新跟踪保存结果时中断的任务
+class DashScopeTaskTracker:
+    def __init__(self, check_status, on_finish, min_interval=DASHSCOPE_POLL_MIN_SECONDS,
+                 max_interval=DASHSCOPE_POLL_MAX_SECONDS, backoff=DASHSCOPE_POLL_BACKOFF,
+                 max_errors=DASHSCOPE_POLL_MAX_ERRORS, finish_workers=DASHSCOPE_FINISH_WORKERS,
+                 maintain=None, maintain_interval=30.0):
+        self.check_status = check_status
+        self.on_finish = on_finish
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self.maintain = maintain
+        self.maintain_interval = maintain_interval
+        self._next_maintain = 0.0
+        self._tasks = {}
+        self._condition = threading.Condition()
+        self._changed = threading.Condition()
+        self._version = 0
+        self._executor = ThreadPoolExecutor(max_workers=finish_workers, thread_name_prefix="dashscope-finish")
+        self._thread = None
+        self._stopping = False
+
+    # 启动查询线程 (重复调用无效)
+    def start(self):
+        with self._condition:
+            if self._thread is None:
+                self._stopping = False
+                self._next_maintain = time.monotonic() + self.maintain_interval
+                self._thread = threading.Thread(target=self._loop, name="dashscope-tracker", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown(wait=True)
+
+    # 开始跟踪一个任务，已在跟踪的任务不重复添加
+    def track(self, task_id, context=None):
+        with self._condition:
+            if task_id not in self._tasks:
+                self._tasks[task_id] = _TrackedTask(task_id, context, self.min_interval)
+                self._condition.notify_all()
+
+    def is_tracking(self, task_id):
+        with self._condition:
+            return task_id in self._tasks
+
+    # 最近一次查询到的 DashScope 状态 (PENDING / RUNNING ...)，未在跟踪时返回 None
+    def status(self, task_id):
+        with self._condition:
+            task = self._tasks.get(task_id)
+            return task.status if task else None
+
+    @property
+    def pending(self):
+        with self._condition:
+            return len(self._tasks)
+
+    # 等待任意任务的状态发生变化，返回新的版本号；version 为上次返回的值，超时返回当前版本号
+    def wait_for_change(self, version, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    @property
+    def version(self):
+        with self._changed:
+            return self._version
+
+    def notify_change(self):
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    # 等待到有任务需要查询或需要调用 maintain()，返回 (需要查询的任务, 是否调用 maintain)；停止时返回 (None, False)
+    def _due_tasks(self):
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                due = [task for task in self._tasks.values() if task.next_poll <= now]
+                maintain_due = self.maintain is not None and self._next_maintain <= now
+                if due or maintain_due:
+                    return due, maintain_due
+                wake_times = [task.next_poll for task in self._tasks.values()]
+                if self.maintain is not None:
+                    wake_times.append(self._next_maintain)
+                self._condition.wait(min(wake_times) - now if wake_times else None)
+            return None, False
+
+    def _run_maintain(self):
+        self._next_maintain = time.monotonic() + self.maintain_interval
+        try:
+            self.maintain()
+        except Exception as e:
+            print(f"DashScope tracker: maintenance failed: {e}")
+
+    def _finish(self, task, result, error):
+        with self._condition:
+            self._tasks.pop(task.task_id, None)
+        self._executor.submit(self._run_finish, task, result, error)
+
+    def _run_finish(self, task, result, error):
+        try:
+            self.on_finish(task.task_id, task.context, result, error)
+        except Exception as e:
+            print(f"DashScope task {task.task_id}: finish handler failed: {e}")
+        finally:
+            self.notify_change()
+
+    def _poll(self, task):
+        try:
+            result = self.check_status(task.task_id)
+            status = result["output"]["task_status"]
+        except Exception as e:
+            task.errors += 1
+            print(f"DashScope task {task.task_id}: status check failed ({task.errors}/{self.max_errors}): {e}")
+            if task.errors >= self.max_errors:
+                self._finish(task, None, str(e))
+                return
+        else:
+            task.errors = 0
+            if status in DASHSCOPE_FINAL_STATUSES:
+                task.status = status
+                self._finish(task, result, None)
+                return
+            if status != task.status:
+                task.status = status
+                self.notify_change()
+        task.next_poll = time.monotonic() + task.interval
+        task.interval = min(task.interval * self.backoff, self.max_interval)
+
+    def _loop(self):
+        while True:
+            due, maintain_due = self._due_tasks()
+            if due is None:
+                return
+            if maintain_due:
+                self._run_maintain()
+            for task in due:
+                self._poll(task)
@@ -0,0 +1,96 @@
+"""
+预先计算每个字符表中各字形的真实墨迹覆盖率，写入 density_tables/ 目录，
+运行时只读取这些表来排序字符，不再临时渲染整行文字进行测量。
+
+用法: python density_tables.py [--output_dir density_tables] [--sizes 10 20]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+DENSITY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "density_tables")
+
+
+def get_args():
+    parser = argparse.ArgumentParser("Build glyph density tables")
+    parser.add_argument("--output_dir", type=str, default=DENSITY_DIR, help="Directory to write tables to")
+    parser.add_argument("--sizes", type=int, nargs="*", default=None,
+                        help="Font sizes to build (default: each language's own size)")
+    args = parser.parse_args()
+    return args
+
+
+def density_table_key(alphabet_name, mode, font_file, font_size):
+    font_name = os.path.splitext(os.path.basename(font_file))[0]
+    return f"{alphabet_name.lower()}_{mode}_{font_name}_{font_size}"
+
+
+# 每个字形单独渲染在同一尺寸的格子里 (宽为样例字符宽度，高为字体的 ascent + descent)，返回墨迹覆盖率 (0-1)
+def measure_glyph_coverage(char_list, font, sample_character):
+    left, _, right, _ = font.getbbox(sample_character)
+    ascent, descent = font.getmetrics()
+    cell_area = max(right - left, 1) * max(ascent + descent, 1)
+    coverage = []
+    for char in char_list:
+        box = font.getbbox(char)
+        x0, y0 = min(box[0], 0), min(box[1], 0)
+        glyph = Image.new("L", (max(box[2] - x0, 1), max(box[3] - y0, 1)), 0)
+        ImageDraw.Draw(glyph).text((-x0, -y0), char, fill=255, font=font)
+        coverage.append(float(np.asarray(glyph, dtype=np.float64).sum() / (255.0 * cell_area)))
+    return coverage
+
+
+def write_density_table(path, char_list, coverage):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"chars": char_list, "coverage": [round(value, 5) for value in coverage]},
+                  f, ensure_ascii=False, separators=(",", ":"))
+
+
+# 读取目录下的全部密度表，返回 {key: {"chars": str, "coverage": list}}
+def load_density_tables(directory=DENSITY_DIR):
+    tables = {}
+    if not os.path.isdir(directory):
+        return tables
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                tables[name[:-len(".json")]] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取密度表 {name} 失败: {e}")
+    return tables
+
+
+def main(opt):
+    import alphabets
+    from utils import LANGUAGE_CONFIG, FONT_DIR
+
+    os.makedirs(opt.output_dir, exist_ok=True)
+    built = set()
+    for language, (alphabet_name, font_file, default_size, sample_character, _) in LANGUAGE_CONFIG.items():
+        # general 字符表本身已按亮度手工排好序，运行时不排序
+        if language == "general":
+            continue
+        font_path = os.path.join(FONT_DIR, font_file)
+        if not os.path.exists(font_path):
+            print(f"跳过 {language}: 字体文件不存在 {font_path}")
+            continue
+        for font_size in (opt.sizes or [default_size]):
+            font = ImageFont.truetype(font_path, size=font_size)
+            for mode, char_list in getattr(alphabets, alphabet_name).items():
+                key = density_table_key(alphabet_name, mode, font_file, font_size)
+                if key in built:
+                    continue
+                coverage = measure_glyph_coverage(char_list, font, sample_character)
+                write_density_table(os.path.join(opt.output_dir, key + ".json"), char_list, coverage)
+                built.add(key)
+                print(f"已生成 {key}: {len(char_list)} 个字符")
+
+
+if __name__ == '__main__':
+    opt = get_args()
+    main(opt)
@@ -0,0 +1,213 @@
+import os
+import re
+import subprocess
+import tempfile
+
+import numpy as np
+import imageio_ffmpeg
+
+# 可以直接复制进 MP4 容器的音频编码，其他编码 (如 pcm) 需要重新编码为 AAC
+MP4_COPYABLE_AUDIO_CODECS = {"aac", "mp3", "alac", "opus", "ac3", "eac3", "flac"}
+
+# HLS 输出每个分段的目标时长 (秒)，关键帧按这一间隔强制插入，保证每段都能独立解码
+HLS_SEGMENT_SECONDS = float(os.environ.get("ASCII_HLS_SEGMENT_SECONDS", 2))
+HLS_INIT_FILENAME = "init.mp4"
+
+
+def get_ffmpeg_exe():
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+# 返回源文件第一条音轨的编码名称，没有音轨时返回 None
+def probe_audio_codec(path):
+    result = subprocess.run([get_ffmpeg_exe(), "-hide_banner", "-i", path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    match = re.search(r"Stream #\d+:\d+.*?: Audio: (\w+)", result.stderr.decode(errors="ignore"))
+    return match.group(1) if match else None
+
+
+# 以第二个输入的形式加入 audio_source 的音轨: 可以直接放进 MP4 的编码流复制，否则转为 AAC；没有音轨时不输出音频
+# copyable_codecs 为允许直接复制的编码集合
+def _audio_input_args(audio_source, copyable_codecs=MP4_COPYABLE_AUDIO_CODECS):
+    audio_codec = probe_audio_codec(audio_source) if audio_source else None
+    if not audio_codec:
+        return ["-an"]
+    return ["-i", audio_source, "-map", "0:v:0", "-map", "1:a:0",
+            "-c:a", "copy" if audio_codec in copyable_codecs else "aac", "-shortest"]
+
+
+# 通过管道把原始帧直接送入一次 ffmpeg H.264 编码，同时从 audio_source 复制音轨
+# 接口与 cv2.VideoWriter 一致 (write / release / isOpened)，不再产生临时 AVI 文件
+# output_path 以 .m3u8 结尾时输出 HLS: 同目录下的 fMP4 分段在编码过程中逐个完成，播放列表随之增长 (EVENT 类型)
+class FfmpegVideoWriter:
+    def __init__(self, output_path, width, height, fps, audio_source=None, codec="libx264",
+                 pix_fmt="bgr24", preset="veryfast", crf=23):
+        self.output_path = output_path
+        self.width = int(width)
+        self.height = int(height)
+        self.channels = 1 if pix_fmt == "gray" else 3
+        self._stderr = tempfile.TemporaryFile()
+
+        command = [get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{self.width}x{self.height}",
+                   "-r", f"{fps:g}", "-i", "-"]
+        hls = output_path.endswith(".m3u8")
+        # 浏览器 (MediaSource) 播放 HLS 时只保证支持 AAC 音轨
+        command += _audio_input_args(audio_source, {"aac"} if hls else MP4_COPYABLE_AUDIO_CODECS)
+        # yuv420p 要求宽高为偶数，奇数尺寸时在右侧/底部补一像素
+        command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", codec, "-pix_fmt", "yuv420p"]
+        if codec == "libx264":
+            command += ["-preset", preset, "-crf", str(crf)]
+        if hls:
+            segment_pattern = os.path.join(os.path.dirname(os.path.abspath(output_path)), "segment_%05d.m4s")
+            command += ["-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS:g})",
+                        "-f", "hls", "-hls_time", f"{HLS_SEGMENT_SECONDS:g}", "-hls_playlist_type", "event",
+                        "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", HLS_INIT_FILENAME,
+                        "-hls_segment_filename", segment_pattern,
+                        "-hls_flags", "independent_segments+temp_file", output_path]
+        else:
+            # moov 放在文件开头，按范围请求播放时无需先下载整个文件
+            command += ["-movflags", "+faststart", output_path]
+
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _error_output(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="ignore").strip()
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        expected = (self.height, self.width) if self.channels == 1 else (self.height, self.width, self.channels)
+        if frame.shape != expected:
+            raise ValueError(f"Frame shape {frame.shape} does not match writer size {expected}")
+        try:
+            self.process.stdin.write(frame.data)
+        except (BrokenPipeError, OSError) as e:
+            raise IOError(f"ffmpeg encoder exited unexpectedly: {self._error_output() or e}")
+
+    # 关闭管道并等待编码完成，编码失败时抛出 IOError
+    def release(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self.process.wait()
+        self.process = None
+        error_output = self._error_output()
+        self._stderr.close()
+        if returncode != 0:
+            raise IOError(f"ffmpeg encoding failed ({returncode}): {error_output}")
+
+    # 出错时终止编码进程，不等待输出文件完成
+    def abort(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+        self._stderr.close()
+
+
+# 通过管道从 ffmpeg 读取解码后的原始帧，接口与 cv2.VideoCapture 一致 (read / release / isOpened)
+# 帧率抽样和缩放都在解码进程内完成: fps 指定时由 fps 滤镜丢帧，被丢弃的帧不做缩放和格式转换，也不经过管道；
+# 输出帧直接缩放到 width x height (区域插值)，像素格式为 pix_fmt (bgr24 或 gray)
+# start_time 为起始时间 (秒)，max_frames 为最多输出的帧数
+class FfmpegVideoReader:
+    def __init__(self, input_path, width, height, fps=None, pix_fmt="bgr24", start_time=0, max_frames=None):
+        self.width = int(width)
+        self.height = int(height)
+        self.frame_shape = (self.height, self.width) if pix_fmt == "gray" else (self.height, self.width, 3)
+        self.frame_size = int(np.prod(self.frame_shape))
+        self._stderr = tempfile.TemporaryFile()
+
+        command = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if start_time > 0:
+            command += ["-ss", f"{start_time:.6f}"]
+        command += ["-i", input_path, "-map", "0:v:0"]
+        filters = [f"fps={fps:g}"] if fps else []
+        filters.append(f"scale={self.width}:{self.height}:flags=area")
+        command += ["-vf", ",".join(filters)]
+        if max_frames is not None:
+            command += ["-frames:v", str(int(max_frames))]
+        # 原样输出解码 (或 fps 滤镜) 得到的帧，不按恒定帧率补帧
+        command += ["-fps_mode", "passthrough", "-pix_fmt", pix_fmt, "-f", "rawvideo", "-"]
+
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self._stderr)
+
+    def isOpened(self):
+        return self.process is not None
+
+    def error_output(self):
+        if self._stderr.closed:
+            return ""
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="ignore").strip()
+
+    # 读取下一帧，image 为形状匹配的缓冲区时直接读入其中；读到结尾时返回 (False, None)
+    def read(self, image=None):
+        if self.process is None:
+            return False, None
+        if image is None or image.shape != self.frame_shape or not image.flags.c_contiguous:
+            image = np.empty(self.frame_shape, dtype=np.uint8)
+        view = memoryview(image).cast("B")
+        filled = 0
+        while filled < self.frame_size:
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                return False, None
+            filled += count
+        return True, image
+
+    # 不必读完所有帧，直接结束解码进程
+    def release(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+        self.process = None
+        self._stderr.close()
+
+
+# 视频流中关键帧的时间戳 (秒)，只解码关键帧，速度很快；探测失败时返回空列表
+def probe_keyframe_times(path):
+    result = subprocess.run([get_ffmpeg_exe(), "-hide_banner", "-skip_frame", "nokey", "-i", path,
+                             "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return [float(value) for value in re.findall(r"pts_time:([-\d.]+)", result.stderr.decode(errors="ignore"))]
+
+
+# 用 concat demuxer 无损拼接各段 (流复制，不重新编码)，并从 audio_source 复制音轨
+# 各段必须由相同参数的编码器生成 (尺寸、帧率、编码器一致)
+def concat_segments(segment_paths, output_path, audio_source=None, work_dir=None):
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", dir=work_dir, delete=False, encoding="utf-8") as list_file:
+        for path in segment_paths:
+            escaped = path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+        list_path = list_file.name
+
+    command = [get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path]
+    command += _audio_input_args(audio_source)
+    command += ["-c:v", "copy", "-movflags", "+faststart", output_path]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        os.unlink(list_path)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg concat failed ({result.returncode}): {result.stderr.decode(errors='ignore').strip()}")
+
+
+# 把 HLS 分段无损重新封装为一个 MP4 (moov 在文件开头)
+def remux_hls_to_mp4(playlist_path, output_path):
+    command = [get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error", "-i", playlist_path,
+               "-c", "copy", "-movflags", "+faststart", output_path]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg remux failed ({result.returncode}): {result.stderr.decode(errors='ignore').strip()}")
@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+
+# 计算网格边界，与原先逐格循环中的 int(i * cell_size) / min(int((i + 1) * cell_size), length) 完全一致
+def cell_edges(length, cell_size, count):
+    edges = (np.arange(count + 1) * cell_size).astype(np.int64)
+    return np.minimum(edges, length)
+
+
+# 一次性对所有格子求像素和，返回 (sums, counts)
+# image 可以是灰度 (H, W) 或多通道 (H, W, C)，sums 的形状为 (rows, cols) 或 (rows, cols, C)
+# 边界数组不必从 0 开始，可以只覆盖图像中的一段 (用于分块处理)
+def reduce_cells(image, row_edges, col_edges):
+    row_sizes = np.diff(row_edges)
+    col_sizes = np.diff(col_edges)
+    counts = row_sizes[:, None] * col_sizes[None, :]
+
+    row_first, col_first = int(row_edges[0]), int(col_edges[0])
+    region = image[row_first:int(row_edges[-1]), col_first:int(col_edges[-1])]
+    if region.dtype == np.uint8 and region.size and (region.ndim == 2 or region.shape[2] <= 4):
+        # 积分图: 每个格子的和只需四次查表，空格子自然为 0；像素和可能超出 int32 时改用 float64 (整数值仍精确)
+        sdepth = cv2.CV_32S if region.size * 255 < 2 ** 31 else cv2.CV_64F
+        integral = cv2.integral(np.ascontiguousarray(region), sdepth=sdepth)
+        corners = integral[row_edges - row_first][:, col_edges - col_first].astype(np.int64)
+        sums = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return sums, counts
+
+    # reduceat 的起点必须在数组范围内，空格子单独置零
+    region = image[row_first:max(int(row_edges[-1]), row_first + 1), col_first:max(int(col_edges[-1]), col_first + 1)]
+    row_starts = np.minimum(row_edges[:-1] - row_first, region.shape[0] - 1)
+    col_starts = np.minimum(col_edges[:-1] - col_first, region.shape[1] - 1)
+    # 整数图像用整数累加 (精确)，浮点图像用 float64 累加，不能截断小数部分
+    sums = np.add.reduceat(region, row_starts, axis=0, dtype=np.uint64 if region.dtype.kind in "bu" else np.float64)
+    sums = np.add.reduceat(sums, col_starts, axis=1)
+
+    empty = counts == 0
+    if empty.any():
+        sums[empty] = 0
+    return sums, counts
+
+
+# 每个格子的平均值 (float64)，空格子为 0
+# row_start / row_stop 指定只计算其中若干行格子
+def cell_means(image, num_rows, num_cols, cell_height, cell_width, row_start=0, row_stop=None):
+    height, width = image.shape[:2]
+    row_stop = num_rows if row_stop is None else row_stop
+    row_edges = cell_edges(height, cell_height, num_rows)[row_start:row_stop + 1]
+    col_edges = cell_edges(width, cell_width, num_cols)
+    sums, counts = reduce_cells(image, row_edges, col_edges)
+    counts = np.maximum(counts, 1)
+    if sums.ndim == 3:
+        counts = counts[:, :, None]
+    return sums / counts
+
+
+# 将亮度矩阵 (格子平均值，浮点) 映射为字符下标矩阵，与原先逐格的 min(int(mean * num_chars / 255), num_chars - 1) 一致
+# 直接由浮点平均值计算，不先取整为 uint8 (取整会改变落在相邻区间边界附近的格子所选的字符)
+def intensity_to_indices(intensity, num_chars):
+    return np.minimum((np.maximum(intensity, 0) * num_chars / 255).astype(np.intp), num_chars - 1)
+
+
+# 便捷函数: 直接得到 (rows, cols) 的字符下标矩阵
+# 多通道图像按所有通道的平均亮度取字符，与原先对整个切片 np.mean 的做法一致
+def char_index_grid(image, num_rows, num_cols, cell_height, cell_width, num_chars, row_start=0, row_stop=None):
+    means = cell_means(image, num_rows, num_cols, cell_height, cell_width, row_start, row_stop)
+    if means.ndim == 3:
+        means = means.mean(axis=2)
+    return intensity_to_indices(means, num_chars)
@@ -0,0 +1,117 @@
+import io
+import os
+import re
+import threading
+
+from ffmpeg_writer import HLS_SEGMENT_SECONDS
+
+HLS_PLAYLIST_FILENAME = "index.m3u8"
+HLS_PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+# 检查本地播放列表是否更新的间隔 (秒)
+HLS_POLL_INTERVAL = float(os.environ.get("ASCII_HLS_POLL_INTERVAL", 0.5))
+
+_CONTENT_TYPES = {".mp4": "video/mp4", ".m4s": "video/iso.segment"}
+_MAP_URI = re.compile(r'#EXT-X-MAP:.*URI="([^"]+)"')
+
+
+# 还没有分段的空播放列表，播放器会按 EVENT 类型持续刷新直到出现分段
+def empty_playlist():
+    return ("#EXTM3U\n#EXT-X-VERSION:7\n"
+            f"#EXT-X-TARGETDURATION:{max(1, round(HLS_SEGMENT_SECONDS))}\n"
+            "#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:EVENT\n")
+
+
+# 播放列表引用的文件 (初始化分段 + 媒体分段)，按播放顺序排列
+def _playlist_files(text):
+    files = []
+    for line in text.splitlines():
+        line = line.strip()
+        match = _MAP_URI.match(line)
+        if match:
+            files.append(match.group(1))
+        elif line and not line.startswith("#"):
+            files.append(line)
+    return files
+
+
+# 把 ffmpeg 正在写入的 HLS 目录逐段发布出去: 后台线程轮询本地播放列表，
+# 先上传其中新出现的分段 (ffmpeg 写完一段后才会把它加入播放列表)，再上传更新后的播放列表，
+# 因此远端播放列表引用的分段总是已经存在
+# upload(name, data_stream, content_type, cache_control) 把文件上传到与播放列表相同的目录并返回其 URL
+class HlsPublisher:
+    def __init__(self, playlist_path, upload, poll_interval=HLS_POLL_INTERVAL):
+        self.playlist_path = playlist_path
+        self.work_dir = os.path.dirname(os.path.abspath(playlist_path))
+        self.playlist_name = os.path.basename(playlist_path)
+        self.upload = upload
+        self.poll_interval = poll_interval
+        self.playlist_url = None
+        self.published_segments = 0
+        self.errors = []
+        self._uploaded = set()
+        self._last_playlist = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _upload_playlist(self, text):
+        url = self.upload(self.playlist_name, io.BytesIO(text.encode("utf-8")), HLS_PLAYLIST_CONTENT_TYPE, "no-cache")
+        self._last_playlist = text
+        return url
+
+    def _publish(self):
+        with self._lock:
+            if not os.path.exists(self.playlist_path):
+                return
+            with open(self.playlist_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            if text == self._last_playlist or not text.startswith("#EXTM3U"):
+                return
+            for name in _playlist_files(text):
+                if name in self._uploaded:
+                    continue
+                content_type = _CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+                with open(os.path.join(self.work_dir, name), "rb") as f:
+                    self.upload(name, f, content_type, None)
+                self._uploaded.add(name)
+                if name.endswith(".m4s"):
+                    self.published_segments += 1
+            self._upload_playlist(text)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._publish()
+            except Exception as e:
+                # 单次上传失败时保留已发布的内容，下一轮重试
+                self.errors.append(str(e))
+                print(f"HLS publish failed: {e}")
+
+    # 先发布一个空播放列表 (重试时覆盖上次未完成的播放列表)，返回播放列表 URL
+    def start(self):
+        self.playlist_url = self._upload_playlist(empty_playlist())
+        self._thread = threading.Thread(target=self._run, name="hls-publisher", daemon=True)
+        self._thread.start()
+        return self.playlist_url
+
+    def _stop_thread(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # 编码完成后调用: 发布剩余分段和带 #EXT-X-ENDLIST 的最终播放列表
+    def finish(self):
+        self._stop_thread()
+        self._publish()
+
+    # 转换失败时结束播放列表，避免播放器一直等待新的分段
+    def abort(self):
+        self._stop_thread()
+        with self._lock:
+            if self._last_playlist is not None and "#EXT-X-ENDLIST" not in self._last_playlist:
+                try:
+                    self._upload_playlist(self._last_playlist.rstrip("\n") + "\n#EXT-X-ENDLIST\n")
+                except Exception as e:
+                    print(f"Could not close HLS playlist: {e}")
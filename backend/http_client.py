@@ -0,0 +1,79 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 外部 HTTP 调用 (DashScope 接口、下载生成结果) 共用的客户端设置
+# 连接超时和读取超时 (秒): 读取超时是两次收到数据之间的最长间隔，不是整个请求的时长
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+# 遇到连接错误或 429/5xx 时的最多重试次数，第 n 次重试前等待 backoff * 2^(n-1) 秒 (服务端给出 Retry-After 时以其为准)
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", 0.5))
+HTTP_RETRY_BACKOFF_MAX = float(os.environ.get("HTTP_RETRY_BACKOFF_MAX", 10))
+# 每个主机保持的长连接数，应不少于同时发起请求的线程数
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
+# 流式下载时每次读取的字节数
+HTTP_CHUNK_SIZE = int(os.environ.get("HTTP_CHUNK_SIZE", 256 * 1024))
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+# 重试策略: GET 等幂等请求在 429/5xx 和读取超时时重试；POST (创建任务) 只在 429 时重试，
+# 5xx 时服务端可能已经创建了任务，重试会产生重复任务；连接失败时请求还没有发出，任何方法都可以重试
+class _RetryPolicy(Retry):
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == "POST" and status_code == 429:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# 未指定 timeout 的请求使用默认的连接/读取超时，避免卡住的连接一直占用工作线程
+class _TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+def _create_session():
+    retry = _RetryPolicy(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        backoff_max=HTTP_RETRY_BACKOFF_MAX,
+        status_forcelist=RETRY_STATUS_CODES,
+        # 重试用完后返回最后一次的响应，由调用方按状态码报错
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = _TimeoutSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# 进程内共享的 Session: 复用 TLS 连接 (keep-alive)；fork 出的子进程重新创建，不与父进程共用连接
+def get_session():
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _create_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+# 流式下载: 返回 (响应, 分块迭代器)，内容按块读取，不整体缓存在内存中；调用方用完后关闭响应
+def open_download(url, chunk_size=HTTP_CHUNK_SIZE):
+    response = get_session().get(url, stream=True)
+    if response.status_code != 200:
+        response.close()
+        raise Exception(f"下载失败: {url} 状态码 {response.status_code}")
+    return response, response.iter_content(chunk_size)
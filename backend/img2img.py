@@ -1,8 +1,17 @@
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageOps
-from utils import get_data 
+from PIL import Image, ImageOps
+from utils import get_charset
+from grid import char_index_grid, cell_means, intensity_to_indices
+from ascii_formats import TEXT_OUTPUT_FORMATS, grid_to_text, grid_to_ansi, grid_to_html
+from png_stream import PngStreamWriter
+from timing import stage
 import io
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # 默认 ASCII 处理选项
 DEFAULT_ASCII_OPTIONS = {
@@ -10,162 +19,267 @@ DEFAULT_ASCII_OPTIONS = {
     "mode": "standard",
     "background": "black",  
     "num_cols": 150,        
+    "output_format": "png", # png / text / ansi / html
 }
 
-def convert_image_to_ascii_art(image_bytes_io, options=None):
-    current_options = DEFAULT_ASCII_OPTIONS.copy()
-    if options:
-        current_options.update(options)
+# 与 cv2.COLOR_BGR2GRAY 相同的亮度权重 (B, G, R)
+BGR_LUMA_WEIGHTS = np.array([0.114, 0.587, 0.299])
+
+# 缩小解码时，每个字符格子在宽度方向上至少保留的像素数
+MIN_DECODE_PIXELS_PER_CELL = 4
+
+# JPEG 可在 DCT 域直接按 1/2、1/4、1/8 缩小解码，并直接输出灰度图
+REDUCED_GRAYSCALE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# 解码出的图像最多这么多像素 (灰度每像素 1 字节，彩色 3 字节)，限制单张图片解码占用的内存
+MAX_DECODE_PIXELS = int(os.environ.get("ASCII_MAX_DECODE_PIXELS", 50_000_000))
+
 
+# 图片在像素上限内无法解码
+class ImageTooLargeError(ValueError):
+    pass
+
+
+# 只读取文件头获取原图尺寸 (已考虑 EXIF 旋转)，无法识别时返回 None
+# Pillow 视为解压炸弹的图片 (超过约 1.8 亿像素) 不返回尺寸，抛出 ImageTooLargeError
+def probe_image_size(image_bytes):
     try:
-        bg_code = 255 if current_options["background"] == "white" else 0
-
-        char_list, font, sample_character, scale = get_data(current_options["language"], current_options["mode"])
-        num_chars = len(char_list)
-        num_cols = current_options["num_cols"]
-
-        image_bytes_io.seek(0)
-        image_np_array = np.frombuffer(image_bytes_io.read(), np.uint8)
-        # 先尝试以彩色模式解码，然后转灰度，以处理不同类型的输入图片
-        cv_image = cv2.imdecode(image_np_array, cv2.IMREAD_COLOR)
-        if cv_image is None:
-            # 如果彩色解码失败，尝试灰度解码 (某些单通道图可能需要)
-            cv_image = cv2.imdecode(image_np_array, cv2.IMREAD_GRAYSCALE)
-            if cv_image is None:
-                print("错误: OpenCV 无法从 BytesIO 解码图片。") # 应替换为 app.logger.error
-                return None
-        
-        # 如果图像不是灰度图，则转换
-        if len(cv_image.shape) == 3 and cv_image.shape[2] == 3: # BGR
-            image_gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-        elif len(cv_image.shape) == 3 and cv_image.shape[2] == 4: # BGRA
-            image_gray = cv2.cvtColor(cv_image, cv2.COLOR_BGRA2GRAY)
-        elif len(cv_image.shape) == 2: # Already Grayscale
-             image_gray = cv_image
-        else:
-            print(f"错误: 不支持的图片通道数: {cv_image.shape}")
-            return None
-            
-        height, width = image_gray.shape
+        with Image.open(io.BytesIO(image_bytes)) as probe:
+            width, height = probe.size
+            orientation = probe.getexif().get(0x0112, 1)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"图片尺寸过大: {e}")
+    except Exception:
+        return None
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return width, height
+
+
+# 选择解码时的缩小倍数，返回 (倍数, 原图宽, 原图高)，无法识别文件头时返回 None
+# 先按目标列数选择保证每个格子采样像素的最大倍数；只有 JPEG 能在解码时直接缩小 (其他格式按原尺寸解码后再缩小)，
+# JPEG 超出像素上限时继续加大倍数，仍超出 (或其他格式原尺寸超出) 时抛出 ImageTooLargeError
+def plan_image_decode(image_bytes, num_cols, max_pixels=None):
+    max_pixels = MAX_DECODE_PIXELS if max_pixels is None else max_pixels
+    size = probe_image_size(image_bytes)
+    if size is None:
+        return None
+    width, height = size
+    factor = 1
+    if num_cols > 0:
+        factor = next((f for f, _ in REDUCED_GRAYSCALE_FLAGS if width / f >= num_cols * MIN_DECODE_PIXELS_PER_CELL), 1)
+    decoded_pixels = width * height
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        while factor < 8 and -(-width // factor) * -(-height // factor) > max_pixels:
+            factor *= 2
+        decoded_pixels = -(-width // factor) * -(-height // factor)
+    if decoded_pixels > max_pixels:
+        raise ImageTooLargeError(f"图片尺寸 {width}x{height} 过大，解码后超过 {max_pixels} 像素的上限")
+    return factor, width, height
 
-        if width == 0 or height == 0:
-            print("错误: 图片宽度或高度为0。")
+
+# 按 plan_image_decode 选择的倍数缩小解码，直接解码为灰度图 (color=True 时解码为 BGR 彩色图)
+# 返回 (图像, 原图宽, 原图高)，解码失败返回 None；超出像素上限时抛出 ImageTooLargeError
+def decode_image_for_grid(image_bytes, num_cols, color=False, max_pixels=None):
+    max_pixels = MAX_DECODE_PIXELS if max_pixels is None else max_pixels
+    image_np_array = np.frombuffer(image_bytes, np.uint8)
+    plan = plan_image_decode(image_bytes, num_cols, max_pixels)
+    if plan is not None and plan[0] > 1:
+        factor, width, height = plan
+        image = cv2.imdecode(image_np_array, dict(REDUCED_COLOR_FLAGS if color else REDUCED_GRAYSCALE_FLAGS)[factor])
+        if image is not None and image.size > 0:
+            return image, width, height
+        # 缩小解码失败时只有原尺寸也在上限内才改为完整解码
+        if width * height > max_pixels:
             return None
 
-        cell_width = width / num_cols
-        # 确保 cell_height > 0，scale 也不能是0
-        if scale == 0: scale = 1 # 防止 scale 为0
-        cell_height = scale * cell_width
-        
-        if cell_width <= 0 or cell_height <= 0:
-            print(f"错误: 计算得到的 cell_width ({cell_width}) 或 cell_height ({cell_height}) 无效。")
-            # 尝试调整 num_cols
-            if width > 10: # 至少图片要有点宽度
-                num_cols = width // 2 # 至少每个 cell 2个像素宽
-                if num_cols == 0: num_cols = 1
-                cell_width = width / num_cols
-                cell_height = scale * cell_width
-                if cell_width <= 0 or cell_height <= 0:
-                    print("错误: 调整后 cell_width 或 cell_height 仍然无效。")
-                    return None
-            else:
-                print("错误: 图片太小，无法进行有意义的 cell 划分。")
-                return None
+    image = cv2.imdecode(image_np_array, cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    return image, width, height
 
 
-        num_rows = int(height / cell_height)
+# 计算字符网格布局，返回 (num_cols, num_rows, cell_width, cell_height)，无法划分时返回 None
+def compute_grid_layout(width, height, num_cols, scale):
+    if width == 0 or height == 0:
+        print("错误: 图片宽度或高度为0。")
+        return None
 
-        if num_cols > width or num_rows > height or num_rows <= 0:
-            print(f"警告: 列数({num_cols})或行数({num_rows})设置可能不合理。原始尺寸: {width}x{height}。")
-            # 尝试基于宽度调整 num_cols
-            if num_cols > width and width > 0 :
-                num_cols = max(1, width // 2) # 保证 cell_width 至少为2，且 num_cols 至少为1
-            
+    cell_width = width / num_cols
+    # 确保 cell_height > 0，scale 也不能是0
+    if scale == 0: scale = 1 # 防止 scale 为0
+    cell_height = scale * cell_width
+    
+    if cell_width <= 0 or cell_height <= 0:
+        print(f"错误: 计算得到的 cell_width ({cell_width}) 或 cell_height ({cell_height}) 无效。")
+        # 尝试调整 num_cols
+        if width > 10: # 至少图片要有点宽度
+            num_cols = width // 2 # 至少每个 cell 2个像素宽
+            if num_cols == 0: num_cols = 1
             cell_width = width / num_cols
             cell_height = scale * cell_width
-            if cell_height <=0 :
-                print("错误: 调整后 cell_height 仍然无效。")
+            if cell_width <= 0 or cell_height <= 0:
+                print("错误: 调整后 cell_width 或 cell_height 仍然无效。")
                 return None
-            num_rows = int(height / cell_height)
-            
-            if num_rows <= 0 or num_cols <= 0:
-                print(f"错误: 调整后无法确定有效的行数({num_rows})或列数({num_cols})。")
-                return None
-            print(f"调整后: num_cols={num_cols}, num_rows={num_rows}")
+        else:
+            print("错误: 图片太小，无法进行有意义的 cell 划分。")
+            return None
+
+
+    num_rows = int(height / cell_height)
+
+    if num_cols > width or num_rows > height or num_rows <= 0:
+        print(f"警告: 列数({num_cols})或行数({num_rows})设置可能不合理。原始尺寸: {width}x{height}。")
+        # 尝试基于宽度调整 num_cols
+        if num_cols > width and width > 0 :
+            num_cols = max(1, width // 2) # 保证 cell_width 至少为2，且 num_cols 至少为1
         
-        # 获取字符尺寸 (现代 Pillow 使用 getbbox)
-        try:
-            # getbbox 返回 (left, top, right, bottom)
-            bbox = font.getbbox(sample_character) 
-            char_width = bbox[2] - bbox[0]
-            char_height = bbox[3] - bbox[1] 
-            if char_height <= 0 and hasattr(font, 'size'): # 某些字体getbbox可能返回(0,0,w,h)而bbox[1]不为0
-                 char_height = font.size # 退回使用字体声明的size
-            if char_width <= 0 and hasattr(font, 'size'):
-                 char_width = font.size // 2 # 粗略估计
-        except AttributeError: # 兼容旧版 Pillow 或自定义字体对象
-            if hasattr(font, 'getsize'):
-                char_width, char_height = font.getsize(sample_character)
-            else:
-                print("错误: 无法从字体对象获取字符尺寸。")
-                return None
+        cell_width = width / num_cols
+        cell_height = scale * cell_width
+        if cell_height <=0 :
+            print("错误: 调整后 cell_height 仍然无效。")
+            return None
+        num_rows = int(height / cell_height)
         
-        if char_width <= 0 or char_height <= 0:
-            print(f"错误: 字符宽度({char_width})或高度({char_height})无效。")
+        if num_rows <= 0 or num_cols <= 0:
+            print(f"错误: 调整后无法确定有效的行数({num_rows})或列数({num_cols})。")
             return None
+        print(f"调整后: num_cols={num_cols}, num_rows={num_rows}")
+
+    return num_cols, num_rows, cell_width, cell_height
+
+
+# 计算输出画布尺寸 (裁剪前)，无效时返回 None
+def _output_size(charset, num_cols, num_rows):
+    # 字符尺寸在字符集缓存中只测量一次
+    char_width, char_height = charset.char_width, charset.char_height
+    
+    if char_width <= 0 or char_height <= 0:
+        print(f"错误: 字符宽度({char_width})或高度({char_height})无效。")
+        return None
+
+    out_width = char_width * num_cols
+    out_height = char_height * num_rows # 每个字符高 char_height, 共 num_rows 行
+
+    if out_width <= 0 or out_height <= 0:
+        print(f"错误: 计算得到的输出图像宽度({out_width})或高度({out_height})无效。")
+        return None
+    return int(out_width), int(out_height)
+
+
+# 只读取文件头估算输出画布尺寸 (裁剪前)，用于在转换前决定是否使用分块模式
+# 图片超出解码像素上限时抛出 ImageTooLargeError，可以在上传和转换之前拒绝
+def estimate_output_size(image_bytes, options=None):
+    current_options = DEFAULT_ASCII_OPTIONS.copy()
+    if options:
+        current_options.update(options)
+    size = plan_image_decode(image_bytes, current_options["num_cols"])
+    if size is not None:
+        size = size[1:]
+    charset = get_charset(current_options["language"], current_options["mode"])
+    if size is None or charset is None:
+        return None
+    layout = compute_grid_layout(size[0], size[1], current_options["num_cols"], charset.scale)
+    if layout is None:
+        return None
+    return _output_size(charset, layout[0], layout[1])
+
+
+# 解码图片并确定网格与输出尺寸，整图模式与分块模式共用
+# 返回包含转换所需全部信息的字典，失败时返回 None
+def prepare_ascii_conversion(image_bytes_io, current_options, color=False):
+    charset = get_charset(current_options["language"], current_options["mode"])
+    if charset is None:
+        return None
 
-        out_width = char_width * num_cols
-        out_height = char_height * num_rows # 每个字符高 char_height, 共 num_rows 行
+    image_bytes_io.seek(0)
+    with stage("decode"):
+        decoded = decode_image_for_grid(image_bytes_io.read(), current_options["num_cols"], color)
+    if decoded is None:
+        print("错误: OpenCV 无法从 BytesIO 解码图片。") # 应替换为 app.logger.error
+        return None
+    # 网格布局始终按原图尺寸计算，保证缩小解码时行列数与全尺寸解码完全一致
+    image, width, height = decoded
 
-        if out_width <= 0 or out_height <= 0:
-            print(f"错误: 计算得到的输出图像宽度({out_width})或高度({out_height})无效。")
+    layout = compute_grid_layout(width, height, current_options["num_cols"], charset.scale)
+    if layout is None:
+        return None
+    num_cols, num_rows, cell_width, cell_height = layout
+
+    output_size = _output_size(charset, num_cols, num_rows)
+    if output_size is None:
+        return None
+
+    return {
+        "charset": charset,
+        "image": image,
+        "num_cols": num_cols,
+        "num_rows": num_rows,
+        # 将原图坐标系下的格子尺寸换算到实际解码出的 (可能已缩小的) 图像上
+        "cell_width": cell_width * image.shape[1] / width,
+        "cell_height": cell_height * image.shape[0] / height,
+        "out_width": output_size[0],
+        "out_height": output_size[1],
+        "bg_code": 255 if current_options["background"] == "white" else 0,
+    }
+
+
+def _char_indices(plan, row_start=0, row_stop=None):
+    charset = plan["charset"]
+    return char_index_grid(plan["image"], plan["num_rows"], plan["num_cols"], plan["cell_height"],
+                           plan["cell_width"], len(charset.char_list), row_start, row_stop)
+
+
+def convert_image_to_ascii_art(image_bytes_io, options=None):
+    current_options = DEFAULT_ASCII_OPTIONS.copy()
+    if options:
+        current_options.update(options)
+
+    try:
+        plan = prepare_ascii_conversion(image_bytes_io, current_options)
+        if plan is None:
             return None
 
-        out_image_pil = Image.new("L", (int(out_width), int(out_height)), bg_code)
-        draw = ImageDraw.Draw(out_image_pil)
-
-        for i in range(num_rows):
-            y_start = int(i * cell_height)
-            y_end = min(int((i + 1) * cell_height), height)
-            if y_start >= y_end: continue
-
-            character_line = []
-            for j in range(num_cols):
-                x_start = int(j * cell_width)
-                x_end = min(int((j + 1) * cell_width), width)
-                if x_start >= x_end: continue
-                
-                image_cell_slice = image_gray[y_start:y_end, x_start:x_end]
-                
-                if image_cell_slice.size == 0:
-                    char_to_add = char_list[0] if bg_code == 0 else char_list[num_chars - 1]
-                else:
-                    avg_intensity = np.mean(image_cell_slice)
-                    char_idx = min(int((avg_intensity / 255.0) * num_chars), num_chars - 1)
-                    char_to_add = char_list[char_idx]
-                character_line.append(char_to_add)
-            
-            line_text = "".join(character_line)
-            draw.text((0, i * char_height), line_text, fill=(255 - bg_code), font=font)
+        # 一次性计算所有格子的平均亮度，并通过查找表映射为字符下标
+        with stage("cells"):
+            char_indices = _char_indices(plan)
+
+        # 用缓存的字形图集直接拼接输出位图，渲染过程中不再调用 FreeType
+        with stage("render"):
+            out_image_pil = Image.fromarray(plan["charset"].atlas.render_gray(
+                char_indices, plan["bg_code"], plan["out_height"], plan["out_width"]), "L")
 
         # 裁剪
-        bbox = None
-        if current_options["background"] == "white":
-            # 背景白(255)，文字黑(0)。反色后文字变白(255)，背景变黑(0)，getbbox才能正常工作
-            try:
-                inverted_for_bbox = ImageOps.invert(out_image_pil.convert("L"))
-                bbox = inverted_for_bbox.getbbox()
-            except ValueError as ve: # 有时全白图片反色再getbbox会出问题
-                print(f"裁剪时发生Value Error (可能图片全白/黑): {ve}")
-                bbox = None # 无法裁剪，返回原图
-        else: # 背景黑(0)，文字白(255)
-            bbox = out_image_pil.getbbox()
-
-        if bbox:
-            out_image_pil = out_image_pil.crop(bbox)
+        with stage("crop"):
+            bbox = None
+            if current_options["background"] == "white":
+                # 背景白(255)，文字黑(0)。反色后文字变白(255)，背景变黑(0)，getbbox才能正常工作
+                try:
+                    inverted_for_bbox = ImageOps.invert(out_image_pil.convert("L"))
+                    bbox = inverted_for_bbox.getbbox()
+                except ValueError as ve: # 有时全白图片反色再getbbox会出问题
+                    print(f"裁剪时发生Value Error (可能图片全白/黑): {ve}")
+                    bbox = None # 无法裁剪，返回原图
+            else: # 背景黑(0)，文字白(255)
+                bbox = out_image_pil.getbbox()
+
+            if bbox:
+                out_image_pil = out_image_pil.crop(bbox)
         
         return out_image_pil
 
+    except ImageTooLargeError:
+        raise
     except FileNotFoundError as fnfe: # 特别处理 utils.get_data 可能引发的字体文件等找不到的问题
         print(f"文件未找到错误 (可能在 get_data 中): {fnfe}") # 应替换为 app.logger.error
         raise # 重新抛出，让上层Flask路由捕获并返回合适的错误信息
@@ -173,4 +287,212 @@ def convert_image_to_ascii_art(image_bytes_io, options=None):
         print(f"ASCII 艺术转换过程中发生错误: {e}") # 应替换为 app.logger.error
         import traceback
         traceback.print_exc()
-        return None
\ No newline at end of file
+        return None
+
+
+# 直接输出字符网格的文本格式 ("text" / "ansi" / "html")，不经过任何位图渲染
+# 彩色格式使用每个格子的平均颜色，字符按亮度 (与灰度解码相同的 BT.601 权重) 选取；失败返回 None
+def convert_image_to_ascii_text(image_bytes_io, options=None, output_format="text"):
+    current_options = DEFAULT_ASCII_OPTIONS.copy()
+    if options:
+        current_options.update(options)
+    if output_format not in TEXT_OUTPUT_FORMATS:
+        print(f"错误: 不支持的输出格式 {output_format}")
+        return None
+
+    try:
+        plan = prepare_ascii_conversion(image_bytes_io, current_options, color=output_format != "text")
+        if plan is None:
+            return None
+        charset = plan["charset"]
+        if output_format == "text":
+            with stage("cells"):
+                char_indices = _char_indices(plan)
+            with stage("format"):
+                return grid_to_text(charset.char_list, char_indices)
+
+        with stage("cells"):
+            bgr_means = cell_means(plan["image"], plan["num_rows"], plan["num_cols"], plan["cell_height"], plan["cell_width"])
+            char_indices = intensity_to_indices(bgr_means @ BGR_LUMA_WEIGHTS, len(charset.char_list))
+            rgb_means = bgr_means[:, :, ::-1]
+        with stage("format"):
+            if output_format == "ansi":
+                return grid_to_ansi(charset.char_list, char_indices, rgb_means, current_options["background"])
+            return grid_to_html(charset.char_list, char_indices, rgb_means, current_options["background"])
+
+    except ImageTooLargeError:
+        raise
+    except FileNotFoundError as fnfe:
+        print(f"文件未找到错误 (可能在 get_data 中): {fnfe}") # 应替换为 app.logger.error
+        raise
+    except Exception as e:
+        print(f"ASCII 文本转换过程中发生错误: {e}") # 应替换为 app.logger.error
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+# 分块模式下每一块的内存上限 (字节)，可通过环境变量调整
+TILED_BAND_BYTES = int(os.environ.get("ASCII_TILED_BAND_BYTES", 16 * 1024 * 1024))
+
+# 输出画布 (裁剪前) 像素数超过该值时改用分块模式以限制内存占用
+TILED_OUTPUT_PIXELS = int(os.environ.get("ASCII_TILED_OUTPUT_PIXELS", 16_000_000))
+
+
+# 分块转换: 按若干字符行为一块依次计算、渲染，并以 PNG 行流的形式写入 output_stream (文件或 socket)
+# 不在内存中构建整幅输出画布，裁剪框由字形墨迹范围预先计算，结果与 convert_image_to_ascii_art 保存的 PNG 一致
+# 成功时返回输出图像尺寸 (width, height)，失败返回 None
+def convert_image_to_ascii_art_tiled(image_bytes_io, output_stream, options=None, band_bytes=None):
+    current_options = DEFAULT_ASCII_OPTIONS.copy()
+    if options:
+        current_options.update(options)
+
+    try:
+        plan = prepare_ascii_conversion(image_bytes_io, current_options)
+        if plan is None:
+            return None
+        atlas = plan["charset"].atlas
+        num_rows, out_width, out_height = plan["num_rows"], plan["out_width"], plan["out_height"]
+        char_height = atlas.cell_height
+
+        # 字符下标矩阵本身很小，分块计算以避免一次性生成整幅图像的中间结果
+        band_bytes = band_bytes or TILED_BAND_BYTES
+        band_rows = max(1, band_bytes // max(1, out_width * char_height * (atlas.num_bands + 2)))
+        with stage("cells"):
+            char_indices = np.vstack([_char_indices(plan, row, min(row + band_rows, num_rows))
+                                      for row in range(0, num_rows, band_rows)])
+
+        with stage("crop"):
+            bbox = atlas.ink_bbox(char_indices, out_height, out_width)
+            if bbox is None:
+                bbox = (0, 0, out_width, out_height) # 无法裁剪，输出原图
+            left, top, right, bottom = bbox
+
+        # 分块模式下渲染与 PNG 编码交替进行，合并记为一个阶段
+        with stage("render_encode"):
+            writer = PngStreamWriter(output_stream, right - left, bottom - top)
+            band_height = band_rows * char_height
+            for y_start in range(top, bottom, band_height):
+                y_stop = min(y_start + band_height, bottom)
+                coverage = atlas.render_coverage_rows(char_indices, y_start, y_stop, out_width)[:, left:right]
+                writer.write_rows(255 - coverage if plan["bg_code"] else coverage)
+            writer.close()
+        return right - left, bottom - top
+
+    except ImageTooLargeError:
+        raise
+    except FileNotFoundError as fnfe:
+        print(f"文件未找到错误 (可能在 get_data 中): {fnfe}") # 应替换为 app.logger.error
+        raise
+    except Exception as e:
+        print(f"分块 ASCII 艺术转换过程中发生错误: {e}") # 应替换为 app.logger.error
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+
+# 批量转换的进程池大小，默认等于 CPU 核数
+BATCH_WORKERS = int(os.environ.get("ASCII_BATCH_WORKERS", os.cpu_count() or 1))
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+# 工作进程启动时预热默认字符集，之后进程内的字符集/字体/字形图集都由 utils 中的缓存复用
+def _init_batch_worker(charsets):
+    from utils import warm_registry
+    warm_registry(charsets)
+
+
+def _get_batch_executor():
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            # 使用 spawn 而不是 fork，避免从多线程的 Flask 进程中复制锁状态
+            _batch_executor = ProcessPoolExecutor(
+                max_workers=BATCH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_batch_worker,
+                initargs=([(DEFAULT_ASCII_OPTIONS["language"], DEFAULT_ASCII_OPTIONS["mode"])],),
+            )
+        return _batch_executor
+
+
+# 丢弃已损坏的进程池；只在它仍是当前进程池时丢弃，不影响其他请求已经重建的新进程池
+def _reset_batch_executor(executor):
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is executor:
+            _batch_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 转换单张图片并按 options["output_format"] 编码为字节串 (PNG 或 UTF-8 文本)，超大 PNG 输出自动使用分块模式；失败返回 None
+def convert_image_to_output_bytes(image_bytes, options=None):
+    current_options = DEFAULT_ASCII_OPTIONS.copy()
+    if options:
+        current_options.update(options)
+    if current_options["output_format"] in TEXT_OUTPUT_FORMATS:
+        text = convert_image_to_ascii_text(io.BytesIO(image_bytes), current_options, current_options["output_format"])
+        return None if text is None else text.encode("utf-8")
+
+    try:
+        output_size = estimate_output_size(image_bytes, current_options)
+    except ImageTooLargeError as e:
+        print(f"图片过大，跳过: {e}")
+        return None
+    output = io.BytesIO()
+    if output_size and output_size[0] * output_size[1] >= TILED_OUTPUT_PIXELS:
+        if convert_image_to_ascii_art_tiled(io.BytesIO(image_bytes), output, current_options) is None:
+            return None
+    else:
+        image = convert_image_to_ascii_art(io.BytesIO(image_bytes), current_options)
+        if image is None:
+            return None
+        with stage("encode"):
+            image.save(output, format="PNG")
+    return output.getvalue()
+
+
+# 输出格式对应的 (文件扩展名, Content-Type)
+def output_file_type(output_format):
+    if output_format in TEXT_OUTPUT_FORMATS:
+        return TEXT_OUTPUT_FORMATS[output_format]
+    return "png", "image/png"
+
+
+# 批量转换: 多张图片共用同一组选项，分发到进程池并行处理，按输入顺序返回编码后的字节串 (失败的位置为 None)
+# images 中的元素可以是 bytes 或类文件对象
+def convert_images_to_ascii_art(images, options=None):
+    current_options = DEFAULT_ASCII_OPTIONS.copy()
+    if options:
+        current_options.update(options)
+    payloads = []
+    for image in images:
+        if hasattr(image, "read"):
+            image.seek(0)
+            image = image.read()
+        payloads.append(bytes(image))
+
+    if len(payloads) <= 1 or BATCH_WORKERS <= 1:
+        return [convert_image_to_output_bytes(payload, current_options) for payload in payloads]
+
+    executor = _get_batch_executor()
+    futures = [executor.submit(convert_image_to_output_bytes, payload, current_options) for payload in payloads]
+    results = []
+    broken = False
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as e:
+            # 工作进程异常退出 (例如被 OOM 杀掉)，丢弃本次使用的进程池，下次批量请求时重建
+            if not broken:
+                print(f"批量转换进程池已损坏: {e}")
+                _reset_batch_executor(executor)
+                broken = True
+            results.append(None)
+        except Exception as e:
+            print(f"批量转换中单张图片失败: {e}")
+            results.append(None)
+    return results
@@ -5,8 +5,9 @@ import argparse
 
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageOps
-from utils import get_data
+from PIL import Image, ImageOps
+from utils import get_charset
+from grid import cell_edges, cell_means, intensity_to_indices
 
 
 def get_args():
@@ -28,8 +29,8 @@ def main(opt):
         bg_code = (255, 255, 255)
     else:
         bg_code = (0, 0, 0)
-    char_list, font, sample_character, scale = get_data(opt.language, opt.mode)
-    num_chars = len(char_list)
+    charset = get_charset(opt.language, opt.mode)
+    scale = charset.scale
     num_cols = opt.num_cols
     image = cv2.imread(opt.input, cv2.IMREAD_COLOR)
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -43,19 +44,17 @@ def main(opt):
         cell_height = 12
         num_cols = int(width / cell_width)
         num_rows = int(height / cell_height)
-    char_width, char_height = font.getsize(sample_character)
+    char_width, char_height = charset.char_width, charset.char_height
     out_width = char_width * num_cols
     out_height = scale * char_height * num_rows
-    out_image = Image.new("RGB", (out_width, out_height), bg_code)
-    draw = ImageDraw.Draw(out_image)
-    for i in range(num_rows):
-        for j in range(num_cols):
-            partial_image = image[int(i * cell_height):min(int((i + 1) * cell_height), height),
-                            int(j * cell_width):min(int((j + 1) * cell_width), width), :]
-            partial_avg_color = np.sum(np.sum(partial_image, axis=0), axis=0) / (cell_height * cell_width)
-            partial_avg_color = tuple(partial_avg_color.astype(np.int32).tolist())
-            char = char_list[min(int(np.mean(partial_image) * num_chars / 255), num_chars - 1)]
-            draw.text((j * char_width, i * char_height), char, fill=partial_avg_color, font=font)
+    avg_colors = cell_means(image, num_rows, num_cols, cell_height, cell_width)
+    char_indices = intensity_to_indices(avg_colors.mean(axis=2), len(charset.char_list))
+    # 颜色沿用原先的做法: 像素和除以名义格子面积 (cell_height * cell_width)，右侧/底部不完整的格子因此偏暗
+    row_sizes = np.diff(cell_edges(height, cell_height, num_rows))
+    col_sizes = np.diff(cell_edges(width, cell_width, num_cols))
+    pixel_counts = row_sizes[:, None] * col_sizes[None, :]
+    avg_colors = (avg_colors * pixel_counts[:, :, None] / (cell_height * cell_width)).astype(np.int32)
+    out_image = Image.fromarray(charset.atlas.render_color(char_indices, avg_colors, bg_code, out_height, out_width), "RGB")
 
     if opt.background == "white":
         cropped_image = ImageOps.invert(out_image).getbbox()
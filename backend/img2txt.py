@@ -4,7 +4,8 @@
 import argparse
 
 import cv2
-import numpy as np
+from grid import char_index_grid
+from ascii_formats import grid_to_text
 
 
 def get_args():
@@ -38,14 +39,9 @@ def main(opt):
         num_cols = int(width / cell_width)
         num_rows = int(height / cell_height)
 
+    char_indices = char_index_grid(image, num_rows, num_cols, cell_height, cell_width, num_chars)
     output_file = open(opt.output, 'w')
-    for i in range(num_rows):
-        for j in range(num_cols):
-            output_file.write(
-                CHAR_LIST[min(int(np.mean(image[int(i * cell_height):min(int((i + 1) * cell_height), height),
-                                          int(j * cell_width):min(int((j + 1) * cell_width),
-                                                                  width)]) * num_chars / 255), num_chars - 1)])
-        output_file.write("\n")
+    output_file.write(grid_to_text(CHAR_LIST, char_indices))
     output_file.close()
 
 
@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+# 后台任务的工作线程池: 任务保存在数据库等持久化队列中，这里只负责领取和执行
+# 每个线程循环调用 claim() 领取一个任务 (返回任务 ID，没有任务时返回 None) 并交给 run(job_id) 执行，
+# 队列为空时等待 poll_interval 秒 (notify() 可提前唤醒)；maintain() 每隔 maintain_interval 秒调用一次，
+# 用于把心跳超时 (执行它的进程已经退出) 的任务放回队列
+class JobWorkerPool:
+    def __init__(self, claim, run, maintain=None, workers=1, poll_interval=2.0, maintain_interval=30.0,
+                 name="job-worker"):
+        self.claim = claim
+        self.run = run
+        self.maintain = maintain
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.maintain_interval = maintain_interval
+        self.name = name
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._last_maintain = 0.0
+
+    @property
+    def started(self):
+        return bool(self._threads)
+
+    # 启动工作线程 (重复调用无效)；workers 不为 None 时覆盖构造时的线程数，为 0 时不启动
+    def start(self, workers=None):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers if workers is None else workers):
+                thread = threading.Thread(target=self._loop, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # 有新任务入队时调用，空闲的线程立即领取
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _maintain_if_due(self):
+        if self.maintain is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_maintain < self.maintain_interval:
+                return
+            self._last_maintain = now
+        self.maintain()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            job_id = None
+            try:
+                self._maintain_if_due()
+                job_id = self.claim()
+            except Exception as e:
+                print(f"{self.name}: failed to claim a job: {e}")
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self.run(job_id)
+            except Exception as e:
+                print(f"{self.name}: job {job_id} failed: {e}")
+
+
+# 任务执行期间的心跳线程: 每隔 interval 秒调用一次 beat() (记录进度和心跳时间)
+class JobHeartbeat:
+    def __init__(self, interval, beat):
+        self.interval = interval
+        self.beat = beat
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="job-heartbeat", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,50 @@
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+# 逐行写出 PNG，无需在内存中保留整幅图像；stream 只需支持 write (文件、socket.makefile 等)
+class PngStreamWriter:
+    def __init__(self, stream, width, height, channels=1, compress_level=6):
+        if channels not in (1, 3):
+            raise ValueError(f"Unsupported channel count: {channels}")
+        self.stream = stream
+        self.width = int(width)
+        self.height = int(height)
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+
+        color_type = 0 if channels == 1 else 2
+        self.stream.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, color_type, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type, data):
+        self.stream.write(struct.pack(">I", len(data)))
+        self.stream.write(chunk_type)
+        self.stream.write(data)
+        self.stream.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+    # rows 形状为 (n, width) 或 (n, width, 3)，dtype 为 uint8
+    def write_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.shape[0] == 0:
+            return
+        if rows.shape[1] != self.width or self.rows_written + rows.shape[0] > self.height:
+            raise ValueError(f"Row block {rows.shape} does not fit a {self.width}x{self.height} image")
+        # 每行前加一个过滤类型字节 (0 = None)
+        scanlines = np.zeros((rows.shape[0], 1 + self.width * self.channels), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"Expected {self.height} rows, got {self.rows_written}")
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
@@ -0,0 +1,214 @@
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+# 字形图集: 每个字符只用 FreeType 光栅化一次，之后按字符下标矩阵直接拼接输出位图
+class GlyphAtlas:
+    def __init__(self, char_list, font, cell_width, cell_height):
+        self.char_list = char_list
+        self.cell_width = int(cell_width)
+        self.cell_height = int(cell_height)
+
+        # 所有字形相对于绘制原点的纵向范围，下伸部分 (如 g、p、y) 会延伸到下一行，与逐行 draw.text 的效果一致
+        boxes = [font.getbbox(char) for char in char_list]
+        self.top = min(box[1] for box in boxes)
+        bottom = max(box[3] for box in boxes)
+        self.num_bands = max(1, -(-(bottom - self.top) // self.cell_height))
+        tile_height = self.num_bands * self.cell_height
+
+        self.tiles = np.zeros((len(char_list), tile_height, self.cell_width), dtype=np.uint8)
+        for i, char in enumerate(char_list):
+            tile = Image.new("L", (self.cell_width, tile_height), 0)
+            ImageDraw.Draw(tile).text((0, -self.top), char, fill=255, font=font)
+            self.tiles[i] = np.asarray(tile)
+
+        # 每个字形在其图块内的墨迹范围 [x0, x1) / [y0, y1)，空白字形的范围为空
+        ink_cols = self.tiles.any(axis=1)
+        ink_rows = self.tiles.any(axis=2)
+        self.has_ink = ink_cols.any(axis=1)
+        self.ink_x0 = np.where(self.has_ink, ink_cols.argmax(axis=1), 0)
+        self.ink_x1 = np.where(self.has_ink, self.cell_width - ink_cols[:, ::-1].argmax(axis=1), 0)
+        self.ink_y0 = np.where(self.has_ink, ink_rows.argmax(axis=1), 0)
+        self.ink_y1 = np.where(self.has_ink, tile_height - ink_rows[:, ::-1].argmax(axis=1), 0)
+
+        # 按输出块 (cell_height x cell_width，与格子网格对齐) 局部渲染时使用:
+        # 块行 R 中的像素可能来自字符行 R - d (d 属于 block_deltas，按所在横带从上到下排列)，
+        # block_tiles[k] 为每个字形落在相对其字符行偏移 block_deltas[k] 的块内的部分，最后一个字形为空白
+        tiles = np.concatenate([self.tiles, np.zeros((1, tile_height, self.cell_width), dtype=np.uint8)])
+        self.blank_index = len(char_list)
+        self.block_deltas = []
+        block_tiles = []
+        for delta in range(self.top // self.cell_height - 1, self.num_bands - (-self.top // self.cell_height) + 1):
+            y = delta * self.cell_height - self.top
+            lo, hi = max(0, y), min(tile_height, y + self.cell_height)
+            if hi <= lo:
+                continue
+            block = np.zeros((len(tiles), self.cell_height, self.cell_width), dtype=np.uint8)
+            block[:, lo - y:hi - y] = tiles[:, lo:hi]
+            self.block_deltas.append(delta)
+            block_tiles.append(block)
+        self.block_tiles = np.stack(block_tiles)
+
+    # 将每一条高度为 cell_height 的字形横带拼成整幅图层，返回 (纵向偏移, 覆盖度图层, 该图层的格子下标切片)
+    def _bands(self, char_indices):
+        num_rows, num_cols = char_indices.shape
+        tiles = self.tiles[char_indices]
+        for band in range(self.num_bands):
+            part = tiles[:, :, band * self.cell_height:(band + 1) * self.cell_height, :]
+            layer = part.transpose(0, 2, 1, 3).reshape(num_rows * self.cell_height, num_cols * self.cell_width)
+            yield self.top + band * self.cell_height, layer, part
+
+    @staticmethod
+    def _clip(offset, layer_height, canvas_height):
+        src_start = max(0, -offset)
+        dst_start = max(0, offset)
+        length = min(layer_height - src_start, canvas_height - dst_start)
+        return src_start, dst_start, length
+
+    # 拼接覆盖度 (0-255) 画布，重叠部分取最大值；out 为可复用的 (height, width) uint8 缓冲区
+    def render_coverage(self, char_indices, height=None, width=None, out=None):
+        num_rows, num_cols = char_indices.shape
+        height = num_rows * self.cell_height if height is None else height
+        width = num_cols * self.cell_width if width is None else width
+        if out is None:
+            coverage = np.zeros((height, width), dtype=np.uint8)
+        else:
+            coverage = out
+            coverage.fill(0)
+        for offset, layer, _ in self._bands(char_indices):
+            src, dst, length = self._clip(offset, layer.shape[0], height)
+            if length <= 0:
+                continue
+            w = min(width, layer.shape[1])
+            np.maximum(coverage[dst:dst + length, :w], layer[src:src + length, :w], out=coverage[dst:dst + length, :w])
+        return coverage
+
+    # 只渲染整幅覆盖度画布中的像素行 [y_start, y_stop)，用于分块输出
+    def render_coverage_rows(self, char_indices, y_start, y_stop, width=None):
+        num_rows = char_indices.shape[0]
+        # 与这段像素行有重叠的字符行 (字形可能向上或向下跨越多行)
+        row_lo = max(0, (y_start - self.top) // self.cell_height - self.num_bands)
+        row_hi = min(num_rows, (y_stop - self.top) // self.cell_height + 1)
+        if row_hi <= row_lo:
+            width = char_indices.shape[1] * self.cell_width if width is None else width
+            return np.zeros((y_stop - y_start, width), dtype=np.uint8)
+        origin = row_lo * self.cell_height
+        coverage = self.render_coverage(char_indices[row_lo:row_hi], y_stop - origin, width)
+        return coverage[y_start - origin:]
+
+    # 受变化格子影响的输出块: changed 为 (rows, cols) 布尔矩阵，返回 (num_block_rows, cols) 布尔矩阵
+    def affected_blocks(self, changed, num_block_rows):
+        num_rows = changed.shape[0]
+        blocks = np.zeros((num_block_rows, changed.shape[1]), dtype=bool)
+        for delta in self.block_deltas:
+            lo, hi = max(0, delta), min(num_block_rows, num_rows + delta)
+            if hi > lo:
+                blocks[lo:hi] |= changed[lo - delta:hi - delta]
+        return blocks
+
+    # 只计算指定输出块 (块行 block_rows[i]，列 block_cols[i]) 的覆盖度，返回 (n, cell_height, cell_width)
+    # with_owner 时同时返回每个像素所属格子的字符行 (重叠时靠前的横带优先，与 render_color 一致)
+    def _block_coverage(self, char_indices, block_rows, block_cols, with_owner=False):
+        num_rows = char_indices.shape[0]
+        coverage = owner = None
+        for k, delta in enumerate(self.block_deltas):
+            source_rows = block_rows - delta
+            valid = (source_rows >= 0) & (source_rows < num_rows)
+            source_rows = np.clip(source_rows, 0, num_rows - 1)
+            layer = self.block_tiles[k][np.where(valid, char_indices[source_rows, block_cols], self.blank_index)]
+            if coverage is None:
+                coverage = layer
+                if with_owner:
+                    owner = np.broadcast_to(source_rows[:, None, None], layer.shape).copy()
+                continue
+            if with_owner:
+                np.copyto(owner, source_rows[:, None, None], where=layer > coverage)
+            np.maximum(coverage, layer, out=coverage)
+        return coverage, owner
+
+    # 单色版本的局部渲染，结果与 render_gray 整幅渲染后对应块中的像素一致
+    def render_gray_blocks(self, char_indices, block_rows, block_cols, background=0):
+        coverage, _ = self._block_coverage(char_indices, block_rows, block_cols)
+        if background:
+            return np.subtract(255, coverage, out=coverage)
+        return coverage
+
+    # 彩色版本的局部渲染，colors 为 uint8 的 (rows, cols, 3)，返回 (n, cell_height, cell_width, 3)
+    def render_color_blocks(self, char_indices, colors, block_rows, block_cols, background=(0, 0, 0)):
+        coverage, owner_rows = self._block_coverage(char_indices, block_rows, block_cols, with_owner=True)
+        pixel_colors = colors[owner_rows, block_cols[:, None, None]]
+        n = len(block_rows)
+        tinted = _tint(pixel_colors.reshape(n * self.cell_height, self.cell_width, 3),
+                       coverage.reshape(n * self.cell_height, self.cell_width), background)
+        return tinted.reshape(n, self.cell_height, self.cell_width, 3)
+
+    # 整幅画布中非背景像素的包围盒 (left, top, right, bottom)，与 Image.getbbox 的结果一致
+    # 无需真正渲染画布，全为背景时返回 None
+    def ink_bbox(self, char_indices, height, width):
+        rows, cols = np.indices(char_indices.shape)
+        x0 = np.clip(cols * self.cell_width + self.ink_x0[char_indices], 0, width)
+        x1 = np.clip(cols * self.cell_width + self.ink_x1[char_indices], 0, width)
+        y0 = np.clip(rows * self.cell_height + self.top + self.ink_y0[char_indices], 0, height)
+        y1 = np.clip(rows * self.cell_height + self.top + self.ink_y1[char_indices], 0, height)
+        visible = self.has_ink[char_indices] & (x1 > x0) & (y1 > y0)
+        if not visible.any():
+            return None
+        return int(x0[visible].min()), int(y0[visible].min()), int(x1[visible].max()), int(y1[visible].max())
+
+    # 单色输出: background 为 0 (黑底白字) 或 255 (白底黑字)
+    def render_gray(self, char_indices, background=0, height=None, width=None, out=None):
+        coverage = self.render_coverage(char_indices, height, width, out)
+        if background:
+            return np.subtract(255, coverage, out=coverage)
+        return coverage
+
+    # 彩色输出: 字形按每个格子的平均颜色着色，colors 形状为 (rows, cols, 3)
+    # 先按覆盖度取最大值确定每个像素属于哪个格子 (重叠时先画的横带优先)，再整幅一次性着色:
+    # (color * a + background * (255 - a) + 127) // 255
+    # out 为可复用的 (height, width, 3) uint8 缓冲区
+    def render_color(self, char_indices, colors, background=(0, 0, 0), height=None, width=None, out=None):
+        num_rows, num_cols = char_indices.shape
+        height = num_rows * self.cell_height if height is None else height
+        width = num_cols * self.cell_width if width is None else width
+        colors = np.clip(colors, 0, 255).astype(np.uint8)
+        cell_colors = cv2.resize(colors, (num_cols * self.cell_width, num_rows * self.cell_height),
+                                 interpolation=cv2.INTER_NEAREST)
+
+        coverage = np.zeros((height, width), dtype=np.uint8)
+        pixel_colors = np.zeros((height, width, 3), dtype=np.uint8)
+        for band, (offset, layer, _) in enumerate(self._bands(char_indices)):
+            src, dst, length = self._clip(offset, layer.shape[0], height)
+            if length <= 0:
+                continue
+            w = min(width, layer.shape[1])
+            layer = layer[src:src + length, :w]
+            target = coverage[dst:dst + length, :w]
+            if band == 0:
+                # 第一条横带之前画布为空，直接整块复制
+                pixel_colors[dst:dst + length, :w] = cell_colors[src:src + length, :w]
+            else:
+                np.copyto(pixel_colors[dst:dst + length, :w], cell_colors[src:src + length, :w],
+                          where=(layer > target)[:, :, None])
+            np.maximum(target, layer, out=target)
+
+        canvas = _tint(pixel_colors, coverage, background)
+        if out is None:
+            return canvas
+        out[:] = canvas
+        return out
+
+
+# 按覆盖度把字形颜色与背景混合: (color * a + background * (255 - a) + 127) // 255
+def _tint(pixel_colors, coverage, background):
+    background = tuple(int(value) for value in np.broadcast_to(background, (3,)))
+    if background in ((0, 0, 0), (255, 255, 255)):
+        # 黑/白背景: round(color * a / 255) [+ 255 - a]，与上式逐像素相同，由 OpenCV 一次完成
+        alpha = cv2.merge([coverage, coverage, coverage])
+        canvas = cv2.multiply(pixel_colors, alpha, scale=1 / 255.0)
+        if background[0]:
+            cv2.add(canvas, 255 - alpha, dst=canvas)
+        return canvas
+    alpha = coverage[:, :, None].astype(np.uint16)
+    tinted = pixel_colors * alpha + np.asarray(background, dtype=np.uint16) * (255 - alpha) + 127
+    return (tinted // 255).astype(np.uint8)
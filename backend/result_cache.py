@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# 本地缓存层的最大条目数 (LRU 淘汰)
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("ASCII_RESULT_CACHE_MAX_ENTRIES", 1024))
+
+
+# 输入图片内容的 SHA-256
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# 规范化后的转换选项: 字符串统一小写，按键排序序列化，保证等价选项得到同一个键
+def normalize_options(options):
+    normalized = {}
+    for key, value in options.items():
+        normalized[key] = value.lower() if isinstance(value, str) else value
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+
+# 转换结果的缓存键: 用户 + 输入内容哈希 + 规范化选项的哈希
+# 缓存的对象保存在各用户自己的 OSS 目录下，只在同一用户内复用，不会把一个用户的对象写入另一个用户的记录
+def result_cache_key(user_id, digest, options):
+    options_digest = hashlib.sha1(normalize_options(options).encode("utf-8")).hexdigest()
+    return f"result:{user_id}:{digest}:{options_digest}"
+
+
+# 已上传原图的缓存键，只与用户和输入内容有关 (换一组选项重试时也能复用原图)
+def original_cache_key(user_id, digest):
+    return f"original:{user_id}:{digest}"
+
+
+# 两级结果缓存: 进程内 LRU + 可选的共享层 (多个进程/实例之间共享)
+# shared 只需提供 get(key) -> dict 或 None 与 set(key, value) 两个方法，共享层出错时按未命中处理
+class ResultCache:
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, shared=None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _put_local(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # record=False 时不计入命中率统计 (用于原图等辅助查询)
+    def get(self, key, record=True):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                if record:
+                    self.local_hits += 1
+                return value
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                print(f"读取共享缓存 {key} 失败: {e}")
+                value = None
+            if value is not None:
+                self._put_local(key, value)
+                if record:
+                    with self._lock:
+                        self.shared_hits += 1
+                return value
+
+        if record:
+            with self._lock:
+                self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._put_local(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                print(f"写入共享缓存 {key} 失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.local_hits + self.shared_hits + self.misses
+            hits = self.local_hits + self.shared_hits
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "shared_tier": self.shared is not None,
+                "lookups": lookups,
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# app.py 在导入时读取数据库配置，测试使用临时的 SQLite 数据库
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="artiscope_test_"), "test.db"))
+os.environ.setdefault("DASHSCOPE_API_KEY", "test")
+
+import api
+import dashscope_stub
+
+
+# 在后台线程中运行本地的 DashScope 替身服务，并把 api.py 的接口地址指向它
+@pytest.fixture
+def dashscope_server(monkeypatch):
+    servers = []
+
+    def start(pending=0.2, running=0.3, flaky=0):
+        server = make_server("127.0.0.1", 0, dashscope_stub.create_app(pending, running, flaky), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(api, "DASHSCOPE_BASE_URL", f"http://127.0.0.1:{server.server_port}/api/v1")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+class FakeResult:
+    status = 200
+
+
+# 内存中的 OSS bucket，只实现应用用到的方法
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, key, data, headers=None):
+        if hasattr(data, "read"):
+            data = data.read()
+        elif not isinstance(data, (bytes, bytearray)):
+            data = b"".join(data)
+        with self.lock:
+            self.objects[key] = bytes(data)
+        return FakeResult()
+
+    def delete_object(self, key):
+        with self.lock:
+            self.objects.pop(key, None)
+
+
+# 使用空数据库和 FakeBucket 的测试客户端，已注册并登录用户 u
+@pytest.fixture
+def app_client():
+    import app as appmod
+
+    appmod.bucket = FakeBucket()
+    appmod.result_cache.clear()
+    appmod.app.config["SESSION_COOKIE_SECURE"] = False
+    with appmod.app.app_context():
+        appmod.db.drop_all()
+        appmod.db.create_all()
+    test_client = appmod.app.test_client()
+    test_client.post("/register", json={"username": "u", "password": "p"})
+    test_client.post("/login", json={"username": "u", "password": "p"})
+    test_client.appmod = appmod
+    return test_client
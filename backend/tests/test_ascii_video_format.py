@@ -0,0 +1,127 @@
+import cv2
+import numpy as np
+import pytest
+
+import ascii_video_format
+from ascii_video_format import AsciiVideoReader, AsciiVideoWriter
+from ffmpeg_writer import FfmpegVideoReader
+from video_engine import AsciiVideoEngine, convert_video
+
+FPS = 10
+NUM_FRAMES = 45
+
+
+# 3 秒以上的合成视频 (水平移动的渐变和色块)，帧率 10 时关键帧间隔为 20 帧，覆盖多个关键帧
+@pytest.fixture(scope="module")
+def source_video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("ascii_video") / "source.mp4")
+    width, height = 160, 96
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (width, height))
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    last = None
+    for i in range(NUM_FRAMES):
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:, :, 0] = np.broadcast_to((x + 6 * i) % 256, (height, width))
+        frame[:, :, 1] = np.broadcast_to(y, (height, width))
+        frame[:, :, 2] = 255 - frame[:, :, 0]
+        # 中间几帧保持不变，产生重复帧记录
+        if 10 <= i < 14:
+            frame = last
+        frame = frame.copy()
+        frame[10:30, (4 * i) % (width - 20):(4 * i) % (width - 20) + 20] = (0, 0, 255)
+        writer.write(frame)
+        last = frame
+    writer.release()
+    return path
+
+
+# 按 convert_video 的方式 (同样的解码尺寸和像素格式) 逐帧运行引擎，返回每帧的字符下标和 BGR 颜色
+def engine_grids(source_video, color, num_cols):
+    cap = cv2.VideoCapture(source_video)
+    _, first_frame = cap.read()
+    cap.release()
+    engine = AsciiVideoEngine(first_frame.shape[1], first_frame.shape[0], color=color, num_cols=num_cols,
+                              overlay_ratio=0)
+    reader = FfmpegVideoReader(source_video, engine.input_width, engine.input_height,
+                               pix_fmt="gray" if engine.input_gray else "bgr24")
+    grids = []
+    try:
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
+            engine.update_cells(frame)
+            indices, colors = engine.cells()
+            grids.append((indices.copy(), None if colors is None else colors.copy()))
+    finally:
+        reader.release()
+    return engine, grids
+
+
+def quantize(bgr, step):
+    rgb = bgr[:, :, ::-1]
+    return np.minimum(rgb // step * step + step // 2, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("color", [False, True])
+def test_round_trip_matches_engine(source_video, tmp_path, color):
+    output_path = str(tmp_path / "out.asciiv")
+    stats = convert_video(source_video, output_path, color=color, num_cols=24, output_format="ascii")
+    engine, expected = engine_grids(source_video, color, 24)
+
+    reader = AsciiVideoReader(output_path)
+    assert reader.frame_count == stats["frames"] == len(expected)
+    assert (reader.num_cols, reader.num_rows) == (engine.num_cols, engine.num_rows)
+    assert reader.char_list == engine.char_list
+    assert reader.color == color
+    assert [frame for frame, _ in reader.keyframes] == list(range(0, len(expected), 2 * FPS))
+
+    frames = list(reader)
+    assert len(frames) == len(expected)
+    for (indices, colors), (expected_indices, expected_colors) in zip(frames, expected):
+        np.testing.assert_array_equal(indices, expected_indices)
+        if color:
+            np.testing.assert_array_equal(colors, quantize(expected_colors, ascii_video_format.ASCII_VIDEO_COLOR_STEP))
+        else:
+            assert colors is None
+
+
+def test_read_frame_seeks_across_keyframes(source_video, tmp_path):
+    output_path = str(tmp_path / "out.asciiv")
+    convert_video(source_video, output_path, color=True, num_cols=24, output_format="ascii")
+    reader = AsciiVideoReader(output_path)
+    frames = list(reader)
+    # 关键帧本身、关键帧前后的增量帧、重复帧和最后一帧，以及倒序读取
+    for frame_number in [0, 1, 12, 19, 20, 21, 39, 40, len(frames) - 1, 20, 5]:
+        indices, colors = reader.read_frame(frame_number)
+        np.testing.assert_array_equal(indices, frames[frame_number][0])
+        np.testing.assert_array_equal(colors, frames[frame_number][1])
+    with pytest.raises(IndexError):
+        reader.read_frame(len(frames))
+
+
+def test_color_quantization(tmp_path):
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, 10, size=(3, 5), dtype=np.uint8)
+    bgr = rng.integers(0, 256, size=(3, 5, 3), dtype=np.uint8)
+    bgr[0, 0] = (255, 254, 0)
+
+    for step in (1, 4, 7):
+        path = str(tmp_path / f"step{step}.asciiv")
+        writer = AsciiVideoWriter(path, 5, 3, FPS, "0123456789", color=True, color_step=step)
+        writer.write(indices, bgr)
+        # 量化后落在同一档的细微抖动不产生新的数据
+        writer.write(indices, np.where(bgr % step == 0, bgr, bgr - 1) if step > 1 else bgr)
+        writer.release()
+
+        reader = AsciiVideoReader(path)
+        first, second = list(reader)
+        np.testing.assert_array_equal(first[0], indices)
+        if step == 1:
+            np.testing.assert_array_equal(first[1], bgr[:, :, ::-1])
+        else:
+            np.testing.assert_array_equal(first[1], quantize(bgr, step))
+            assert first[1].max() <= 255
+            assert np.all(np.abs(first[1].astype(int) - bgr[:, :, ::-1]) <= step // 2)
+        np.testing.assert_array_equal(second[1], first[1])
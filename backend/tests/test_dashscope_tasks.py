@@ -0,0 +1,188 @@
+import json
+import queue
+from datetime import datetime, timedelta
+
+import pytest
+
+import api
+from dashscope_tracker import DashScopeTaskTracker
+
+
+def make_tracker(check_status=None, max_errors=5):
+    finished = queue.Queue()
+    tracker = DashScopeTaskTracker(
+        check_status or (lambda task_id: api.check_task_status(task_id, "test")),
+        lambda task_id, context, result, error: finished.put((task_id, context, result, error)),
+        min_interval=0.05, max_interval=0.2, max_errors=max_errors, finish_workers=1)
+    return tracker.start(), finished
+
+
+def test_tracker_reports_succeeded_task(dashscope_server):
+    dashscope_server()
+    tracker, finished = make_tracker()
+    task_id = api.generate_image("a flower shop", "test")["output"]["task_id"]
+    tracker.track(task_id, "context")
+    try:
+        tracked_id, context, result, error = finished.get(timeout=10)
+    finally:
+        tracker.stop()
+    assert (tracked_id, context, error) == (task_id, "context", None)
+    assert result["output"]["task_status"] == "SUCCEEDED"
+    assert result["output"]["results"][0]["url"]
+    assert tracker.pending == 0
+
+
+def test_tracker_reports_failed_task(dashscope_server):
+    dashscope_server()
+    tracker, finished = make_tracker()
+    task_id = api.generate_image("please fail", "test")["output"]["task_id"]
+    tracker.track(task_id)
+    try:
+        _, _, result, error = finished.get(timeout=10)
+    finally:
+        tracker.stop()
+    assert error is None
+    assert result["output"]["task_status"] == "FAILED"
+
+
+def test_flaky_status_queries_are_retried(dashscope_server):
+    # 每两次状态查询有一次返回 503，由 HTTP 客户端的重试吸收，任务照常完成
+    dashscope_server(flaky=2)
+    tracker, finished = make_tracker(max_errors=1)
+    task_id = api.generate_image("a flower shop", "test")["output"]["task_id"]
+    tracker.track(task_id)
+    try:
+        _, _, result, error = finished.get(timeout=30)
+    finally:
+        tracker.stop()
+    assert error is None
+    assert result["output"]["task_status"] == "SUCCEEDED"
+
+
+def test_tracker_gives_up_after_max_errors():
+    calls = []
+
+    def check_status(task_id):
+        calls.append(task_id)
+        raise ConnectionError("DashScope unreachable")
+
+    tracker, finished = make_tracker(check_status, max_errors=3)
+    tracker.track("task-1")
+    try:
+        task_id, _, result, error = finished.get(timeout=10)
+    finally:
+        tracker.stop()
+    assert task_id == "task-1"
+    assert result is None
+    assert "DashScope unreachable" in error
+    assert len(calls) == 3
+
+
+def test_tracker_calls_maintain_periodically():
+    calls = queue.Queue()
+    tracker = DashScopeTaskTracker(lambda task_id: None, lambda *args: None,
+                                   maintain=lambda: calls.put(1), maintain_interval=0.05).start()
+    try:
+        for _ in range(3):
+            calls.get(timeout=5)
+    finally:
+        tracker.stop()
+
+
+@pytest.fixture
+def client(dashscope_server, app_client):
+    dashscope_server()
+    app_client.appmod.text_to_image_tracker.min_interval = 0.05
+    app_client.appmod.text_to_image_tracker.max_interval = 0.2
+    return app_client
+
+
+def read_events(response):
+    events = []
+    for chunk in response.response:
+        for line in chunk.decode("utf-8").splitlines():
+            if line.startswith("data: "):
+                events.append(line[len("data: "):])
+    return events
+
+
+def test_generate_image_from_text_succeeds(client):
+    response = client.post("/generate_image_from_text", json={"prompt": "a flower shop"})
+    assert response.status_code == 202
+    task = response.get_json()["task"]
+    assert task["status"] == "pending"
+
+    events = [json.loads(event) for event in read_events(client.get(f"/text_to_image_tasks/{task['task_id']}/events"))]
+    assert events[0]["status"] in ("pending", "running")
+    assert events[-1]["status"] == "succeeded"
+
+    status = client.get(f"/text_to_image_tasks/{task['task_id']}").get_json()
+    assert status["status"] == "succeeded"
+    key = status["generated_image_oss_url"].split("/", 3)[3]
+    assert client.appmod.bucket.objects[key].startswith(b"\xff\xd8")
+    logs = client.get("/text_to_image_logs").get_json()["data"]
+    assert [log["id"] for log in logs] == [status["generation_id"]]
+
+
+def test_generate_image_from_text_fails(client):
+    response = client.post("/generate_image_from_text", json={"prompt": "please fail"})
+    task_id = response.get_json()["task"]["task_id"]
+    events = [json.loads(event) for event in read_events(client.get(f"/text_to_image_tasks/{task_id}/events"))]
+    assert events[-1]["status"] == "failed"
+    assert "FAILED" in events[-1]["error_message"]
+    assert client.get("/text_to_image_logs").get_json()["data"] == []
+    assert client.appmod.bucket.objects == {}
+
+
+def test_text_to_image_task_is_private(client):
+    response = client.post("/generate_image_from_text", json={"prompt": "a flower shop"})
+    task_id = response.get_json()["task"]["task_id"]
+    client.post("/register", json={"username": "other", "password": "p"})
+    client.post("/login", json={"username": "other", "password": "p"})
+    assert client.get(f"/text_to_image_tasks/{task_id}").status_code == 404
+    assert client.get(f"/text_to_image_tasks/{task_id}/events").status_code == 404
+
+
+def test_interrupted_save_is_recovered(client):
+    # 模拟领取任务后在下载或上传期间退出的进程: 任务停留在 saving，领取时间早于超时
+    appmod = client.appmod
+    dashscope_task_id = api.generate_image("a flower shop", "test")["output"]["task_id"]
+    with appmod.app.app_context():
+        task = appmod.TextToImageTask(
+            user_id=appmod.User.query.filter_by(username="u").one().id,
+            prompt="a flower shop",
+            dashscope_task_id=dashscope_task_id,
+            status="saving",
+            claimed_at=datetime.now() - timedelta(seconds=appmod.TEXT_TO_IMAGE_SAVE_TIMEOUT_SECONDS + 60)
+        )
+        appmod.db.session.add(task)
+        appmod.db.session.commit()
+        task_id = task.id
+
+    appmod._recover_stale_text_to_image_tasks()
+
+    events = [json.loads(event) for event in read_events(client.get(f"/text_to_image_tasks/{task_id}/events"))]
+    assert events[0]["status"] in ("running", "saving", "succeeded")
+    assert events[-1]["status"] == "succeeded"
+    logs = client.get("/text_to_image_logs").get_json()["data"]
+    assert [log["id"] for log in logs] == [events[-1]["generation_id"]]
+
+
+def test_recent_save_is_not_recovered(client):
+    appmod = client.appmod
+    with appmod.app.app_context():
+        task = appmod.TextToImageTask(
+            user_id=appmod.User.query.filter_by(username="u").one().id,
+            prompt="a flower shop",
+            dashscope_task_id="in-progress",
+            status="saving",
+            claimed_at=datetime.now()
+        )
+        appmod.db.session.add(task)
+        appmod.db.session.commit()
+        task_id = task.id
+
+    appmod._recover_stale_text_to_image_tasks()
+
+    assert client.get(f"/text_to_image_tasks/{task_id}").get_json()["status"] == "saving"
+    assert not appmod.text_to_image_tracker.is_tracking("in-progress")
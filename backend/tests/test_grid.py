@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from grid import cell_means, char_index_grid, intensity_to_indices
+
+
+# 原先逐格循环的写法，作为对照
+def naive_cell_means(image, num_rows, num_cols, cell_height, cell_width):
+    height, width = image.shape[:2]
+    means = np.zeros((num_rows, num_cols) + image.shape[2:])
+    for i in range(num_rows):
+        for j in range(num_cols):
+            cell = image[int(i * cell_height):min(int((i + 1) * cell_height), height),
+                         int(j * cell_width):min(int((j + 1) * cell_width), width)]
+            if cell.size:
+                means[i, j] = np.mean(cell, axis=(0, 1), dtype=np.float64)
+    return means
+
+
+def naive_char_index(mean, num_chars):
+    return min(int(mean * num_chars / 255), num_chars - 1)
+
+
+# 非整数的格子尺寸 (例如 101 像素分成 7 列)，以及会产生空格子的尺寸
+GRIDS = [
+    (37, 101, 5, 7),
+    (64, 64, 9, 13),
+    (50, 30, 4, 30),
+]
+
+
+@pytest.mark.parametrize("height, width, num_rows, num_cols", GRIDS)
+@pytest.mark.parametrize("channels", [None, 3])
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_cell_means_matches_naive_mean(height, width, num_rows, num_cols, channels, dtype):
+    rng = np.random.default_rng(height * width)
+    shape = (height, width) if channels is None else (height, width, channels)
+    image = rng.integers(0, 256, size=shape).astype(dtype)
+    if dtype != np.uint8:
+        # 浮点图像带小数部分
+        image += rng.random(shape).astype(dtype)
+    cell_height, cell_width = height / num_rows, width / num_cols
+
+    means = cell_means(image, num_rows, num_cols, cell_height, cell_width)
+    np.testing.assert_allclose(means, naive_cell_means(image, num_rows, num_cols, cell_height, cell_width),
+                               rtol=1e-12, atol=1e-9)
+
+
+def test_cell_means_leaves_empty_cells_at_zero():
+    # 格子比像素多时一部分格子没有像素
+    image = np.full((3, 4), 200, dtype=np.uint8)
+    means = cell_means(image, 2, 8, 1.5, 0.5)
+    np.testing.assert_array_equal(means, naive_cell_means(image, 2, 8, 1.5, 0.5))
+    assert (means == 0).any()
+
+
+@pytest.mark.parametrize("channels", [None, 3])
+def test_row_bands_match_whole_grid(channels):
+    rng = np.random.default_rng(1)
+    height, width, num_rows, num_cols = 83, 59, 11, 8
+    shape = (height, width) if channels is None else (height, width, channels)
+    image = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    cell_height, cell_width = height / num_rows, width / num_cols
+
+    whole = cell_means(image, num_rows, num_cols, cell_height, cell_width)
+    bands = [cell_means(image, num_rows, num_cols, cell_height, cell_width, start, min(start + 3, num_rows))
+             for start in range(0, num_rows, 3)]
+    np.testing.assert_array_equal(np.concatenate(bands), whole)
+
+    indices = char_index_grid(image, num_rows, num_cols, cell_height, cell_width, 10)
+    band = char_index_grid(image, num_rows, num_cols, cell_height, cell_width, 10, row_start=4, row_stop=7)
+    np.testing.assert_array_equal(band, indices[4:7])
+
+
+@pytest.mark.parametrize("num_chars", [2, 10, 70, 256])
+def test_intensity_to_indices_at_bucket_edges(num_chars):
+    edges = np.arange(num_chars + 1) * 255 / num_chars
+    values = np.concatenate([
+        [0.0, 255.0, 254.999, 1e-9],
+        edges,
+        np.nextafter(edges, -np.inf),
+        np.nextafter(edges, np.inf),
+    ])
+    values = np.clip(values, 0, 255)
+
+    indices = intensity_to_indices(values, num_chars)
+    assert indices.dtype == np.intp
+    assert indices[0] == 0
+    assert indices[1] == num_chars - 1
+    np.testing.assert_array_equal(indices, [naive_char_index(value, num_chars) for value in values])
+
+
+def test_intensity_to_indices_does_not_round_means():
+    # 平均值 25.4 和 25.6 分别落在 10 个字符的第 0 档和第 1 档 (边界为 25.5)，先取整会把二者都归到同一档
+    indices = intensity_to_indices(np.array([[25.4, 25.6], [127.4, 127.6]]), 10)
+    np.testing.assert_array_equal(indices, [[0, 1], [4, 5]])
+
+
+def test_char_index_grid_matches_naive_loop():
+    rng = np.random.default_rng(2)
+    image = rng.integers(0, 256, size=(45, 77, 3), dtype=np.uint8)
+    num_rows, num_cols, num_chars = 6, 11, 70
+    cell_height, cell_width = 45 / num_rows, 77 / num_cols
+
+    indices = char_index_grid(image, num_rows, num_cols, cell_height, cell_width, num_chars)
+    means = naive_cell_means(image, num_rows, num_cols, cell_height, cell_width).mean(axis=2)
+    expected = [[naive_char_index(mean, num_chars) for mean in row] for row in means]
+    np.testing.assert_array_equal(indices, expected)
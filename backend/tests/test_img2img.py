@@ -0,0 +1,81 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import img2img
+from img2img import ImageTooLargeError, decode_image_for_grid, plan_image_decode
+
+
+def encode(extension, width, height):
+    image = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    return cv2.imencode(extension, image)[1].tobytes()
+
+
+@pytest.fixture(scope="module")
+def poster_jpeg():
+    return encode(".jpg", 4000, 3000)
+
+
+def test_jpeg_is_reduced_for_grid_resolution(poster_jpeg):
+    # 100 列只需 400 像素宽，可以按 1/8 解码
+    assert plan_image_decode(poster_jpeg, 100, max_pixels=50_000_000) == (8, 4000, 3000)
+    # 999 列需要接近原尺寸，像素上限内按原尺寸解码
+    assert plan_image_decode(poster_jpeg, 999, max_pixels=50_000_000) == (1, 4000, 3000)
+
+
+def test_jpeg_over_budget_is_reduced_further(poster_jpeg):
+    assert plan_image_decode(poster_jpeg, 999, max_pixels=1_000_000) == (4, 4000, 3000)
+    image, width, height = decode_image_for_grid(poster_jpeg, 999, max_pixels=1_000_000)
+    assert image.shape == (750, 1000)
+    assert image.size <= 1_000_000
+    assert (width, height) == (4000, 3000)
+
+
+def test_jpeg_over_budget_at_smallest_scale_is_rejected(poster_jpeg):
+    with pytest.raises(ImageTooLargeError):
+        plan_image_decode(poster_jpeg, 100, max_pixels=100_000)
+    with pytest.raises(ImageTooLargeError):
+        decode_image_for_grid(poster_jpeg, 100, max_pixels=100_000)
+
+
+def test_other_formats_are_limited_by_full_size():
+    # PNG 不能在解码时缩小，按原尺寸计算
+    png = encode(".png", 4000, 3000)
+    assert plan_image_decode(png, 100, max_pixels=12_000_000)[0] == 8
+    with pytest.raises(ImageTooLargeError):
+        decode_image_for_grid(png, 100, max_pixels=11_999_999)
+
+
+def test_decompression_bomb_is_rejected(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1_000)
+    with pytest.raises(ImageTooLargeError):
+        plan_image_decode(encode(".png", 100, 100), 10)
+
+
+def test_tiled_conversion_respects_budget(poster_jpeg, monkeypatch):
+    monkeypatch.setattr(img2img, "MAX_DECODE_PIXELS", 1_000_000)
+    options = {"language": "english", "num_cols": 999}
+    output = io.BytesIO()
+    size = img2img.convert_image_to_ascii_art_tiled(io.BytesIO(poster_jpeg), output, options)
+    assert size is not None
+    assert Image.open(io.BytesIO(output.getvalue())).size == size
+
+    monkeypatch.setattr(img2img, "MAX_DECODE_PIXELS", 100_000)
+    with pytest.raises(ImageTooLargeError):
+        img2img.convert_image_to_ascii_art_tiled(io.BytesIO(poster_jpeg), io.BytesIO(), options)
+    assert img2img.convert_image_to_output_bytes(poster_jpeg, options) is None
+
+
+def test_oversized_upload_is_rejected_with_413(app_client, monkeypatch):
+    appmod = app_client.appmod
+    monkeypatch.setattr(img2img, "MAX_DECODE_PIXELS", 1_000_000)
+    monkeypatch.setitem(appmod.DEFAULT_ASCII_OPTIONS, "language", "english")
+    response = app_client.post("/log_image_process", data={
+        "file": (io.BytesIO(encode(".png", 2000, 1000)), "poster.png", "image/png"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 413
+    # 在上传原图之前拒绝
+    assert appmod.bucket.objects == {}
@@ -0,0 +1,110 @@
+import io
+
+import cv2
+import numpy as np
+
+from result_cache import ResultCache, content_hash, original_cache_key, result_cache_key
+
+OPTIONS = {"language": "english", "mode": "Complex", "num_cols": 100, "background": "black"}
+
+
+class DictTier:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class BrokenTier:
+    def get(self, key):
+        raise ConnectionError("shared cache unavailable")
+
+    def set(self, key, value):
+        raise ConnectionError("shared cache unavailable")
+
+
+def test_keys_are_scoped_per_user():
+    digest = content_hash(b"same image bytes")
+    assert result_cache_key(1, digest, OPTIONS) != result_cache_key(2, digest, OPTIONS)
+    assert original_cache_key(1, digest) != original_cache_key(2, digest)
+    assert result_cache_key(1, digest, OPTIONS) == result_cache_key(1, digest, dict(OPTIONS))
+
+
+def test_equivalent_options_share_a_key():
+    digest = content_hash(b"image")
+    reordered = {"background": "BLACK", "num_cols": 100, "mode": "complex", "language": "English"}
+    assert result_cache_key(1, digest, OPTIONS) == result_cache_key(1, digest, reordered)
+    assert result_cache_key(1, digest, OPTIONS) != result_cache_key(1, digest, dict(OPTIONS, num_cols=120))
+    assert result_cache_key(1, digest, OPTIONS) != result_cache_key(1, content_hash(b"other image"), OPTIONS)
+
+
+def test_local_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.get("c") == {"v": 3}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert (stats["local_hits"], stats["shared_hits"], stats["misses"]) == (3, 0, 1)
+
+
+def test_shared_tier_hits_and_misses_are_counted():
+    shared = DictTier()
+    writer = ResultCache(shared=shared)
+    writer.set("key", {"v": 1})
+
+    # 另一个进程的本地层为空，从共享层读取后放入本地层
+    reader = ResultCache(shared=shared)
+    assert reader.get("key") == {"v": 1}
+    assert reader.get("key") == {"v": 1}
+    assert reader.get("missing") is None
+    assert reader.get("missing", record=False) is None
+    stats = reader.stats()
+    assert (stats["local_hits"], stats["shared_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["lookups"] == 3
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_failing_shared_tier_is_a_miss():
+    cache = ResultCache(shared=BrokenTier())
+    cache.set("key", {"v": 1})
+    assert cache.get("key") == {"v": 1}
+    assert cache.get("other") is None
+    stats = cache.stats()
+    assert (stats["local_hits"], stats["shared_hits"], stats["misses"]) == (1, 0, 1)
+
+
+def upload(client, image_bytes):
+    return client.post("/log_image_process", data={
+        "file": (io.BytesIO(image_bytes), "same.png", "image/png"),
+        "ascii_num_cols": "40",
+    }, content_type="multipart/form-data")
+
+
+def test_identical_uploads_are_not_shared_between_users(app_client, monkeypatch):
+    appmod = app_client.appmod
+    monkeypatch.setitem(appmod.DEFAULT_ASCII_OPTIONS, "language", "english")
+    image = np.tile(np.linspace(0, 255, 64, dtype=np.uint8), (48, 1))
+    image_bytes = cv2.imencode(".png", image)[1].tobytes()
+
+    first = upload(app_client, image_bytes).get_json()
+    again = upload(app_client, image_bytes).get_json()
+    assert first["cached"] is False
+    assert again["cached"] is True
+    assert again["processed_image_url"] == first["processed_image_url"]
+
+    app_client.post("/register", json={"username": "other", "password": "p"})
+    app_client.post("/login", json={"username": "other", "password": "p"})
+    other = upload(app_client, image_bytes).get_json()
+    assert other["cached"] is False
+    assert "/user_2/" in other["original_image_url"]
+    assert "/user_2/" in other["processed_image_url"]
@@ -0,0 +1,75 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+
+import video_jobs
+
+
+def lock_from_other_process(job_dir):
+    # 单独打开的文件描述符上的 flock 与 VideoJobLock 互斥，效果等同于另一个进程持有锁
+    handle = open(os.path.join(job_dir, video_jobs.LOCK_FILENAME), "a")
+    fcntl.flock(handle, fcntl.LOCK_EX)
+    return handle
+
+
+def is_locked(job_dir):
+    with open(os.path.join(job_dir, video_jobs.LOCK_FILENAME), "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        return False
+
+
+def test_waiter_relocks_when_directory_is_removed(tmp_path):
+    job_dir = str(tmp_path / "job")
+    os.makedirs(job_dir)
+    other = lock_from_other_process(job_dir)
+    opened = []
+    waiter = threading.Thread(target=lambda: opened.append(video_jobs.open_video_job("job", root=str(tmp_path))))
+    waiter.start()
+    time.sleep(0.2)
+    assert not opened
+
+    # 持有锁的一方删除工作目录后释放锁，等待者不能停留在已删除的锁文件上
+    shutil.rmtree(job_dir)
+    other.close()
+    waiter.join(5)
+    assert opened
+    opened_dir, lock = opened[0]
+    assert opened_dir == job_dir
+    assert is_locked(job_dir)
+    lock.release()
+    assert not is_locked(job_dir)
+    assert video_jobs._local_locks == {}
+
+
+def test_thread_locks_are_dropped_after_use(tmp_path):
+    job_dir, lock = video_jobs.open_video_job("job", root=str(tmp_path))
+    acquired = []
+
+    def wait_for_lock():
+        other = video_jobs.VideoJobLock(job_dir)
+        other.acquire()
+        acquired.append(True)
+        other.release()
+
+    waiter = threading.Thread(target=wait_for_lock)
+    waiter.start()
+    time.sleep(0.2)
+    assert video_jobs._local_locks[job_dir][1] == 2
+    assert video_jobs.VideoJobLock(job_dir).acquire(blocking=False) is False
+
+    video_jobs.remove_video_job(job_dir)
+    lock.release()
+    waiter.join(5)
+    assert acquired
+    assert video_jobs._local_locks == {}
+
+    for i in range(5):
+        video_jobs.open_video_job(f"old-{i}", root=str(tmp_path))[1].release()
+    assert video_jobs.collect_video_jobs(root=str(tmp_path), max_age_hours=-1) >= 5
+    assert video_jobs._local_locks == {}
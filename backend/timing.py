@@ -0,0 +1,122 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+# ASCII_TIMING=1 时才记录各阶段耗时，关闭时 stage() 直接返回空的上下文管理器，几乎没有额外开销
+TIMING_ENABLED = os.environ.get("ASCII_TIMING", "0") == "1"
+
+# 直方图的桶上界 (毫秒)，最后一个桶收集所有更大的值
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, float("inf"))
+
+_NULL_STAGE = contextlib.nullcontext()
+_current_timings = contextvars.ContextVar("current_timings", default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def set_timing_enabled(enabled):
+    global TIMING_ENABLED
+    TIMING_ENABLED = bool(enabled)
+
+
+# 开始收集当前请求 (当前线程/上下文) 的各阶段耗时，返回用于 finish_request_timing 的令牌
+def start_request_timing():
+    if not TIMING_ENABLED:
+        return None
+    return _current_timings.set([])
+
+
+# 结束收集，返回 [(阶段名, 毫秒)]，按阶段开始的顺序排列
+def finish_request_timing(token):
+    if token is None:
+        return []
+    timings = _current_timings.get() or []
+    _current_timings.reset(token)
+    return timings
+
+
+def record_stage(name, elapsed_ms):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.append((name, elapsed_ms))
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {"counts": [0] * len(HISTOGRAM_BUCKETS_MS), "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                histogram["counts"][i] += 1
+                break
+        histogram["count"] += 1
+        histogram["total_ms"] += elapsed_ms
+        histogram["max_ms"] = max(histogram["max_ms"], elapsed_ms)
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, (time.perf_counter() - start) * 1000.0)
+
+
+# 用法: with stage("decode"): ...
+def stage(name):
+    if not TIMING_ENABLED:
+        return _NULL_STAGE
+    return _timed_stage(name)
+
+
+# 逐次累加的计时器，用于循环内反复进入的阶段 (如视频逐帧处理)，结束时作为一个阶段记录总耗时
+class StageAccumulator:
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+        self._start = None
+
+    def __enter__(self):
+        if TIMING_ENABLED:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._start is not None:
+            self.elapsed += time.perf_counter() - self._start
+            self._start = None
+        return False
+
+    def record(self):
+        if TIMING_ENABLED:
+            record_stage(self.name, self.elapsed * 1000.0)
+
+
+# Server-Timing 响应头，同名阶段合并
+def server_timing_header(timings):
+    merged = {}
+    for name, elapsed_ms in timings:
+        merged[name] = merged.get(name, 0.0) + elapsed_ms
+    return ", ".join(f"{name};dur={elapsed_ms:.1f}" for name, elapsed_ms in merged.items())
+
+
+# 各阶段耗时直方图的快照
+def histogram_snapshot():
+    bounds = ["+Inf" if bound == float("inf") else bound for bound in HISTOGRAM_BUCKETS_MS]
+    with _histograms_lock:
+        return {
+            name: {
+                "buckets_ms": bounds,
+                "counts": list(histogram["counts"]),
+                "count": histogram["count"],
+                "mean_ms": histogram["total_ms"] / histogram["count"] if histogram["count"] else 0.0,
+                "max_ms": histogram["max_ms"],
+            }
+            for name, histogram in _histograms.items()
+        }
+
+
+def reset_histograms():
+    with _histograms_lock:
+        _histograms.clear()
@@ -1,6 +1,13 @@
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 from PIL import Image, ImageFont, ImageDraw, ImageOps
 
+import alphabets
+from density_tables import density_table_key, load_density_tables
+
 
 def sort_chars(char_list, font, language):
     if language == "chinese":
@@ -18,7 +25,6 @@ def sort_chars(char_list, font, language):
     elif language == "russian":
         left, top, right, bottom = font.getbbox("A")
         char_width, char_height = right - left, bottom - top
-    num_chars = min(len(char_list), 100)
     out_width = char_width * len(char_list)
     out_height = char_height
     out_image = Image.new("L", (out_width, out_height), 255)
@@ -27,6 +33,12 @@ def sort_chars(char_list, font, language):
     cropped_image = ImageOps.invert(out_image).getbbox()
     out_image = out_image.crop(cropped_image)
     brightness = [np.mean(np.array(out_image)[:, 10 * i:10 * (i + 1)]) for i in range(len(char_list))]
+    return select_chars(char_list, brightness)
+
+
+# 按亮度从暗到亮排序，并在整个亮度区间内均匀挑选最多 100 个字符
+def select_chars(char_list, brightness):
+    num_chars = min(len(char_list), 100)
     char_list = list(char_list)
     zipped_lists = zip(brightness, char_list)
     zipped_lists = sorted(zipped_lists)
@@ -46,79 +58,154 @@ def sort_chars(char_list, font, language):
     return result
 
 
-def get_data(language, mode):
-    if language == "general":
-        from alphabets import GENERAL as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "english":
-        from alphabets import ENGLISH as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "german":
-        from alphabets import GERMAN as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "french":
-        from alphabets import FRENCH as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "italian":
-        from alphabets import ITALIAN as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "polish":
-        from alphabets import POLISH as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "portuguese":
-        from alphabets import PORTUGUESE as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "spanish":
-        from alphabets import SPANISH as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "A"
-        scale = 2
-    elif language == "russian":
-        from alphabets import RUSSIAN as character
-        font = ImageFont.truetype("fonts/DejaVuSansMono-Bold.ttf", size=20)
-        sample_character = "Ш"
-        scale = 2
-    elif language == "chinese":
-        from alphabets import CHINESE as character
-        font = ImageFont.truetype("fonts/simsun.ttc", size=10)
-        sample_character = "制"
-        scale = 1
-    elif language == "korean":
-        from alphabets import KOREAN as character
-        font = ImageFont.truetype("fonts/arial-unicode.ttf", size=10)
-        sample_character = "ㅊ"
-        scale = 1
-    elif language == "japanese":
-        from alphabets import JAPANESE as character
-        font = ImageFont.truetype("fonts/arial-unicode.ttf", size=10)
-        sample_character = "お"
-        scale = 1
-    else:
-        print("Invalid language")
-        return None, None, None, None
+# 使用预先计算的墨迹覆盖率排序；亮度按黑字白底计算，与 sort_chars 的度量方向一致
+def sort_chars_by_density(table):
+    brightness = [255.0 * (1.0 - coverage) for coverage in table["coverage"]]
+    return select_chars(table["chars"], brightness)
+
+
+# 各语言对应的字符表、字体文件、默认字号、用于测量尺寸的样例字符以及纵向缩放
+LANGUAGE_CONFIG = {
+    "general": ("GENERAL", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "english": ("ENGLISH", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "german": ("GERMAN", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "french": ("FRENCH", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "italian": ("ITALIAN", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "polish": ("POLISH", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "portuguese": ("PORTUGUESE", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "spanish": ("SPANISH", "DejaVuSansMono-Bold.ttf", 20, "A", 2),
+    "russian": ("RUSSIAN", "DejaVuSansMono-Bold.ttf", 20, "Ш", 2),
+    "chinese": ("CHINESE", "simsun.ttc", 10, "制", 1),
+    "korean": ("KOREAN", "arial-unicode.ttf", 10, "ㅊ", 1),
+    "japanese": ("JAPANESE", "arial-unicode.ttf", 10, "お", 1),
+}
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# 导入时一次性读取全部预先生成的字形密度表
+DENSITY_TABLES = load_density_tables()
+
+# 进程级字符集/字体缓存的容量上限，超过后淘汰最久未使用的条目
+REGISTRY_MAX_ENTRIES = int(os.environ.get("ASCII_REGISTRY_MAX_ENTRIES", 16))
+
+
+# 一个 (language, mode, font_size) 组合的全部预处理结果
+class CharsetEntry:
+    def __init__(self, char_list, font, sample_character, scale):
+        self.char_list = char_list
+        self.font = font
+        self.sample_character = sample_character
+        self.scale = scale
+        self.char_width, self.char_height = self._measure(font, sample_character)
+        self._atlas = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _measure(font, sample_character):
+        # getbbox 返回 (left, top, right, bottom)
+        left, top, right, bottom = font.getbbox(sample_character)
+        char_width, char_height = right - left, bottom - top
+        if char_height <= 0 and hasattr(font, "size"):  # 某些字体getbbox可能返回异常值
+            char_height = font.size
+        if char_width <= 0 and hasattr(font, "size"):
+            char_width = font.size // 2
+        return char_width, char_height
+
+    # 字形图集按需构建，之后所有请求共用
+    @property
+    def atlas(self):
+        if self._atlas is None:
+            with self._lock:
+                if self._atlas is None:
+                    from render import GlyphAtlas
+                    self._atlas = GlyphAtlas(self.char_list, self.font, self.char_width, self.char_height)
+        return self._atlas
+
+
+_registry = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def set_registry_limit(max_entries):
+    global REGISTRY_MAX_ENTRIES
+    with _registry_lock:
+        REGISTRY_MAX_ENTRIES = max(1, int(max_entries))
+        while len(_registry) > REGISTRY_MAX_ENTRIES:
+            _registry.popitem(last=False)
+
+
+def clear_registry():
+    with _registry_lock:
+        _registry.clear()
+
+
+def _build_entry(language, mode, font_size):
+    alphabet_name, font_file, _, sample_character, scale = LANGUAGE_CONFIG[language]
+    character = getattr(alphabets, alphabet_name)
     try:
         if len(character) > 1:
             char_list = character[mode]
         else:
             char_list = character["standard"]
-    except:
+    except KeyError:
         print("Invalid mode for {}".format(language))
-        return None, None, None, None
+        return None
+    font = ImageFont.truetype(os.path.join(FONT_DIR, font_file), size=font_size)
     if language != "general":
-        char_list = sort_chars(char_list, font, language)
+        table = DENSITY_TABLES.get(density_table_key(alphabet_name, mode, font_file, font_size))
+        if table is not None and table["chars"] == char_list:
+            char_list = sort_chars_by_density(table)
+        else:
+            # 没有预先生成的密度表 (或字符表已变更) 时退回运行时测量
+            char_list = sort_chars(char_list, font, language)
+    return CharsetEntry(char_list, font, sample_character, scale)
+
+
+# 获取 (language, mode, font_size) 对应的字符集条目，首次访问时构建，之后直接复用
+def get_charset(language, mode, font_size=None):
+    if language not in LANGUAGE_CONFIG:
+        print("Invalid language")
+        return None
+    if font_size is None:
+        font_size = LANGUAGE_CONFIG[language][2]
+    key = (language, mode, font_size)
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry is not None:
+            _registry.move_to_end(key)
+            return entry
+
+    # 构建过程较慢，不在锁内进行；并发构建同一条目时以先写入者为准
+    entry = _build_entry(language, mode, font_size)
+    if entry is None:
+        return None
+    with _registry_lock:
+        existing = _registry.get(key)
+        if existing is not None:
+            _registry.move_to_end(key)
+            return existing
+        _registry[key] = entry
+        while len(_registry) > REGISTRY_MAX_ENTRIES:
+            _registry.popitem(last=False)
+    return entry
 
-    return char_list, font, sample_character, scale
+
+# 启动时预热常用组合，字体缺失等错误只记录不抛出
+def warm_registry(combinations):
+    warmed = []
+    for combination in combinations:
+        try:
+            entry = get_charset(*combination)
+            if entry is not None:
+                entry.atlas
+                warmed.append(combination)
+        except Exception as e:
+            print(f"预热字符集 {combination} 失败: {e}")
+    return warmed
+
+
+def get_data(language, mode, font_size=None):
+    entry = get_charset(language, mode, font_size)
+    if entry is None:
+        return None, None, None, None
+    return entry.char_list, entry.font, entry.sample_character, entry.scale
@@ -0,0 +1,610 @@
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from PIL import ImageFont
+
+from grid import cell_edges, reduce_cells, intensity_to_indices
+from render import GlyphAtlas
+from timing import stage, StageAccumulator
+from ffmpeg_writer import FfmpegVideoWriter, FfmpegVideoReader, probe_keyframe_times, concat_segments
+from ascii_video_format import AsciiVideoWriter
+from video_jobs import VideoCheckpoint, VIDEO_CHECKPOINT_SECONDS
+
+VIDEO_CHAR_LISTS = {
+    "simple": '@%#*+=-:. ',
+    "complex": "$@B%8&WM#*oahkbdpqwmZO0QLCJUYXzcvunxrjft/\\|()1{}[]?-_+~<>i!lI;:,\"^`'. ",
+}
+VIDEO_FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSansMono-Bold.ttf")
+
+# 输出格式 -> (文件扩展名, Content-Type)
+# mp4 为渲染后编码的 H.264 视频；ascii 为只保存字符与颜色网格的字符视频流 (见 ascii_video_format)，由前端在 canvas 上绘制
+# hls 为播放列表 + 同目录下的 fMP4 分段，分段在编码过程中逐个完成，可以边转换边播放
+VIDEO_OUTPUT_FORMATS = {
+    "mp4": ("mp4", "video/mp4"),
+    "ascii": ("asciiv", "application/octet-stream"),
+    "hls": ("m3u8", "application/vnd.apple.mpegurl"),
+}
+
+# 分段并行转换的进程数，默认等于 CPU 核数；为 1 时始终单进程转换
+VIDEO_WORKERS = int(os.environ.get("ASCII_VIDEO_WORKERS", os.cpu_count() or 1))
+
+# 每段至少包含的帧数，较短的视频不值得启动多个进程
+VIDEO_SEGMENT_MIN_FRAMES = int(os.environ.get("ASCII_VIDEO_SEGMENT_MIN_FRAMES", 300))
+
+# 解码 / 转换 / 编码三个阶段之间队列的长度，同时决定各阶段循环使用的帧缓冲区数量
+# 为 0 时三个阶段在同一线程中依次执行 (单核机器上流水线只会增加线程切换开销，默认不启用)
+VIDEO_PIPELINE_DEPTH = int(os.environ.get("ASCII_VIDEO_PIPELINE_DEPTH", 4 if (os.cpu_count() or 1) > 1 else 0))
+
+# 逐帧增量渲染: 只重新绘制与上一帧相比发生变化的格子，整帧不变时直接复用上一帧的画面
+VIDEO_DELTA_ENABLED = os.environ.get("ASCII_VIDEO_DELTA", "1") == "1"
+
+# 增量渲染的容差 (0-255): 格子平均亮度和各颜色通道的变化都不超过该值时视为未变化，用于过滤压缩噪声造成的轻微抖动
+# 为 0 时输出与逐帧完整渲染完全一致
+VIDEO_DELTA_TOLERANCE = float(os.environ.get("ASCII_VIDEO_DELTA_TOLERANCE", 4))
+
+# 需要重绘的输出块超过格子总数的这一比例时，局部渲染不再比整幅渲染快，改为整幅渲染
+DELTA_FULL_RENDER_RATIO = 0.5
+
+# 解码端预缩放: 每个格子宽度方向保留的像素数 (高度方向为其两倍)，解码进程直接输出缩放到这一分辨率的帧，
+# 格子平均值由缩小后的像素计算；为 0 时按原分辨率解码
+VIDEO_DECODE_CELL_PIXELS = int(os.environ.get("ASCII_VIDEO_DECODE_CELL_PIXELS", 4))
+
+# 原视频缩略图叠加在右下角，与边缘保持的距离 (像素)
+OVERLAY_MARGIN = 5
+
+
+# 根据帧尺寸和列数计算网格，行列数不合理时退回 6x12 像素的格子
+def compute_video_grid(width, height, num_cols):
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid video dimensions: width={width}, height={height}")
+    if num_cols <= 0:
+        raise ValueError(f"Invalid num_cols: {num_cols}")
+    cell_width = width / num_cols
+    cell_height = 2 * cell_width
+    num_rows = int(height / cell_height)
+    if num_cols > width or num_rows > height or num_rows <= 0:
+        print("Too many columns or rows. Using default settings")
+        cell_width = 6
+        cell_height = 12
+        num_cols = int(width / cell_width)
+        num_rows = int(height / cell_height)
+    return num_cols, num_rows, cell_width, cell_height
+
+
+# 视频逐帧转换引擎，灰度与彩色共用同一套流程
+# 网格边界、字形图集和输出缓冲区在构造时一次性准备好，convert_frame 每帧复用同一块输出缓冲区
+# 引擎保存上一帧实际绘制的字符、亮度和颜色网格以及对应的画布，每帧只重新绘制变化的格子 (delta=False 时每帧完整渲染)
+# frame_width / frame_height 为源视频尺寸；引擎实际接收的帧尺寸为 input_width x input_height
+# (prescale 时缩小到网格和缩略图所需的分辨率)，input_gray 为 True 时只需要灰度帧
+class AsciiVideoEngine:
+    def __init__(self, frame_width, frame_height, mode="simple", color=False, background="black",
+                 num_cols=100, scale=1, overlay_ratio=0.2, delta=None, delta_tolerance=None, prescale=None):
+        if not os.path.exists(VIDEO_FONT_PATH):
+            raise FileNotFoundError(f"Font file not found: {VIDEO_FONT_PATH}")
+        self.char_list = VIDEO_CHAR_LISTS["complex" if mode == "complex" else "simple"]
+        self.color = color
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        font = ImageFont.truetype(VIDEO_FONT_PATH, size=int(10 * scale))
+
+        self.num_cols, self.num_rows, cell_width, cell_height = compute_video_grid(frame_width, frame_height, num_cols)
+
+        left, top, right, bottom = font.getbbox("A")
+        char_width, char_height = right - left, bottom - top
+        self.atlas = GlyphAtlas(self.char_list, font, char_width, char_height)
+        self.out_width = char_width * self.num_cols
+        self.out_height = 2 * char_height * self.num_rows
+        if color:
+            self.background = (255, 255, 255) if background == "white" else (0, 0, 0)
+        else:
+            self.background = 255 if background == "white" else 0
+
+        self.frame_buffer = np.empty((self.out_height, self.out_width, 3), dtype=np.uint8)
+        self._coverage = np.empty((self.out_height, self.out_width), dtype=np.uint8)
+
+        self.delta = VIDEO_DELTA_ENABLED if delta is None else delta
+        self.delta_tolerance = VIDEO_DELTA_TOLERANCE if delta_tolerance is None else delta_tolerance
+        # 彩色模式的画布为 BGR 图像，灰度模式直接复用覆盖度缓冲区
+        self._canvas = np.empty_like(self.frame_buffer) if color else self._coverage
+        self._indices = None
+        self._intensity = None
+        self._colors = None
+        # 每帧发生变化的格子比例 (第一帧为 1.0)，以及整帧未变化、直接复用上一帧画面的帧数
+        self.change_ratios = []
+        self.duplicate_frames = 0
+
+        self.overlay_box = None
+        if overlay_ratio and overlay_ratio > 0:
+            overlay_width = max(1, min(int(self.out_width * overlay_ratio), self.out_width - 2 * OVERLAY_MARGIN))
+            overlay_height = max(1, min(int(self.out_height * overlay_ratio), self.out_height - 2 * OVERLAY_MARGIN))
+            x1, y1 = self.out_width - OVERLAY_MARGIN, self.out_height - OVERLAY_MARGIN
+            self.overlay_box = (x1 - overlay_width, y1 - overlay_height, x1, y1)
+            self._overlay = np.empty((overlay_height, overlay_width, 3), dtype=np.uint8)
+
+        # 输入帧只需保证每个格子有足够的采样像素，且不小于缩略图 (避免缩略图被放大)
+        self.input_width, self.input_height = frame_width, frame_height
+        prescale = VIDEO_DECODE_CELL_PIXELS > 0 if prescale is None else prescale
+        target_width = max(self.num_cols * VIDEO_DECODE_CELL_PIXELS,
+                           self.overlay_box[2] - self.overlay_box[0] if self.overlay_box else 0)
+        if prescale and 0 < target_width < frame_width:
+            self.input_width = target_width
+            self.input_height = max(1, round(frame_height * target_width / frame_width))
+        self.input_gray = not color and self.overlay_box is None
+        scale_x = self.input_width / frame_width
+        scale_y = self.input_height / frame_height
+        self.row_edges = cell_edges(self.input_height, cell_height * scale_y, self.num_rows)
+        self.col_edges = cell_edges(self.input_width, cell_width * scale_x, self.num_cols)
+        counts = np.diff(self.row_edges)[:, None] * np.diff(self.col_edges)[None, :]
+        self.counts = np.maximum(counts, 1)
+        self._gray = np.empty((self.input_height, self.input_width), dtype=np.uint8)
+
+    # 每个格子的平均值 (灰度为 (rows, cols)，彩色为 (rows, cols, 3))
+    def _cell_means(self, image):
+        sums, _ = reduce_cells(image, self.row_edges, self.col_edges)
+        if sums.ndim == 3:
+            return sums / self.counts[:, :, None]
+        return sums / self.counts
+
+    # 与上一帧绘制的网格比较，更新发生变化的格子，返回变化格子的布尔矩阵；需要完整渲染时返回 None
+    # 字符下标变化且亮度变化超过容差，或任一颜色通道变化超过容差的格子视为变化；未变化的格子保留上一帧的值，
+    # 因此缓慢的渐变在累计超过容差后仍会被绘制
+    def _update_grid(self, indices, intensity, colors):
+        if not self.delta or self._indices is None:
+            self._indices, self._intensity, self._colors = indices, intensity, colors
+            return None
+        tolerance = self.delta_tolerance
+        changed = (indices != self._indices) & (np.abs(intensity - self._intensity) > tolerance)
+        if colors is not None:
+            changed |= np.abs(colors.astype(np.int16) - self._colors).max(axis=2) > tolerance
+        self._indices[changed] = indices[changed]
+        self._intensity[changed] = intensity[changed]
+        if colors is not None:
+            self._colors[changed] = colors[changed]
+        return changed
+
+    def _render_full(self):
+        if self.color:
+            self.atlas.render_color(self._indices, self._colors, self.background,
+                                    self.out_height, self.out_width, out=self._canvas)
+        else:
+            self.atlas.render_gray(self._indices, self.background, self.out_height, self.out_width,
+                                   out=self._canvas)
+
+    # 只重新绘制受变化格子影响的输出块 (与格子网格对齐的 cell_height x cell_width 小块)，
+    # 块内像素由当前网格重新渲染，与完整渲染的结果一致
+    def _render_changed(self, changed):
+        atlas = self.atlas
+        blocks = atlas.affected_blocks(changed, self.out_height // atlas.cell_height)
+        block_rows, block_cols = np.nonzero(blocks)
+        if len(block_rows) > DELTA_FULL_RENDER_RATIO * changed.size:
+            self._render_full()
+            return
+        if self.color:
+            pixels = atlas.render_color_blocks(self._indices, self._colors, block_rows, block_cols, self.background)
+            canvas_blocks = self._canvas.reshape(blocks.shape[0], atlas.cell_height, blocks.shape[1], atlas.cell_width, 3)
+        else:
+            pixels = atlas.render_gray_blocks(self._indices, block_rows, block_cols, self.background)
+            canvas_blocks = self._canvas.reshape(blocks.shape[0], atlas.cell_height, blocks.shape[1], atlas.cell_width)
+        canvas_blocks[block_rows, :, block_cols] = pixels
+
+    def _fit_input(self, frame):
+        if frame.shape[:2] != (self.input_height, self.input_width):
+            frame = cv2.resize(frame, (self.input_width, self.input_height), interpolation=cv2.INTER_AREA)
+        return frame
+
+    # 只计算一帧 (BGR，input_gray 时也可以是灰度) 的字符与颜色网格，不渲染画面，结果通过 cells() 取得
+    # 返回与上一帧相比变化格子的布尔矩阵，需要完整渲染时返回 None
+    def update_cells(self, frame):
+        frame = self._fit_input(frame)
+        if self.color:
+            avg_colors = self._cell_means(frame)
+            intensity = avg_colors.mean(axis=2)
+            colors = np.clip(avg_colors, 0, 255).astype(np.uint8)
+            # 全黑的格子强制为红色以便观察
+            colors[np.all(avg_colors == 0, axis=2)] = (255, 0, 0)
+        else:
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            intensity = self._cell_means(gray)
+            colors = None
+        char_indices = intensity_to_indices(intensity, len(self.char_list))
+
+        changed = self._update_grid(char_indices, intensity, colors)
+        if changed is None:
+            self.change_ratios.append(1.0)
+        else:
+            change_ratio = float(changed.mean())
+            self.change_ratios.append(change_ratio)
+            if not change_ratio:
+                self.duplicate_frames += 1
+        return changed
+
+    # 当前的字符下标网格与 BGR 颜色网格 (灰度时颜色为 None)，在下一次 update_cells 时被原地更新
+    def cells(self):
+        return self._indices, self._colors
+
+    # 转换一帧 (BGR，input_gray 时也可以是灰度)，结果写入 out (默认为 self.frame_buffer，会在下一次调用时被覆盖) 并返回
+    def convert_frame(self, frame, out=None):
+        out = self.frame_buffer if out is None else out
+        frame = self._fit_input(frame)
+        changed = self.update_cells(frame)
+        if changed is None:
+            self._render_full()
+        elif changed.any():
+            self._render_changed(changed)
+
+        if self.color:
+            np.copyto(out, self._canvas)
+        else:
+            cv2.cvtColor(self._canvas, cv2.COLOR_GRAY2BGR, dst=out)
+
+        if self.overlay_box:
+            x0, y0, x1, y1 = self.overlay_box
+            cv2.resize(frame, (x1 - x0, y1 - y0), dst=self._overlay)
+            out[y0:y1, x0:x1] = self._overlay
+        return out
+
+
+# 单线程版本: 解码、转换、编码依次执行
+def _encode_frames_serial(cap, frame, engine, out, max_frames=None):
+    decode_timer = StageAccumulator("video_decode")
+    convert_timer = StageAccumulator("video_convert")
+    write_timer = StageAccumulator("video_write")
+    frame_count = 0
+    ret = True
+    while ret and (max_frames is None or frame_count < max_frames):
+        frame_count += 1
+        with convert_timer:
+            ascii_frame = engine.convert_frame(frame)
+        with write_timer:
+            out.write(ascii_frame)
+        if max_frames is not None and frame_count >= max_frames:
+            break
+        with decode_timer:
+            ret, frame = cap.read(frame)
+    decode_timer.record()
+    convert_timer.record()
+    write_timer.record()
+    return frame_count
+
+
+# 逐帧转换并写入 out，frame 为已读出的第一帧；max_frames 为 None 时读到视频结尾，返回写入的帧数
+# 解码、转换、编码分别在解码线程、当前线程、编码线程中进行，通过有界队列衔接 (队列满时上游阻塞等待)；
+# cap.read 与管道写入都会释放 GIL，因此解码和编码的耗时可以被转换掩盖
+# 输入帧和输出帧各有一组预先分配的缓冲区在阶段之间循环使用，不做复制
+def _encode_frames(cap, frame, engine, out, max_frames=None, depth=None):
+    depth = VIDEO_PIPELINE_DEPTH if depth is None else depth
+    if depth <= 0:
+        return _encode_frames_serial(cap, frame, engine, out, max_frames)
+    decoded = queue.Queue(maxsize=depth)
+    encoded = queue.Queue(maxsize=depth)
+    free_inputs = queue.Queue()
+    free_outputs = queue.Queue()
+    for _ in range(depth + 1):
+        free_inputs.put(np.empty_like(frame))
+    for _ in range(depth + 2):
+        free_outputs.put(np.empty_like(engine.frame_buffer))
+    stop = threading.Event()
+    errors = []
+
+    decode_timer = StageAccumulator("video_decode")
+    convert_timer = StageAccumulator("video_convert")
+    write_timer = StageAccumulator("video_write")
+
+    def decode():
+        try:
+            current = frame
+            count = 0
+            while current is not None and not stop.is_set():
+                decoded.put(current)
+                count += 1
+                if max_frames is not None and count >= max_frames:
+                    break
+                buffer = free_inputs.get()
+                if buffer is None:
+                    break
+                with decode_timer:
+                    ret, current = cap.read(buffer)
+                if not ret:
+                    current = None
+        except Exception as e:
+            errors.append(e)
+        finally:
+            decoded.put(None)
+
+    def encode():
+        while True:
+            buffer = encoded.get()
+            if buffer is None:
+                break
+            # 编码出错后继续取出并归还缓冲区，避免转换线程阻塞
+            if not errors:
+                try:
+                    with write_timer:
+                        out.write(buffer)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+            free_outputs.put(buffer)
+
+    decode_thread = threading.Thread(target=decode, name="video-decode", daemon=True)
+    encode_thread = threading.Thread(target=encode, name="video-encode", daemon=True)
+    decode_thread.start()
+    encode_thread.start()
+    frame_count = 0
+    try:
+        while not stop.is_set():
+            source = decoded.get()
+            if source is None:
+                break
+            target = free_outputs.get()
+            with convert_timer:
+                engine.convert_frame(source, out=target)
+            free_inputs.put(source)
+            encoded.put(target)
+            frame_count += 1
+    finally:
+        stop.set()
+        # 唤醒可能阻塞在取空闲缓冲区或放入队列上的解码线程
+        free_inputs.put(None)
+        while decode_thread.is_alive():
+            try:
+                decoded.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        encoded.put(None)
+        encode_thread.join()
+
+    if errors:
+        raise errors[0]
+    decode_timer.record()
+    convert_timer.record()
+    write_timer.record()
+    return frame_count
+
+
+# 字符视频流: 逐帧只计算字符与颜色网格并写入 out，不渲染画面也不经过视频编码器，返回写入的帧数
+def _write_cell_frames(cap, frame, engine, out, max_frames=None):
+    decode_timer = StageAccumulator("video_decode")
+    convert_timer = StageAccumulator("video_convert")
+    write_timer = StageAccumulator("video_write")
+    frame_count = 0
+    while True:
+        with convert_timer:
+            engine.update_cells(frame)
+        with write_timer:
+            out.write(*engine.cells())
+        frame_count += 1
+        if max_frames is not None and frame_count >= max_frames:
+            break
+        with decode_timer:
+            ret, frame = cap.read(frame)
+        if not ret:
+            break
+    decode_timer.record()
+    convert_timer.record()
+    write_timer.record()
+    return frame_count
+
+
+# 统计写入帧数的写入器包装: 每写入一帧调用 on_frames(已写入帧数)，用于报告转换进度
+class _CountingWriter:
+    def __init__(self, out, on_frames):
+        self._out = out
+        self._on_frames = on_frames
+        self.frames = 0
+
+    def write(self, *args):
+        self._out.write(*args)
+        self.frames += 1
+        self._on_frames(self.frames)
+
+
+# 汇总各段的转换统计: 帧数、整帧复用的帧数以及每帧变化格子的比例
+def _merge_stats(parts):
+    change_ratios = [ratio for part in parts for ratio in part["change_ratios"]]
+    return {
+        "frames": sum(part["frames"] for part in parts),
+        "duplicate_frames": sum(part["duplicate_frames"] for part in parts),
+        "mean_change_ratio": sum(change_ratios) / len(change_ratios) if change_ratios else 0.0,
+        "change_ratios": change_ratios,
+    }
+
+
+# 单进程转换从 start_time (秒) 开始的 max_frames 帧 (None 时读到结尾)，audio_source 为 None 时输出不含音轨，返回转换统计
+# 由 ffmpeg 解码进程直接输出引擎所需尺寸和像素格式的帧；sample 为 True 时在解码端按 fps 抽帧
+# on_frames 不为 None 时每写入一帧以已写入的帧数调用一次
+def _convert_range(input_path, output_path, source_size, engine_options, fps, codec, start_time=0, max_frames=None,
+                   audio_source=None, sample=False, output_format="mp4", on_frames=None):
+    if output_format == "ascii":
+        # 字符视频流中没有原视频缩略图
+        engine_options = dict(engine_options, overlay_ratio=0)
+    engine = AsciiVideoEngine(*source_size, **engine_options)
+    cap = FfmpegVideoReader(input_path, engine.input_width, engine.input_height, fps=fps if sample else None,
+                            pix_fmt="gray" if engine.input_gray else "bgr24", start_time=start_time,
+                            max_frames=max_frames)
+    out = None
+    try:
+        ret, frame = cap.read()
+        if not ret:
+            raise ValueError(f"Could not read video frames at {start_time:.2f}s: {cap.error_output()}")
+
+        if output_format == "ascii":
+            out = AsciiVideoWriter(output_path, engine.num_cols, engine.num_rows, fps, engine.char_list,
+                                   color=engine.color, background=engine_options.get("background", "black"))
+            frame_count = _write_cell_frames(cap, frame, engine, _CountingWriter(out, on_frames) if on_frames else out,
+                                             max_frames)
+        else:
+            out = FfmpegVideoWriter(output_path, engine.out_width, engine.out_height, fps,
+                                    audio_source=audio_source, codec=codec)
+            if not out.isOpened():
+                raise IOError("Could not start ffmpeg encoder with codec: {}".format(codec))
+            frame_count = _encode_frames(cap, frame, engine, _CountingWriter(out, on_frames) if on_frames else out,
+                                         max_frames)
+
+        # 关闭管道后等待 ffmpeg 完成编码 (字符视频流则写入关键帧索引)
+        with stage("video_finalize"):
+            out.release()
+        out = None
+        return _merge_stats([{"frames": frame_count, "duplicate_frames": engine.duplicate_frames,
+                              "change_ratios": [round(ratio, 4) for ratio in engine.change_ratios]}])
+    finally:
+        cap.release()
+        if out is not None:
+            out.abort()
+
+
+# 源视频中 [start, start + count) 帧对应的 (起始时间, 输出帧数)
+# 起始时间提前半帧，避免时间戳舍入导致丢掉分段的第一帧；抽帧时输出帧数按目标帧率换算
+def _segment_window(start, count, source_fps, fps, sample):
+    start_time = max(0.0, (start - 0.5) / source_fps) if start else 0
+    if count is None:
+        return start_time, None
+    if sample:
+        return start_time, round((start + count) * fps / source_fps) - round(start * fps / source_fps)
+    return start_time, count
+
+
+# 把视频划分为 [(起始帧, 帧数)]，分段边界尽量对齐到关键帧 (定位无需从前一关键帧解码)，最后一段帧数为 None (读到结尾)
+def plan_segments(total_frames, fps, max_segments, keyframe_times=()):
+    num_segments = min(max_segments, total_frames // max(1, VIDEO_SEGMENT_MIN_FRAMES))
+    if num_segments <= 1:
+        return [(0, None)]
+    keyframes = sorted({int(round(t * fps)) for t in keyframe_times if t >= 0})
+    segment_length = total_frames / num_segments
+    starts = [0]
+    for i in range(1, num_segments):
+        target = int(i * segment_length)
+        if keyframes:
+            nearest = min(keyframes, key=lambda k: abs(k - target))
+            if abs(nearest - target) <= segment_length / 4:
+                target = nearest
+        if target - starts[-1] >= VIDEO_SEGMENT_MIN_FRAMES // 2 and total_frames - target >= VIDEO_SEGMENT_MIN_FRAMES // 2:
+            starts.append(target)
+    return [(start, (starts[i + 1] - start) if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+
+# 分段并行: 各进程独立转换并编码各自的分段 (不含音轨)，再以流复制无损拼接并加入源音轨
+# checkpoint 为 VideoCheckpoint 时分段保存在任务目录中，每完成一段记入清单，已完成的分段不再转换
+# on_frames 以已完成的输出帧数调用 (多进程时按分段报告)
+def _convert_segments(input_path, output_path, source_size, segments, engine_options, source_fps, fps, codec, workers,
+                      sample, checkpoint=None, on_frames=None):
+    with tempfile.TemporaryDirectory(prefix="ascii_segments_") as temp_dir:
+        work_dir = checkpoint.job_dir if checkpoint else temp_dir
+        segment_paths = [checkpoint.segment_path(i) if checkpoint else os.path.join(work_dir, f"segment_{i:04d}.mp4")
+                         for i in range(len(segments))]
+        pending = [i for i in range(len(segments)) if not (checkpoint and checkpoint.is_done(i))]
+        if checkpoint and len(pending) < len(segments):
+            print(f"Resuming from checkpoint: {len(segments) - len(pending)} of {len(segments)} segments already converted")
+        stats = {}
+        done_frames = [sum(checkpoint.manifest["completed"][str(i)]["frames"]
+                           for i in range(len(segments)) if i not in pending) if checkpoint else 0]
+        report = on_frames or (lambda frames: None)
+
+        def finished(i, segment_stats):
+            stats[i] = segment_stats
+            if checkpoint:
+                checkpoint.mark_done(i, segment_stats)
+            done_frames[0] += segment_stats["frames"]
+            report(done_frames[0])
+
+        def arguments(i):
+            start, count = segments[i]
+            return (input_path, segment_paths[i], source_size, engine_options, fps, codec,
+                    *_segment_window(start, count, source_fps, fps, sample))
+
+        with stage("video_segments"):
+            if workers > 1 and len(pending) > 1:
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context) as executor:
+                    futures = {executor.submit(_convert_range, *arguments(i), sample=sample): i for i in pending}
+                    for future in as_completed(futures):
+                        finished(futures[future], future.result())
+            else:
+                # 单进程时按顺序在当前进程中转换，省去启动子进程的开销
+                for i in pending:
+                    finished(i, _convert_range(*arguments(i), sample=sample,
+                                               on_frames=lambda frames: report(done_frames[0] + frames)))
+        if checkpoint:
+            stats = _merge_stats(checkpoint.stats())
+        else:
+            stats = _merge_stats([stats[i] for i in range(len(segments))])
+        with stage("video_concat"):
+            concat_segments(segment_paths, output_path, audio_source=input_path, work_dir=work_dir)
+    return stats
+
+
+# 完整的视频转换: 解码 -> 逐帧转换 -> ffmpeg 编码 (复制源音轨)
+# 返回转换统计 {"frames", "duplicate_frames", "mean_change_ratio", "change_ratios"}
+# workers > 1 且视频足够长时按时间分段，在多个进程中并行转换
+# fps 低于源帧率时在解码端抽帧 (时长不变)，被丢弃的帧不做转换
+# output_format 为 VIDEO_OUTPUT_FORMATS 中的格式；字符视频流不含音轨和缩略图，转换很快，始终单进程完成
+# hls 需要按时间顺序逐段产出，同样单进程完成，output_path 为播放列表路径
+# checkpoint_dir 为任务工作目录时 (mp4 输出) 按 VIDEO_CHECKPOINT_SECONDS 分段转换并记录检查点，
+# 进程中断后以同一目录再次调用会跳过已完成的分段
+# progress 不为 None 时以已完成的比例 (0-1) 调用，在编码线程中调用，应当足够快
+def convert_video(input_path, output_path, mode="simple", color=False, background="black", num_cols=100,
+                  scale=1, fps=0, overlay_ratio=0.2, codec="libx264", workers=None, delta=None, delta_tolerance=None,
+                  output_format="mp4", checkpoint_dir=None, progress=None):
+    if output_format not in VIDEO_OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported video output format: {output_format}")
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise IOError("Could not open video file")
+    # 保留源帧率的小数部分 (如 29.97)，否则与复制过来的音轨逐渐不同步
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # 以实际解码出的第一帧为准 (带旋转信息的视频解码后宽高会互换)
+    ret, first_frame = cap.read()
+    cap.release()
+    if not ret:
+        raise ValueError("Could not read frame 0")
+    source_size = (first_frame.shape[1], first_frame.shape[0])
+    sample = 0 < fps < source_fps
+    fps = fps if fps else source_fps
+    expected_frames = max(1, round(total_frames * fps / source_fps) if sample else total_frames)
+    on_frames = (lambda frames: progress(min(1.0, frames / expected_frames))) if progress else None
+
+    engine_options = {"mode": mode, "color": color, "background": background, "num_cols": num_cols,
+                      "scale": scale, "overlay_ratio": overlay_ratio, "delta": delta, "delta_tolerance": delta_tolerance}
+    workers = workers or VIDEO_WORKERS
+    segments = [(0, None)]
+    checkpoint = VideoCheckpoint(checkpoint_dir) if checkpoint_dir and output_format == "mp4" else None
+    if checkpoint and checkpoint.segments:
+        segments = checkpoint.segments
+    elif output_format == "mp4" and total_frames >= 2 * VIDEO_SEGMENT_MIN_FRAMES:
+        num_segments = workers
+        if checkpoint:
+            num_segments = max(workers, int(np.ceil(total_frames / (VIDEO_CHECKPOINT_SECONDS * source_fps))))
+        if num_segments > 1:
+            segments = plan_segments(total_frames, source_fps, num_segments, probe_keyframe_times(input_path))
+        if checkpoint and len(segments) > 1:
+            segments = checkpoint.plan(segments)
+
+    if len(segments) > 1:
+        print(f"Converting {total_frames} frames in {len(segments)} segments with {workers} workers")
+        stats = _convert_segments(input_path, output_path, source_size, segments, engine_options, source_fps, fps,
+                                  codec, workers, sample, checkpoint, on_frames)
+    else:
+        stats = _convert_range(input_path, output_path, source_size, engine_options, fps, codec,
+                               audio_source=input_path, sample=sample, output_format=output_format,
+                               on_frames=on_frames)
+
+    print(f"Video processing complete: {stats['frames']} frames ({stats['duplicate_frames']} unchanged, "
+          f"mean change ratio {stats['mean_change_ratio']:.3f}). Output saved to {output_path}")
+    return stats
+
+
+# 命令行入口共用: opt 为 argparse 解析得到的参数
+def convert_video_from_args(opt, color):
+    return convert_video(opt.input, opt.output, mode=opt.mode, color=color, background=opt.background,
+                         num_cols=opt.num_cols, scale=opt.scale, fps=opt.fps, overlay_ratio=opt.overlay_ratio,
+                         codec=opt.codec, workers=getattr(opt, "workers", None),
+                         delta_tolerance=getattr(opt, "delta_tolerance", None),
+                         output_format=getattr(opt, "output_format", "mp4"),
+                         checkpoint_dir=getattr(opt, "job_dir", None))
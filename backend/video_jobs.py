@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from result_cache import normalize_options
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上没有 fcntl，退化为进程内的锁
+    fcntl = None
+
+# 视频任务工作目录的根目录: 每个任务一个子目录，保存已完成的分段和清单 (manifest.json)
+# 需放在重启后仍然保留的位置，任务中断后用同样的输入和选项重新提交即可从已完成的分段继续
+VIDEO_JOB_ROOT = os.environ.get("ASCII_VIDEO_JOB_DIR", os.path.join(tempfile.gettempdir(), "artiscope_video_jobs"))
+
+# 检查点分段的目标时长 (秒): 中断时最多丢失这么长视频的转换工作
+VIDEO_CHECKPOINT_SECONDS = float(os.environ.get("ASCII_VIDEO_CHECKPOINT_SECONDS", 30))
+
+# 清理被放弃的工作目录: 超过最长保留时间的直接删除，总大小超过上限时从最久未更新的开始删除
+VIDEO_JOB_MAX_AGE_HOURS = float(os.environ.get("ASCII_VIDEO_JOB_MAX_AGE_HOURS", 24))
+VIDEO_JOB_MAX_TOTAL_MB = float(os.environ.get("ASCII_VIDEO_JOB_MAX_TOTAL_MB", 4096))
+
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = ".lock"
+
+# 同一进程内的线程锁 (flock 不区分同一进程的线程): 任务目录 -> [锁, 正在持有或等待的数量]，
+# 数量归零时删除，目录被删除后不会留下条目
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+# 任务 ID: 输入视频内容的哈希 + 规范化选项的哈希，同一视频以同样选项重新提交时得到同一个工作目录
+def video_job_id(input_path, options):
+    digest = hashlib.sha256()
+    with open(input_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    options_digest = hashlib.sha1(normalize_options(options).encode("utf-8")).hexdigest()
+    return f"{digest.hexdigest()[:32]}_{options_digest[:16]}"
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# 分段检查点: 清单中记录分段计划 [(起始帧, 帧数)] 和每个已完成分段的转换统计
+# 分段文件写完后才记为完成，清单先写临时文件再原子替换，进程在任意时刻退出都不会留下损坏的清单
+class VideoCheckpoint:
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        os.makedirs(job_dir, exist_ok=True)
+        self.manifest_path = os.path.join(job_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self.manifest = {"segments": None, "completed": {}, "created_at": time.time()}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable checkpoint manifest {self.manifest_path}: {e}")
+
+    @property
+    def segments(self):
+        segments = self.manifest.get("segments")
+        return [tuple(segment) for segment in segments] if segments else None
+
+    def _save(self):
+        self.manifest["updated_at"] = time.time()
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    # 第一次运行时记录分段计划；恢复时沿用清单中的计划，已完成的分段才能对应得上
+    def plan(self, segments):
+        with self._lock:
+            if self.segments is None:
+                self.manifest["segments"] = [list(segment) for segment in segments]
+                self.manifest["completed"] = {}
+                self._save()
+            return self.segments
+
+    def segment_path(self, index):
+        return os.path.join(self.job_dir, f"segment_{index:04d}.mp4")
+
+    def is_done(self, index):
+        return str(index) in self.manifest["completed"] and os.path.exists(self.segment_path(index))
+
+    def mark_done(self, index, stats):
+        with self._lock:
+            self.manifest["completed"][str(index)] = stats
+            self._save()
+
+    def stats(self):
+        return [self.manifest["completed"][str(i)] for i in range(len(self.segments))]
+
+
+# 任务工作目录的独占锁: 同一任务同时只有一个请求在转换，后来的请求等待前一个结束后直接复用其结果
+# 使用 flock，持有锁的进程崩溃时由系统自动释放，不会留下需要人工清理的锁文件
+class VideoJobLock:
+    def __init__(self, job_dir):
+        self.path = os.path.join(job_dir, LOCK_FILENAME)
+        self.job_dir = job_dir
+        self._file = None
+        self._local = None
+
+    def _enter_local(self):
+        with _local_locks_guard:
+            entry = _local_locks.setdefault(self.job_dir, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def _leave_local(self):
+        with _local_locks_guard:
+            entry = _local_locks[self.job_dir]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _local_locks[self.job_dir]
+
+    def acquire(self, blocking=True):
+        self._local = self._enter_local()
+        if not self._local.acquire(blocking):
+            self._leave_local()
+            return False
+        if fcntl is None:
+            return True
+        try:
+            while True:
+                # 目录可能刚被清理掉
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a")
+                try:
+                    fcntl.flock(self._file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    self._close_file()
+                    self._local.release()
+                    self._leave_local()
+                    return False
+                # 等待期间目录被其他进程清理 (或任务完成后删除) 时，拿到的是已删除的锁文件上的锁，
+                # 新的打开者会创建新的锁文件，需要在新文件上重新加锁
+                if self._is_current_file():
+                    return True
+                self._close_file()
+        except BaseException:
+            self._close_file()
+            self._local.release()
+            self._leave_local()
+            raise
+
+    def _is_current_file(self):
+        try:
+            return os.path.samestat(os.fstat(self._file.fileno()), os.stat(self.path))
+        except FileNotFoundError:
+            return False
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def release(self):
+        self._close_file()
+        self._local.release()
+        self._leave_local()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+# 打开 (或恢复) 任务工作目录，返回 (目录, 锁)，调用方持有锁直到任务结束
+def open_video_job(job_id, root=VIDEO_JOB_ROOT):
+    job_dir = os.path.join(root, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    lock = VideoJobLock(job_dir)
+    lock.acquire()
+    try:
+        # 更新目录时间，避免拿到锁之后被清理
+        os.utime(job_dir)
+    except BaseException:
+        lock.release()
+        raise
+    return job_dir, lock
+
+
+# 任务完成 (结果已上传) 后删除工作目录
+def remove_video_job(job_dir):
+    shutil.rmtree(job_dir, ignore_errors=True)
+
+
+# 清理被放弃的工作目录，正在被其他请求使用 (持有锁) 的目录跳过，返回被删除的目录数
+def collect_video_jobs(root=VIDEO_JOB_ROOT, max_age_hours=VIDEO_JOB_MAX_AGE_HOURS, max_total_mb=VIDEO_JOB_MAX_TOTAL_MB):
+    if not os.path.isdir(root):
+        return 0
+    jobs = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            manifest_path = os.path.join(path, MANIFEST_FILENAME)
+            updated = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else path)
+            jobs.append((updated, path, _directory_size(path)))
+    jobs.sort()
+
+    now = time.time()
+    total = sum(size for _, _, size in jobs)
+    removed = 0
+    for updated, path, size in jobs:
+        expired = now - updated > max_age_hours * 3600
+        if not expired and total <= max_total_mb * 1024 * 1024:
+            continue
+        lock = VideoJobLock(path)
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            lock.release()
+        total -= size
+        removed += 1
+    return removed
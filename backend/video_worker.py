@@ -0,0 +1,33 @@
+"""
+独立的视频处理工作进程: 从 video_process_jobs 表领取 /log_video_process 入队的任务并执行。
+Web 进程设置 ASCII_VIDEO_JOB_WORKERS=0 时只负责入队，转换全部由这里执行；可在多台机器上各运行一个
+(输入目录 ASCII_VIDEO_SPOOL_DIR 需为共享存储)。数据库和 OSS 配置与 app.py 相同。
+
+用法: python video_worker.py [--workers 2]
+"""
+import argparse
+
+from app import app, db, video_job_pool, VIDEO_JOB_WORKERS
+
+
+def get_args():
+    parser = argparse.ArgumentParser("Video job worker")
+    parser.add_argument("--workers", type=int, default=max(1, VIDEO_JOB_WORKERS), help="Number of worker threads")
+    args = parser.parse_args()
+    return args
+
+
+def main(opt):
+    with app.app_context():
+        db.create_all()
+    video_job_pool.start(workers=opt.workers)
+    print(f"Video job worker started with {opt.workers} thread(s)")
+    try:
+        video_job_pool.join()
+    except KeyboardInterrupt:
+        video_job_pool.stop()
+
+
+if __name__ == '__main__':
+    opt = get_args()
+    main(opt)
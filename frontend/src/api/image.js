@@ -15,8 +15,16 @@ export const uploadVideo = (formData) => instance.post('/log_video_process', for
   headers: { 'Content-Type': 'multipart/form-data' },
 });
 
+export const getVideoJob = (jobId) => instance.get(`/video_jobs/${jobId}`);
+
 export const getVideoLogs = (params) => instance.get('/video_process_logs', { params });
 
 export const generateImageFromText = (prompt) => instance.post('/generate_image_from_text', { prompt });
 
+export const getTextToImageTask = (taskId) => instance.get(`/text_to_image_tasks/${taskId}`);
+
+// 文生图任务的 SSE 事件流，每条消息为任务的最新状态
+export const openTextToImageEvents = (taskId) =>
+  new EventSource(`${instance.defaults.baseURL}/text_to_image_tasks/${taskId}/events`, { withCredentials: true });
+
 export const getTextToImageLogs = (params) => instance.get('/text_to_image_logs', { params });
\ No newline at end of file
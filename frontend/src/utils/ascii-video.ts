@@ -0,0 +1,146 @@
+// 字符视频流 (.asciiv) 解码器，格式与后端 backend/ascii_video_format.py 逐字段对应:
+// 文件头 | 帧记录 (类型 u8 + 数据长度 u32 + deflate 数据)... | 关键帧索引
+const MAGIC = 'ASCV';
+const INDEX_MAGIC = 'INDX';
+const VERSION = 1;
+const HEADER_SIZE = 32;
+const FRAME_HEADER_SIZE = 5;
+
+const FRAME_KEY = 0;
+const FRAME_REPEAT = 2;
+
+const FLAG_COLOR = 1;
+const FLAG_WHITE_BACKGROUND = 2;
+
+export interface AsciiVideoHeader {
+    numCols: number;
+    numRows: number;
+    fps: number;
+    frameCount: number;
+    color: boolean;
+    background: 'black' | 'white';
+    chars: string[];
+}
+
+// 一帧的完整网格: chars 为 rows * cols 个字符下标，colors 为 rows * cols * 3 的 RGB (灰度视频为 null)
+export interface AsciiVideoFrame {
+    index: number;
+    chars: Uint8Array;
+    colors: Uint8Array | null;
+}
+
+const readTag = (bytes: Uint8Array, offset: number) => String.fromCharCode(...bytes.subarray(offset, offset + 4));
+
+// 浏览器自带的 DecompressionStream('deflate') 即 zlib 格式，无需额外依赖
+const inflate = async (data: Uint8Array): Promise<Uint8Array> => {
+    const stream = new Blob([data]).stream().pipeThrough(new (globalThis as any).DecompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+};
+
+export class AsciiVideo {
+    header: AsciiVideoHeader;
+    // [帧号, 帧记录偏移]
+    keyframes: [number, number][] = [];
+
+    private bytes: Uint8Array;
+    private view: DataView;
+    private frameOffsets: number[] = [];
+    private current: Uint8Array | null = null;
+    private currentIndex = -1;
+
+    constructor(buffer: ArrayBuffer) {
+        this.bytes = new Uint8Array(buffer);
+        this.view = new DataView(buffer);
+        if (this.bytes.length < HEADER_SIZE || readTag(this.bytes, 0) !== MAGIC) {
+            throw new Error('不是有效的字符视频文件');
+        }
+        const version = this.view.getUint8(4);
+        if (version !== VERSION) {
+            throw new Error(`不支持的字符视频版本: ${version}`);
+        }
+        const flags = this.view.getUint8(5);
+        const indexOffset = Number(this.view.getBigUint64(22, true));
+        const charsetLength = this.view.getUint16(30, true);
+        const charset = new TextDecoder().decode(this.bytes.subarray(HEADER_SIZE, HEADER_SIZE + charsetLength));
+        this.header = {
+            numCols: this.view.getUint16(6, true),
+            numRows: this.view.getUint16(8, true),
+            fps: this.view.getFloat64(10, true),
+            frameCount: this.view.getUint32(18, true),
+            color: (flags & FLAG_COLOR) !== 0,
+            background: flags & FLAG_WHITE_BACKGROUND ? 'white' : 'black',
+            chars: Array.from(charset),
+        };
+
+        if (readTag(this.bytes, indexOffset) !== INDEX_MAGIC) {
+            throw new Error('字符视频缺少索引 (文件未写完整)');
+        }
+        const count = this.view.getUint32(indexOffset + 4, true);
+        for (let i = 0; i < count; i++) {
+            const entry = indexOffset + 8 + i * 12;
+            this.keyframes.push([this.view.getUint32(entry, true), Number(this.view.getBigUint64(entry + 4, true))]);
+        }
+
+        // 只读取各帧记录的头部，得到每一帧的偏移
+        let offset = HEADER_SIZE + charsetLength;
+        while (offset < indexOffset && this.frameOffsets.length < this.header.frameCount) {
+            this.frameOffsets.push(offset);
+            offset += FRAME_HEADER_SIZE + this.view.getUint32(offset + 1, true);
+        }
+    }
+
+    get duration() {
+        return this.header.frameCount / this.header.fps;
+    }
+
+    private async decodeNext() {
+        const index = this.currentIndex + 1;
+        const offset = this.frameOffsets[index];
+        const type = this.view.getUint8(offset);
+        if (type !== FRAME_REPEAT) {
+            const length = this.view.getUint32(offset + 1, true);
+            const payload = await inflate(this.bytes.subarray(offset + FRAME_HEADER_SIZE, offset + FRAME_HEADER_SIZE + length));
+            if (type === FRAME_KEY) {
+                this.current = payload;
+            } else {
+                // 增量帧: 逐字节相加 (Uint8Array 自动按 256 取模)
+                const next = new Uint8Array(this.current);
+                for (let i = 0; i < next.length; i++) {
+                    next[i] += payload[i];
+                }
+                this.current = next;
+            }
+        }
+        this.currentIndex = index;
+    }
+
+    // 解码第 index 帧: 顺序播放时只解码下一帧，跳转时从不晚于目标帧的最近关键帧开始解码
+    async frame(index: number): Promise<AsciiVideoFrame> {
+        index = Math.max(0, Math.min(index, this.frameOffsets.length - 1));
+        if (index < this.currentIndex || this.current === null) {
+            this.currentIndex = -1;
+            this.current = null;
+        }
+        const keyframe = this.keyframes.filter(([number]) => number <= index).pop();
+        if (keyframe && keyframe[0] > this.currentIndex + 1) {
+            this.currentIndex = keyframe[0] - 1;
+        }
+        while (this.currentIndex < index) {
+            await this.decodeNext();
+        }
+        const cells = this.header.numCols * this.header.numRows;
+        return {
+            index,
+            chars: this.current.subarray(0, cells),
+            colors: this.header.color ? this.current.subarray(cells, cells * 4) : null,
+        };
+    }
+}
+
+export const loadAsciiVideo = async (url: string): Promise<AsciiVideo> => {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`下载字符视频失败: ${response.status}`);
+    }
+    return new AsciiVideo(await response.arrayBuffer());
+};
@@ -0,0 +1,111 @@
+// 边转边播的 HLS 播放 (对应 backend/hls_publisher.py 发布的 fMP4 分段播放列表)
+// 浏览器原生支持 HLS (Safari) 时直接播放；否则用 MediaSource 逐段追加，播放列表结束 (#EXT-X-ENDLIST) 前定期刷新
+const PLAYLIST_POLL_MS = 1000;
+
+const MAP_URI = /#EXT-X-MAP:.*URI="([^"]+)"/;
+
+const fetchBuffer = async (url: string): Promise<ArrayBuffer> => {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`下载分段失败: ${response.status}`);
+    }
+    return response.arrayBuffer();
+};
+
+const findBox = (bytes: Uint8Array, type: string) => {
+    const codes = Array.from(type, (char) => char.charCodeAt(0));
+    for (let i = 0; i + 4 <= bytes.length; i++) {
+        if (codes.every((code, k) => bytes[i + k] === code)) {
+            return i;
+        }
+    }
+    return -1;
+};
+
+// 从初始化分段中读取 MediaSource 所需的编码描述: avcC 中的 profile / 兼容标志 / level，有 mp4a 时附加 AAC
+const codecsFromInit = (init: ArrayBuffer) => {
+    const bytes = new Uint8Array(init);
+    const codecs = [];
+    const avcC = findBox(bytes, 'avcC');
+    if (avcC >= 0) {
+        const hex = Array.from(bytes.subarray(avcC + 5, avcC + 8), (value) => value.toString(16).padStart(2, '0')).join('');
+        codecs.push(`avc1.${hex}`);
+    }
+    if (findBox(bytes, 'mp4a') >= 0) {
+        codecs.push('mp4a.40.2');
+    }
+    return `video/mp4; codecs="${codecs.join(',')}"`;
+};
+
+// 把播放列表挂到 video 上，返回停止加载的函数
+export const attachHlsStream = (video: HTMLVideoElement, playlistUrl: string, onError?: (error: Error) => void): (() => void) => {
+    if (video.canPlayType('application/vnd.apple.mpegurl')) {
+        video.src = playlistUrl;
+        return () => video.removeAttribute('src');
+    }
+
+    const mediaSource = new MediaSource();
+    const objectUrl = URL.createObjectURL(mediaSource);
+    const appended = new Set<string>();
+    let sourceBuffer: SourceBuffer | null = null;
+    let stopped = false;
+    let timer = 0;
+
+    const append = (data: ArrayBuffer) =>
+        new Promise<void>((resolve, reject) => {
+            sourceBuffer.addEventListener('updateend', () => resolve(), { once: true });
+            sourceBuffer.addEventListener('error', () => reject(new Error('追加分段失败')), { once: true });
+            sourceBuffer.appendBuffer(data);
+        });
+
+    const poll = async () => {
+        const response = await fetch(playlistUrl, { cache: 'no-store' });
+        if (!response.ok) {
+            throw new Error(`下载播放列表失败: ${response.status}`);
+        }
+        const lines = (await response.text()).split('\n').map((line) => line.trim());
+        const map = lines.map((line) => MAP_URI.exec(line)).find(Boolean);
+        if (map && !sourceBuffer) {
+            const init = await fetchBuffer(new URL(map[1], playlistUrl).toString());
+            sourceBuffer = mediaSource.addSourceBuffer(codecsFromInit(init));
+            await append(init);
+        }
+        if (sourceBuffer) {
+            for (const line of lines.filter((line) => line && !line.startsWith('#'))) {
+                if (stopped) {
+                    return;
+                }
+                if (!appended.has(line)) {
+                    await append(await fetchBuffer(new URL(line, playlistUrl).toString()));
+                    appended.add(line);
+                }
+            }
+        }
+        if (lines.includes('#EXT-X-ENDLIST')) {
+            if (mediaSource.readyState === 'open') {
+                mediaSource.endOfStream();
+            }
+            return;
+        }
+        if (!stopped) {
+            timer = window.setTimeout(run, PLAYLIST_POLL_MS);
+        }
+    };
+
+    const run = () =>
+        poll().catch((error) => {
+            if (!stopped) {
+                onError?.(error);
+            }
+        });
+
+    mediaSource.addEventListener('sourceopen', run, { once: true });
+    video.src = objectUrl;
+
+    return () => {
+        stopped = true;
+        window.clearTimeout(timer);
+        video.removeAttribute('src');
+        URL.revokeObjectURL(objectUrl);
+    };
+};